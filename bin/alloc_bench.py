@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+##############################################################################
+# Copyright (c) 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##############################################################################
+""" Compare ways of taking free devices from the pool concurrently.
+
+    Runs --threads threads each making --claims claims, every claim in its
+    own transaction held open for --hold milliseconds to stand in for the
+    rest of a load balancer create.  First with SELECT ... FOR UPDATE on
+    the first free device (the old way), then with
+    libra.common.api.allocator.claim_device.  Reports how many claims got
+    a device another claim also got, and the claim rate.
+
+    SQLite ignores FOR UPDATE and takes one lock for the whole database, so
+    it shows whether claims are distinct but not how they queue.  Pass
+    --db with a MySQL schema (which is emptied) to compare the rates.
+    claim_device uses SKIP LOCKED where the server has it, so run against
+    MySQL 5.7 and 8.0 to compare the two ways it claims.
+    """
+
+import argparse
+import collections
+import datetime
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from libra.common.api import lbaas
+from libra.common.api.allocator import claim_device
+from libra.common.api.lbaas import Device, loadbalancers_devices
+from libra.common.api.retry import is_retryable
+
+
+def load(engine, devices):
+    now = datetime.datetime(2014, 1, 1)
+    conn = engine.connect()
+    conn.execute(loadbalancers_devices.delete())
+    conn.execute(Device.__table__.delete())
+    conn.execute(Device.__table__.insert(), [{
+        'id': x, 'name': 'lbaas-{0}'.format(x), 'az': x % 3 + 1,
+        'floatingIpAddr': '10.0.0.1', 'publicIpAddr': '10.0.0.1',
+        'status': 'OFFLINE', 'type': 'basename', 'pingCount': 0,
+        'created': now, 'updated': now, 'configVersion': 0
+    } for x in xrange(1, devices + 1)])
+    conn.close()
+
+
+def locked(session):
+    device = session.query(Device).\
+        filter(~Device.id.in_(
+            session.query(loadbalancers_devices.c.device)
+        )).\
+        filter(Device.status == "OFFLINE").\
+        filter(Device.pingCount == 0).\
+        with_lockmode('update').\
+        first()
+    if device is not None:
+        device.status = 'BUILD'
+    return device
+
+
+def claimed(session):
+    return claim_device(session, 'BUILD')
+
+
+def worker(factory, take, claims, hold, got, errors):
+    for x in xrange(claims):
+        while True:
+            session = factory()
+            try:
+                device = take(session)
+                if device is None:
+                    session.rollback()
+                    break
+                device_id = device.id
+                session.flush()
+                time.sleep(hold)
+                session.commit()
+                got.append(device_id)
+                break
+            except Exception as e:
+                session.rollback()
+                if not is_retryable(e) and 'locked' not in str(e):
+                    errors.append(e)
+                    break
+            finally:
+                session.close()
+
+
+def run(name, take, engine, args):
+    load(engine, args.devices)
+    factory = sessionmaker(bind=engine)
+    got = []
+    errors = []
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(factory, take, args.claims, args.hold / 1000.0, got, errors)
+        ) for x in xrange(args.threads)
+    ]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    counts = collections.Counter(got)
+    duplicates = sum(count - 1 for count in counts.values())
+    print '{0:7} {1:5d} claims {2:5d} devices {3:5d} duplicates {4:8.1f} ' \
+          'claims/sec{5}'.format(
+              name, len(got), len(counts), duplicates, len(got) / elapsed,
+              ' ({0} errors, first: {1})'.format(len(errors), errors[0])
+              if errors else ''
+          )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', default=None,
+                        help='SQLAlchemy database URL with the schema, '
+                             'default is a temporary SQLite file')
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--claims', type=int, default=20,
+                        help='claims made by each thread')
+    parser.add_argument('--hold', type=float, default=5.0,
+                        help='milliseconds each claim transaction is held '
+                             'open')
+    args = parser.parse_args()
+
+    if args.db is None:
+        engine = create_engine(
+            'sqlite:////tmp/alloc_bench.db',
+            connect_args={'timeout': 30, 'check_same_thread': False}
+        )
+        lbaas.metadata.create_all(engine)
+    else:
+        engine = create_engine(args.db, pool_size=args.threads)
+
+    run('locked', locked, engine, args)
+    run('claimed', claimed, engine, args)
+
+
+if __name__ == '__main__':
+    main()
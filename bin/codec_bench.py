@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+##############################################################################
+# Copyright (c) 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##############################################################################
+""" Compare the Gearman message codecs.
+
+    Encodes and decodes messages shaped like the ones the API servers and
+    workers exchange, with every codec available on this host, and prints
+    the encoded size and the time for an encode plus a decode.  msgpack is
+    only included if it is installed. """
+
+import argparse
+import timeit
+
+from libra.common import json_gearman
+
+
+def update_message(lbs, nodes):
+    message = {'hpcs_action': 'UPDATE', 'loadBalancers': []}
+    for x in xrange(lbs):
+        message['loadBalancers'].append({
+            'name': 'a-load-balancer-{0}'.format(x),
+            'protocol': 'HTTP',
+            'algorithm': 'ROUND_ROBIN',
+            'port': 80 + x,
+            'nodes': [{
+                'id': 1000 * x + y, 'port': 8080,
+                'address': '10.{0}.{1}.{2}'.format(x, y / 256, y % 256),
+                'weight': 1, 'condition': 'ENABLED', 'backup': 'FALSE'
+            } for y in xrange(nodes)],
+            'monitor': {
+                'type': 'HTTP', 'delay': 30, 'timeout': 30, 'attempts': 2,
+                'path': '/healthcheck'
+            },
+            'options': {
+                'client_timeout': 30000, 'server_timeout': 30000,
+                'connect_timeout': 30000, 'connect_retries': 3
+            }
+        })
+    return message
+
+
+def stats_reply(lbs, nodes):
+    # A STATS reply lists the status of every node
+    return {
+        'hpcs_action': 'STATS', 'hpcs_response': 'PASS',
+        'nodes': [{'id': y, 'status': 'ONLINE'}
+                  for y in xrange(lbs * nodes)]
+    }
+
+
+def metrics_reply(lbs):
+    return {
+        'hpcs_action': 'METRICS', 'hpcs_response': 'PASS',
+        'utc_start': '2014-01-01 00:00:00.000000',
+        'utc_end': '2014-01-01 00:01:00.000000',
+        'loadBalancers': [{'protocol': 'HTTP', 'bytes_out': 123456789 + x}
+                          for x in xrange(lbs)]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    messages = [
+        ('STATS request', {'hpcs_action': 'STATS'}),
+        ('UPDATE 1x10', update_message(1, 10)),
+        ('UPDATE 1x50', update_message(1, 50)),
+        ('UPDATE 5x100', update_message(5, 100)),
+        ('STATS reply 5x100', stats_reply(5, 100)),
+        ('METRICS reply 5', metrics_reply(5))
+    ]
+    encoder = json_gearman.JSONDataEncoder
+
+    print '{0:20} {1:8} {2:>8} {3:>10}'.format(
+        'message', 'codec', 'bytes', 'usec'
+    )
+    for name, message in messages:
+        for codec in json_gearman.codec_names():
+            data = encoder.encode(json_gearman.encode(message, codec))
+
+            def round_trip():
+                encoder.decode(
+                    encoder.encode(json_gearman.encode(message, codec))
+                )
+
+            seconds = timeit.timeit(round_trip, number=args.iterations)
+            print '{0:20} {1:8} {2:8} {3:10.1f}'.format(
+                name, codec, len(data), seconds * 1000000 / args.iterations
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+##############################################################################
+# Copyright (c) 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##############################################################################
+""" Compare the cost of opening a DB session for an API request.
+
+    Times a typical small request (one limits lookup) made the old way, a
+    new sessionmaker and a SELECT 1 for every session, against
+    libra.common.api.lbaas.db_session which reuses one factory and only
+    pings pooled connections that have been idle.  Use --rtt to model the
+    network round trip to a Galera cluster, which is where the extra query
+    costs.  Pass --db to use a real database instead of in-memory SQLite,
+    which must already have the schema.
+    """
+
+import argparse
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from libra.common.api import lbaas
+from libra.common.api.lbaas import Limits, RoutingSession, db_session
+
+
+def legacy():
+    session = sessionmaker(class_=RoutingSession)()
+    session.execute("SELECT 1")
+    return session
+
+
+def request(session):
+    return session.query(Limits.value).\
+        filter(Limits.name == 'maxNodesPerLoadBalancer').scalar()
+
+
+def run(name, requests, counter):
+    counter[0] = 0
+    start = time.time()
+    for x in xrange(requests):
+        if name == 'legacy':
+            session = legacy()
+            request(session)
+            session.close()
+        else:
+            with db_session() as session:
+                request(session)
+    elapsed = time.time() - start
+    print '{0:10} {1:5.2f} queries {2:8.3f} ms per request'.format(
+        name, float(counter[0]) / requests, elapsed * 1000 / requests
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', default='sqlite://',
+                        help='SQLAlchemy database URL with the schema')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--rtt', type=float, default=0.0,
+                        help='milliseconds of simulated DB round trip added '
+                             'to every query, SQLite has none')
+    args = parser.parse_args()
+
+    if args.db == 'sqlite://':
+        # One shared connection, or every checkout gets an empty DB
+        engine = create_engine(args.db, poolclass=StaticPool)
+        lbaas.metadata.create_all(engine)
+    else:
+        engine = create_engine(args.db, pool_size=20)
+    event.listen(engine, 'checkin', lbaas._checkin)
+    event.listen(engine, 'checkout', lbaas._checkout)
+    RoutingSession.engines = {0: engine}
+    RoutingSession.engines_count = 1
+
+    counter = [0]
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+        if args.rtt:
+            time.sleep(args.rtt / 1000)
+
+    run('legacy', args.requests, counter)
+    run('db_session', args.requests, counter)
+
+
+if __name__ == '__main__':
+    main()
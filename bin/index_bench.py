@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+##############################################################################
+# Copyright (c) 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##############################################################################
+""" Time the hot queries with and without the index pack.
+
+    Loads a synthetic fleet, one load balancer per device with --nodes
+    spread over them, runs each query the API servers and schedulers make
+    most against random keys, then adds the indexes with the migration step
+    and runs them again.  Pass --db to use an empty MySQL schema instead of
+    in-memory SQLite, and --explain to print each query's plan.
+    """
+
+import argparse
+import datetime
+import random
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from libra.common.api import lbaas, migrate
+from libra.common.api.lbaas import Device, LoadBalancer, Node, Stats, Vip
+from libra.common.api.lbaas import loadbalancers_devices
+
+
+def load(engine, devices, nodes, periods):
+    now = datetime.datetime(2014, 1, 1)
+    conn = engine.connect()
+    conn.execute(Device.__table__.insert(), [{
+        'id': x, 'name': 'lbaas-{0}'.format(x), 'az': x % 3 + 1,
+        'floatingIpAddr': '10.0.0.1', 'publicIpAddr': '10.0.0.1',
+        'status': 'OFFLINE' if x % 10 == 0 else 'ONLINE', 'type': 'basename',
+        'pingCount': 0, 'created': now, 'updated': now, 'configVersion': 0
+    } for x in xrange(1, devices + 1)])
+    conn.execute(LoadBalancer.__table__.insert(), [{
+        'id': x, 'name': 'lb', 'tenantid': 'tenant-{0}'.format(x % 1000),
+        'protocol': 'HTTP', 'port': 80, 'algorithm': 'ROUND_ROBIN',
+        'status': 'DELETED' if x % 5 == 0 else 'ACTIVE',
+        'created': now, 'updated': now
+    } for x in xrange(1, devices + 1)])
+    conn.execute(loadbalancers_devices.insert(), [{
+        'loadbalancer': x, 'device': x
+    } for x in xrange(1, devices + 1)])
+    conn.execute(Vip.__table__.insert(), [{
+        'id': x, 'ip': x, 'device': x
+    } for x in xrange(1, devices + 1)])
+    conn.execute(Node.__table__.insert(), [{
+        'id': x, 'lbid': x % devices + 1, 'address': '10.1.0.1',
+        'port': 80, 'weight': 1, 'enabled': 1, 'status': 'ONLINE',
+        'backup': 0
+    } for x in xrange(1, nodes + 1)])
+    conn.execute(Stats.__table__.insert(), [{
+        'id': period * devices + x, 'lbid': x,
+        'period_start': now + datetime.timedelta(minutes=5 * period),
+        'period_end': now + datetime.timedelta(minutes=5 * (period + 1)),
+        'bytes_out': 1000, 'status': 'ACTIVE'
+    } for period in xrange(periods) for x in xrange(1, devices + 1)])
+    conn.close()
+
+
+def queries(devices, periods):
+    start = datetime.datetime(2014, 1, 1)
+
+    def device_id():
+        return random.randint(1, devices)
+
+    return [
+        ('devices.status', lambda session: session.query(Device).
+            filter(Device.status == 'OFFLINE').count()),
+        ('devices.name', lambda session: session.query(Device).
+            filter(Device.name == 'lbaas-{0}'.format(device_id())).first()),
+        ('nodes.lbid', lambda session: session.query(Node).
+            filter(Node.lbid == device_id()).all()),
+        ('loadbalancers.tenantid', lambda session: session.
+            query(LoadBalancer.id).
+            filter(LoadBalancer.tenantid ==
+                   'tenant-{0}'.format(device_id() % 1000)).
+            filter(LoadBalancer.status != 'DELETED').all()),
+        ('stats.period_end', lambda session: session.query(Stats.lbid).
+            filter(Stats.period_end > start + datetime.timedelta(
+                minutes=5 * periods)).all()),
+        ('vips.device', lambda session: session.query(Vip.ip).
+            filter(Vip.device == device_id()).first()),
+        ('lb_devices.loadbalancer', lambda session: session.
+            query(loadbalancers_devices.c.device).
+            filter(loadbalancers_devices.c.loadbalancer == device_id()).
+            all()),
+        ('lb_devices.device', lambda session: session.
+            query(loadbalancers_devices.c.loadbalancer).
+            filter(loadbalancers_devices.c.device == device_id()).all())
+    ]
+
+
+# The last statement run, to explain
+last = [None]
+
+
+def capture(conn, cursor, statement, parameters, context, executemany):
+    last[0] = (statement, parameters)
+
+
+def plan(engine, session, name, query):
+    """ Print the plan of one query """
+    query(session)
+    statement, parameters = last[0]
+    if engine.dialect.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    connection = session.connection()
+    for row in connection.execute(prefix + statement, parameters):
+        print '    {0:24} {1}'.format(name, ' '.join(str(x) for x in row))
+
+
+def run(label, engine, session, tests, repeat, show_plan):
+    print label
+    results = {}
+    for name, query in tests:
+        query(session)
+        start = time.time()
+        for x in xrange(repeat):
+            query(session)
+        results[name] = (time.time() - start) * 1000 / repeat
+        print '  {0:24} {1:9.3f} ms'.format(name, results[name])
+        if show_plan:
+            plan(engine, session, name, query)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', default='sqlite://',
+                        help='SQLAlchemy database URL of an empty schema')
+    parser.add_argument('--devices', type=int, default=10000)
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--periods', type=int, default=10,
+                        help='stats rows per load balancer')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--explain', action='store_true',
+                        help='print the plan of each query')
+    args = parser.parse_args()
+
+    if args.db == 'sqlite://':
+        engine = create_engine(args.db, poolclass=StaticPool)
+    else:
+        engine = create_engine(args.db)
+    lbaas.metadata.create_all(engine)
+    event.listen(engine, 'before_cursor_execute', capture)
+    for index in migrate.pack_indexes():
+        index.drop(engine)
+
+    start = time.time()
+    load(engine, args.devices, args.nodes, args.periods)
+    print 'Loaded {0} devices, {1} nodes in {2:.1f}s'.format(
+        args.devices, args.nodes, time.time() - start
+    )
+
+    session = sessionmaker(bind=engine)()
+    tests = queries(args.devices, args.periods)
+    before = run('Without index pack', engine, session, tests, args.repeat,
+                 args.explain)
+    session.commit()
+
+    start = time.time()
+    conn = engine.connect()
+    migrate._add_indexes(conn)
+    conn.close()
+    print 'Added indexes in {0:.1f}s'.format(time.time() - start)
+
+    after = run('With index pack', engine, session, tests, args.repeat,
+                args.explain)
+    session.close()
+
+    print 'Speed up'
+    for name, query in tests:
+        print '  {0:24} {1:9.1f}x'.format(
+            name, before[name] / max(after[name], 0.001)
+        )
+
+
+if __name__ == '__main__':
+    main()
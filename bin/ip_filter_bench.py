@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+##############################################################################
+# Copyright (c) 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##############################################################################
+""" Time checking node addresses against the ip_filters option.
+
+    Makes --filters /24 filters, half IPv4 and half IPv6 unless --ipv4-only
+    is given, and a batch of --nodes node addresses in the last of them,
+    as for a load balancer create.  Checks the batch --repeat times by
+    parsing every filter for every address (the old way) and with the
+    compiled filter libra.api.library.ip_filter now keeps.
+    """
+
+import argparse
+import time
+
+import ipaddress
+
+from libra.api.library.exp import IPOutOfRange
+from libra.api.library.ip_filter import IPFilter
+
+
+def parse_each_time(addresses, masks):
+    checked = []
+    for address in addresses:
+        address = ipaddress.ip_address(address)
+        for mask in masks:
+            network = ipaddress.ip_network(mask, True)
+            if network.version == address.version and address in network:
+                break
+        else:
+            raise IPOutOfRange(address)
+        checked.append(str(address))
+    return checked
+
+
+def compiled(addresses, masks):
+    # Compiled once at startup, outside the timing
+    return compiled.ip_filter.check_all(addresses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--filters', type=int, default=200)
+    parser.add_argument('--nodes', type=int, default=100,
+                        help='node addresses in a batch')
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--ipv4-only', action='store_true')
+    args = parser.parse_args()
+
+    masks = []
+    for x in xrange(args.filters):
+        if args.ipv4_only or x % 2 == 0:
+            masks.append(u'10.{0}.{1}.0/24'.format(x / 256, x % 256))
+        else:
+            masks.append(u'2001:db8:{0:x}::/48'.format(x))
+    last = ipaddress.ip_network(masks[-1])
+    addresses = [unicode(last.network_address + x + 1)
+                 for x in xrange(args.nodes)]
+
+    start = time.time()
+    compiled.ip_filter = IPFilter(masks)
+    print 'compile {0:17.3f} ms'.format((time.time() - start) * 1000)
+
+    for name, method in (('parse each', parse_each_time),
+                         ('compiled', compiled)):
+        assert method(addresses, masks) == compiled(addresses, masks)
+        start = time.time()
+        for x in xrange(args.repeat):
+            method(addresses, masks)
+        elapsed = (time.time() - start) * 1000 / args.repeat
+        print '{0:10} {1:5d} nodes {2:9.3f} ms per batch'.format(
+            name, len(addresses), elapsed
+        )
+
+
+if __name__ == '__main__':
+    main()
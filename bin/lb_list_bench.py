@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+##############################################################################
+# Copyright (c) 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##############################################################################
+""" Time listing a tenant's load balancers with their node counts.
+
+    Loads --tenants tenants with --lbs load balancers each and --nodes nodes
+    per load balancer, then lists one tenant's load balancers the old way,
+    with a node COUNT(*) per load balancer, and with the grouped join
+    GET /loadbalancers now uses, both all at once and a page of --page.
+    Pass --db to use an empty MySQL schema instead of in-memory SQLite.
+    """
+
+import argparse
+import datetime
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from libra.api.controllers.load_balancers import list_load_balancers
+from libra.common.api import lbaas
+from libra.common.api.lbaas import LoadBalancer, Node
+
+
+def load(engine, tenants, lbs, nodes):
+    now = datetime.datetime(2014, 1, 1)
+    conn = engine.connect()
+    conn.execute(LoadBalancer.__table__.insert(), [{
+        'id': x, 'name': 'lb', 'tenantid': 'tenant-{0}'.format(x % tenants),
+        'protocol': 'HTTP', 'port': 80, 'algorithm': 'ROUND_ROBIN',
+        'status': 'ACTIVE', 'created': now, 'updated': now, 'version': 1
+    } for x in xrange(1, tenants * lbs + 1)])
+    conn.execute(Node.__table__.insert(), [{
+        'id': x, 'lbid': x % (tenants * lbs) + 1, 'address': '10.1.0.1',
+        'port': 80, 'weight': 1, 'enabled': 1, 'status': 'ONLINE',
+        'backup': 0
+    } for x in xrange(1, tenants * lbs * nodes + 1)])
+    conn.close()
+
+
+def per_lb_count(session, tenant_id, page):
+    lbs = session.query(
+        LoadBalancer.name, LoadBalancer.id, LoadBalancer.protocol,
+        LoadBalancer.port, LoadBalancer.algorithm, LoadBalancer.status,
+        LoadBalancer.created, LoadBalancer.updated
+    ).filter(LoadBalancer.tenantid == tenant_id).\
+        filter(LoadBalancer.status != 'DELETED').all()
+    result = []
+    for lb in lbs:
+        lb = lb._asdict()
+        lb['nodeCount'] = session.query(Node).\
+            filter(Node.lbid == lb['id']).count()
+        result.append(lb)
+    return result
+
+
+def grouped(session, tenant_id, page):
+    return list_load_balancers(session, tenant_id, limit=100000)[0]
+
+
+def grouped_page(session, tenant_id, page):
+    return list_load_balancers(session, tenant_id, limit=page)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', default='sqlite://',
+                        help='SQLAlchemy database URL of an empty schema')
+    parser.add_argument('--tenants', type=int, default=10)
+    parser.add_argument('--lbs', type=int, default=1000,
+                        help='load balancers per tenant')
+    parser.add_argument('--nodes', type=int, default=5,
+                        help='nodes per load balancer')
+    parser.add_argument('--page', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.db == 'sqlite://':
+        engine = create_engine(args.db, poolclass=StaticPool)
+    else:
+        engine = create_engine(args.db)
+    lbaas.metadata.create_all(engine)
+    load(engine, args.tenants, args.lbs, args.nodes)
+
+    counter = [0]
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+
+    session = sessionmaker(bind=engine)()
+    for name, method in (('per-lb count', per_lb_count),
+                         ('grouped', grouped),
+                         ('grouped page', grouped_page)):
+        rows = method(session, 'tenant-1', args.page)
+        counter[0] = 0
+        start = time.time()
+        for x in xrange(args.repeat):
+            method(session, 'tenant-1', args.page)
+        elapsed = (time.time() - start) * 1000 / args.repeat
+        print '{0:13} {1:5d} lbs {2:5d} queries {3:9.1f} ms'.format(
+            name, len(rows), counter[0] / args.repeat, elapsed
+        )
+    session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+##############################################################################
+# Copyright (c) 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##############################################################################
+""" Compare the queries needed to build a device UPDATE message.
+
+    Builds an in-memory SQLite DB holding one device with a number of load
+    balancers and nodes, then times building the UPDATE message the old way
+    (a monitor query and a lazy node load per load balancer) against
+    libra.common.api.payload.  Use --rtt to model the network round trip to
+    a Galera cluster, which is where the extra queries cost.  Pass --db to
+    use a real database instead, which must already have the schema and no
+    data (it is left populated).
+    """
+
+import argparse
+import datetime
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from libra.common.api.lbaas import metadata, loadbalancers_devices
+from libra.common.api.lbaas import LoadBalancer, Device, Node, HealthMonitor
+from libra.common.api.payload import device_loadbalancers, build_update
+
+
+def populate(session, lb_count, node_count):
+    # IDs are given explicitly as SQLite will not autoincrement a BIGINT
+    now = datetime.datetime.now()
+    node_id = 0
+    device = Device(
+        id=1, name='bench', floatingIpAddr='10.0.0.1',
+        publicIpAddr='10.0.0.1', az=1, type='HAProxy', status='ONLINE',
+        created=now, updated=now, pingCount=0
+    )
+    session.add(device)
+    session.flush()
+    for x in xrange(lb_count):
+        lb = LoadBalancer(
+            id=x + 1, name='lb{0}'.format(x), tenantid='bench',
+            protocol='HTTP', port=80 + x, algorithm='ROUND_ROBIN',
+            status='ACTIVE', created=now, updated=now
+        )
+        session.add(lb)
+        session.flush()
+        session.execute(loadbalancers_devices.insert().values(
+            loadbalancer=lb.id, device=device.id
+        ))
+        # Leave half without a monitor so the default gets created
+        if x % 2:
+            session.add(HealthMonitor(
+                lbid=lb.id, type='HTTP', delay=30, timeout=30, attempts=2,
+                path='/'
+            ))
+        for y in xrange(node_count):
+            node_id += 1
+            session.add(Node(
+                id=node_id, lbid=lb.id,
+                address='10.1.{0}.{1}'.format(x % 256, y % 256), port=80,
+                status='ONLINE', weight=1, enabled=1, backup=0
+            ))
+    session.commit()
+    return device.id
+
+
+def legacy(session, device_id):
+    lbs = session.query(LoadBalancer).join(LoadBalancer.nodes).\
+        join(LoadBalancer.devices).\
+        filter(Device.id == device_id).\
+        filter(LoadBalancer.status != 'DELETED').\
+        all()
+    nodes = 0
+    for lb in lbs:
+        lb_data = {'name': lb.name, 'nodes': []}
+        for node in lb.nodes:
+            if not node.enabled:
+                continue
+            lb_data['nodes'].append({
+                'id': node.id, 'port': node.port, 'address': node.address,
+                'weight': node.weight, 'condition': 'ENABLED',
+                'backup': 'TRUE' if node.backup else 'FALSE'
+            })
+        monitor = session.query(HealthMonitor).\
+            filter(HealthMonitor.lbid == lb.id).first()
+        if monitor is None:
+            monitor = HealthMonitor(
+                lbid=lb.id, type="CONNECT", delay=30,
+                timeout=30, attempts=2, path=None
+            )
+            session.add(monitor)
+            session.flush()
+        lb_data['monitor'] = {'type': monitor.type, 'delay': monitor.delay}
+        nodes += len(lb_data['nodes'])
+    return nodes
+
+
+def current(session, device_id):
+    lbs = device_loadbalancers(session, device_id)
+    job_data, degraded = build_update(session, lbs)
+    return sum(len(lb['nodes']) for lb in job_data['loadBalancers'])
+
+
+def run(name, func, maker, device_id, iterations, counter):
+    elapsed = 0.0
+    queries = 0
+    for x in xrange(iterations):
+        session = maker()
+        counter[0] = 0
+        start = time.time()
+        nodes = func(session, device_id)
+        elapsed += time.time() - start
+        queries += counter[0]
+        # Throw away default monitors so every run does the same work
+        session.rollback()
+        session.close()
+    print '{0:8} {1:6} nodes {2:6} queries {3:9.2f} ms'.format(
+        name, nodes, queries / iterations, elapsed * 1000 / iterations
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', default='sqlite://',
+                        help='SQLAlchemy database URL of an empty DB')
+    parser.add_argument('--lbs', type=int, default=5,
+                        help='load balancers on the device')
+    parser.add_argument('--nodes', type=int, default=100,
+                        help='nodes per load balancer')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--rtt', type=float, default=0.0,
+                        help='milliseconds of simulated DB round trip added '
+                             'to every query, SQLite has none')
+    args = parser.parse_args()
+
+    engine = create_engine(args.db)
+    if args.db == 'sqlite://':
+        metadata.create_all(engine)
+    maker = sessionmaker(bind=engine)
+    session = maker()
+    device_id = populate(session, args.lbs, args.nodes)
+    session.close()
+
+    counter = [0]
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+        if args.rtt:
+            time.sleep(args.rtt / 1000)
+
+    run('legacy', legacy, maker, device_id, args.iterations, counter)
+    run('payload', current, maker, device_id, args.iterations, counter)
+
+
+if __name__ == '__main__':
+    main()
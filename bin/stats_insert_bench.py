@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+##############################################################################
+# Copyright (c) 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##############################################################################
+""" Compare ways of writing a usage stats cycle to the stats table.
+
+    Writes one row per load balancer, as UsageStats does after a METRICS
+    fan-out, first with an ORM Stats object added to the session for each
+    (the old way) then with libra.common.api.bulk.BulkInsert, each in one
+    transaction.  Use --rtt to model the network round trip to a Galera
+    cluster for every statement.  Pass --db to use a real database instead
+    of in-memory SQLite, which must already have the schema.
+    """
+
+import argparse
+import datetime
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from libra.common.api import lbaas
+from libra.common.api.bulk import BulkInsert
+from libra.common.api.lbaas import Stats
+
+# SQLite only numbers a column it is given as INTEGER PRIMARY KEY, as
+# lbaas.sql has it
+SQLITE_STATS = '''
+CREATE TABLE stats (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lbid BIGINT NOT NULL,
+    period_start DATETIME NOT NULL,
+    period_end DATETIME NOT NULL,
+    bytes_out BIGINT NOT NULL,
+    status VARCHAR(50) NOT NULL
+)
+'''
+
+
+def results(lbs):
+    start = datetime.datetime(2014, 1, 1)
+    end = start + datetime.timedelta(minutes=5)
+    return [(x, start, end, x * 1000, 'ACTIVE') for x in xrange(1, lbs + 1)]
+
+
+def orm(session, rows, chunk_size):
+    for lbid, start, end, bytes_out, status in rows:
+        new_entry = Stats()
+        new_entry.lbid = lbid
+        new_entry.period_start = start
+        new_entry.period_end = end
+        new_entry.bytes_out = bytes_out
+        new_entry.status = status
+        session.add(new_entry)
+    session.commit()
+
+
+def bulk(session, rows, chunk_size):
+    writer = BulkInsert(Stats.__table__, chunk_size)
+    for lbid, start, end, bytes_out, status in rows:
+        writer.add(
+            lbid=lbid, period_start=start, period_end=end,
+            bytes_out=bytes_out, status=status
+        )
+    writer.flush(session)
+    session.commit()
+
+
+def run(name, write, engine, rows, chunk_size, counter):
+    session = sessionmaker(bind=engine)()
+    session.execute(Stats.__table__.delete())
+    session.commit()
+    counter[0] = 0
+    start = time.time()
+    write(session, rows, chunk_size)
+    elapsed = time.time() - start
+    session.close()
+    print '{0:5} {1:7d} statements {2:9.1f} ms {3:10.0f} rows/sec'.format(
+        name, counter[0], elapsed * 1000, len(rows) / elapsed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', default='sqlite://',
+                        help='SQLAlchemy database URL with the schema')
+    parser.add_argument('--lbs', type=int, default=10000)
+    parser.add_argument('--chunk', type=int, default=1000,
+                        help='rows per bulk insert')
+    parser.add_argument('--rtt', type=float, default=0.0,
+                        help='milliseconds of simulated DB round trip added '
+                             'to every statement, SQLite has none')
+    args = parser.parse_args()
+
+    if args.db == 'sqlite://':
+        engine = create_engine(args.db, poolclass=StaticPool)
+        engine.execute(SQLITE_STATS)
+        lbaas.metadata.create_all(engine)
+    else:
+        engine = create_engine(args.db)
+
+    counter = [0]
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+        if args.rtt:
+            time.sleep(args.rtt / 1000)
+
+    rows = results(args.lbs)
+    run('orm', orm, engine, rows, args.chunk, counter)
+    run('bulk', bulk, engine, rows, args.chunk, counter)
+
+
+if __name__ == '__main__':
+    main()
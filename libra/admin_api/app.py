@@ -28,6 +28,7 @@ from eventlet import wsgi
 
 from libra import __version__
 from libra.common.api import server
+from libra.common.api.migrate import SchemaError, check_at_startup
 from libra.admin_api.stats.drivers.base import known_drivers
 from libra.admin_api.stats.ping_sched import PingStats
 from libra.admin_api.stats.offline_sched import OfflineStats
@@ -35,6 +36,8 @@ from libra.admin_api.stats.billing_sched import BillingStats
 from libra.admin_api.stats.stats_sched import UsageStats
 from libra.admin_api.device_pool.manage_pool import Pool
 from libra.admin_api.expunge.expunge import ExpungeScheduler
+from libra.common.api.outbox import OutboxDrainer
+from libra.common.api.query_stats import QueryAccounting
 from libra.admin_api import config as api_config
 from libra.admin_api import model
 from libra.openstack.common import importutils
@@ -70,7 +73,21 @@ def setup_app(pecan_config):
         'keepalive': CONF['gearman']['keepalive'],
         'keepcnt': CONF['gearman']['keepcnt'],
         'keepidle': CONF['gearman']['keepidle'],
-        'keepintvl': CONF['gearman']['keepintvl']
+        'keepintvl': CONF['gearman']['keepintvl'],
+        'pool_size': CONF['gearman']['pool_size'],
+        'pool_idle': CONF['gearman']['pool_idle'],
+        'update_window': CONF['gearman']['update_window'],
+        'dispatch_workers': CONF['gearman']['dispatch_workers'],
+        'dispatch_queue': CONF['gearman']['dispatch_queue'],
+        'outbox_batch': CONF['gearman']['outbox_batch'],
+        'outbox_poll': CONF['gearman']['outbox_poll'],
+        'outbox_timeout': CONF['gearman']['outbox_timeout'],
+        'job_timeout': CONF['gearman']['job_timeout'],
+        'job_timeout_min': CONF['gearman']['job_timeout_min'],
+        'job_retries': CONF['gearman']['job_retries'],
+        'breaker_threshold': CONF['gearman']['breaker_threshold'],
+        'breaker_cooldown': CONF['gearman']['breaker_cooldown'],
+        'codec': CONF['gearman']['codec']
     }
     if CONF['debug']:
         config['wsme'] = {'debug': True}
@@ -90,7 +107,7 @@ def setup_app(pecan_config):
             True)
     )
 
-    return app
+    return QueryAccounting(app)
 
 
 class MaintThreads(object):
@@ -109,6 +126,9 @@ class MaintThreads(object):
         expunge = ExpungeScheduler()
         self.classes.append(expunge)
 
+        outbox = OutboxDrainer()
+        self.classes.append(outbox)
+
         pings = PingStats(self.drivers)
         self.classes.append(pings)
 
@@ -184,6 +204,11 @@ def main():
     # Use the root logger due to lots of services using logger
     LOG.info('Starting on %s:%d', CONF.admin_api.host, CONF.admin_api.port)
     api = setup_app(pc)
+    try:
+        check_at_startup()
+    except SchemaError as e:
+        LOG.critical(str(e))
+        return 1
 
     for driver in CONF['admin_api']['stats_driver']:
         drivers.append(importutils.import_class(known_drivers[driver]))
@@ -0,0 +1,74 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+
+# pecan imports
+from pecan import expose, response
+from pecan.rest import RestController
+from libra.common.api.lbaas import ApiCaches, CacheVersion, db_session
+from libra.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
+
+class CachesController(RestController):
+    @expose('json')
+    def get(self):
+        """
+        Reports the in-memory cache counters last sent by each API server,
+        and whether it has dropped its caches since the last DELETE.
+
+        Url:
+            GET /caches
+        Returns: dict
+        """
+        with db_session(readonly=True) as session:
+            version = session.query(CacheVersion.version).\
+                filter(CacheVersion.id == 1).scalar() or 0
+            servers = [{
+                'name': row.name,
+                'updated': str(row.updated),
+                'current': row.version == version,
+                'caches': json.loads(row.stats)
+            } for row in session.query(ApiCaches).order_by(ApiCaches.name)]
+            session.rollback()
+        response.status = 200
+        return dict(version=version, servers=servers)
+
+    @expose('json')
+    def delete(self):
+        """
+        Has every API server drop its in-memory caches on its next check,
+        within cache_check seconds.
+
+        Url:
+            DELETE /caches
+        Returns: dict
+        """
+        with db_session() as session:
+            updated = session.query(CacheVersion).\
+                filter(CacheVersion.id == 1).\
+                update({CacheVersion.version: CacheVersion.version + 1},
+                       synchronize_session=False)
+            if not updated:
+                session.add(CacheVersion(id=1, version=1))
+            session.commit()
+            version = session.query(CacheVersion.version).\
+                filter(CacheVersion.id == 1).scalar()
+            session.commit()
+        LOG.info('API server caches dropped, cache version {0}'
+                 .format(version))
+        response.status = 200
+        return dict(version=version)
@@ -49,7 +49,7 @@ class DevicesController(RestController):
             List details of a particular device
         Returns: dict
         """
-        with db_session() as session:
+        with db_session(readonly=True) as session:
             # if we don't have an id then we want a list of all devices
             if not device_id:
                 #  return all devices
@@ -248,7 +248,8 @@ class DevicesController(RestController):
             for lb in lbs:
                 session.query(LoadBalancer).\
                     filter(LoadBalancer.id == lb[0]).\
-                    update({"status": lb_status, "errmsg": lb_descr},
+                    update({"status": lb_status, "errmsg": lb_descr,
+                            LoadBalancer.version: LoadBalancer.version + 1},
                            synchronize_session='fetch')
 
                 session.flush()
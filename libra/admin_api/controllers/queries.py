@@ -0,0 +1,45 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# pecan imports
+from pecan import expose, response
+from pecan.rest import RestController
+from libra.common.api import query_stats, retry
+from libra.common.api.gearman_client import get_dispatch_stats
+from libra.common.api.lbaas import RoutingSession
+
+
+class QueriesController(RestController):
+    @expose('json')
+    def get(self):
+        """
+        Reports the SQL queries made by the recent runs of each admin API
+        route and scheduler in this server, how each DB server is doing, how
+        often transactions have been retried after a deadlock and how many
+        Gearman jobs are waiting to be sent.
+
+        Url:
+            GET /queries
+        Returns: dict
+        """
+        window = query_stats.get_window()
+        response.status = 200
+        return dict(
+            window=window.size,
+            queries=window.summary(),
+            databases=RoutingSession.health_table(),
+            retries=retry.get_retry_stats().summary(),
+            jobs=get_dispatch_stats()
+        )
@@ -14,7 +14,9 @@
 # under the License.
 
 from pecan import expose, response
+from caches import CachesController
 from devices import DevicesController
+from queries import QueriesController
 from libra.admin_api.model.responses import Responses
 
 
@@ -28,4 +30,6 @@ class V1Controller(object):
         response.status = 404
         return Responses._default
 
+    caches = CachesController()
     devices = DevicesController()
+    queries = QueriesController()
@@ -21,6 +21,8 @@ from oslo.config import cfg
 from sqlalchemy import func
 
 from libra.common.api.lbaas import Device, PoolBuilding, Vip, db_session
+from libra.common.api.query_stats import counted
+from libra.common.api.retry import retried
 from libra.common.json_gearman import JSONGearmanClient
 from libra.openstack.common import log
 
@@ -56,6 +58,7 @@ class Pool(object):
         if self.vips_timer:
             self.vips_timer.cancel()
 
+    @counted
     def delete_devices(self):
         """ Searches for all devices in the DELETED state and removes them """
         minute = datetime.now().minute
@@ -87,6 +90,7 @@ class Pool(object):
 
         self.start_delete_sched()
 
+    @counted
     def probe_vips(self):
         minute = datetime.now().minute
         if self.server_id != minute % self.number_of_servers:
@@ -113,6 +117,7 @@ class Pool(object):
             )
         self.start_vips_sched()
 
+    @counted
     def probe_devices(self):
         minute = datetime.now().minute
         if self.server_id != minute % self.number_of_servers:
@@ -330,6 +335,7 @@ class GearmanWork(object):
             '{nodes} devices built and added to pool'.format(nodes=built_count)
         )
 
+    @retried
     def _add_vip(self, data):
         LOG.info('Adding vip {0} to DB'.format(data['ip']))
         vip = Vip()
@@ -338,6 +344,7 @@ class GearmanWork(object):
             session.add(vip)
             session.commit()
 
+    @retried
     def _add_node(self, data):
         LOG.info('Adding device {0} to DB'.format(data['name']))
         device = Device()
@@ -354,6 +361,7 @@ class GearmanWork(object):
             session.add(device)
             session.commit()
 
+    @retried
     def _add_bad_node(self, data):
         LOG.info(
             'Adding bad device {0} to DB to be deleted'.format(data['name'])
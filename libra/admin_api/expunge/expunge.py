@@ -18,6 +18,7 @@ from datetime import datetime, timedelta
 from oslo.config import cfg
 
 from libra.common.api.lbaas import LoadBalancer, db_session
+from libra.common.api.query_stats import counted
 from libra.openstack.common import log
 
 
@@ -39,6 +40,7 @@ class ExpungeScheduler(object):
         if self.expunge_timer:
             self.expunge_timer.cancel()
 
+    @counted
     def run_expunge(self):
         day = datetime.now().day
         if self.server_id != day % self.number_of_servers:
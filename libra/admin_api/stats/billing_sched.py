@@ -18,6 +18,8 @@ import datetime
 from oslo.config import cfg
 from libra.common.api.lbaas import Billing, db_session
 from libra.common.api.mnb import update_mnb, test_mnb_connection
+from libra.common.api.query_stats import counted
+from libra.common.api.retry import retried
 from libra.openstack.common import timeutils
 from libra.openstack.common import log as logging
 from sqlalchemy.sql import func
@@ -80,6 +82,8 @@ class BillingStats(object):
         # Need to restart timer after every billing cycle
         self.start_exists_sched()
 
+    @counted
+    @retried
     def _exec_exists(self):
         with db_session() as session:
             # Check if it's time to send exists notifications
@@ -117,6 +121,8 @@ class BillingStats(object):
         # Send the notifications
         update_mnb('lbaas.instance.exists', None, None)
 
+    @counted
+    @retried
     def _exec_usage(self):
         with db_session() as session:
             # Next check if it's time to send bandwidth usage notifications
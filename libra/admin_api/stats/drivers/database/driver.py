@@ -15,6 +15,7 @@ import ipaddress
 from libra.admin_api.stats.drivers.base import AlertDriver
 from libra.common.api.lbaas import Device, LoadBalancer, db_session
 from libra.common.api.lbaas import loadbalancers_devices, Vip
+from libra.common.api.allocator import claim_device
 from libra.common.api.gearman_client import submit_job, submit_vip_job
 from libra.openstack.common import log
 
@@ -39,7 +40,8 @@ class DbDriver(AlertDriver):
             for lb in lbs:
                 session.query(LoadBalancer).\
                     filter(LoadBalancer.id == lb[0]).\
-                    update({"status": "ERROR", "errmsg": errmsg},
+                    update({"status": "ERROR", "errmsg": errmsg,
+                            LoadBalancer.version: LoadBalancer.version + 1},
                            synchronize_session='fetch')
 
                 session.flush()
@@ -51,7 +53,9 @@ class DbDriver(AlertDriver):
         with db_session() as session:
             session.query(Device).\
                 filter(Device.id == device_id).\
-                update({"status": "DELETED"}, synchronize_session='fetch')
+                update({"status": "DELETED",
+                        Device.version: Device.version + 1},
+                       synchronize_session='fetch')
             session.commit()
 
     def send_node_change(self, message, lbid, degraded):
@@ -74,14 +78,10 @@ class DbDriver(AlertDriver):
         new_device_id = None
         new_device_name = None
         with db_session() as session:
-            new_device = session.query(Device).\
-                filter(~Device.id.in_(
-                    session.query(loadbalancers_devices.c.device)
-                )).\
-                filter(Device.status == "OFFLINE").\
-                filter(Device.pingCount == 0).\
-                with_lockmode('update').\
-                first()
+            # Replace it with a device in the same AZ if there is one
+            az = session.query(Device.az).\
+                filter(Device.id == device_id).scalar()
+            new_device = claim_device(session, 'BUILDING', az)
             if new_device is None:
                 session.rollback()
                 LOG.error(
@@ -18,6 +18,8 @@ from datetime import datetime
 from oslo.config import cfg
 
 from libra.common.api.lbaas import Device, db_session
+from libra.common.api.query_stats import counted
+from libra.common.api.retry import retried
 from libra.admin_api.stats.stats_gearman import GearJobs
 from libra.openstack.common import log as logging
 
@@ -63,48 +65,73 @@ class OfflineStats(object):
         )
         self.start_offline_sched()
 
+    @counted
     def _exec_offline_check(self):
         tested = 0
         failed = 0
         node_list = []
         LOG.info('Running OFFLINE check')
-        with db_session() as session:
+        with db_session(readonly=True) as session:
             # Join to ensure device is in-use
             devices = session.query(
                 Device.id, Device.name
             ).filter(Device.status == 'OFFLINE').all()
+            session.rollback()
+
+        tested = len(devices)
+        if tested == 0:
+            LOG.info('No OFFLINE Load Balancers to check')
+            return (0, 0)
+        for lb in devices:
+            node_list.append(lb.name)
+        gearman = GearJobs()
+        failed_lbs = gearman.offline_check(node_list)
+        failed = len(failed_lbs)
+        if failed > self.error_limit:
+            LOG.error(
+                'Too many simultaneous Load Balancer Failures.'
+                ' Aborting deletion attempt'
+            )
+            return tested, failed
+
+        if failed > 0:
+            self._send_delete(failed_lbs)
+
+        # Clear the ping counts for all devices not in
+        # the failed list
+        self._clear_ping_counts(list(set(node_list) - set(failed_lbs)))
 
-            tested = len(devices)
-            if tested == 0:
-                LOG.info('No OFFLINE Load Balancers to check')
-                return (0, 0)
-            for lb in devices:
-                node_list.append(lb.name)
-            gearman = GearJobs()
-            failed_lbs = gearman.offline_check(node_list)
-            failed = len(failed_lbs)
-            if failed > self.error_limit:
-                LOG.error(
-                    'Too many simultaneous Load Balancer Failures.'
-                    ' Aborting deletion attempt'
-                )
-                return tested, failed
-
-            if failed > 0:
-                self._send_delete(failed_lbs)
+        return tested, failed
 
-            # Clear the ping counts for all devices not in
-            # the failed list
-            succeeded = list(set(node_list) - set(failed_lbs))
+    @retried
+    def _clear_ping_counts(self, succeeded):
+        with db_session() as session:
             session.query(Device.name, Device.pingCount).\
                 filter(Device.name.in_(succeeded)).\
-                update({"pingCount": 0}, synchronize_session='fetch')
-
+                update({"pingCount": 0, "version": Device.version + 1},
+                       synchronize_session='fetch')
             session.commit()
 
-        return tested, failed
-
     def _send_delete(self, failed_nodes):
+        for lb, device_id in self._count_failures(failed_nodes):
+            message = (
+                'Load balancer {0} unreachable and marked for deletion'.
+                format(lb)
+            )
+            for driver in self.drivers:
+                instance = driver()
+                LOG.info(
+                    'Sending delete request for {0} to {1}'.format(
+                        lb, instance.__class__.__name__
+                    )
+                )
+                instance.send_delete(message, device_id)
+
+    @retried
+    def _count_failures(self, failed_nodes):
+        """ Add a failed ping to each device, returning the (name, ID) of
+            those which have now failed ping_limit times """
+        to_delete = []
         with db_session() as session:
             for lb in failed_nodes:
                 # Get the current ping count
@@ -126,24 +153,15 @@ class OfflineStats(object):
                     )
                     session.query(Device).\
                         filter(Device.name == lb).\
-                        update({"pingCount": data.pingCount},
+                        update({"pingCount": data.pingCount,
+                                "version": Device.version + 1},
                                synchronize_session='fetch')
                     session.flush()
                     continue
 
-                message = (
-                    'Load balancer {0} unreachable and marked for deletion'.
-                    format(lb)
-                )
-                for driver in self.drivers:
-                    instance = driver()
-                    LOG.info(
-                        'Sending delete request for {0} to {1}'.format(
-                            lb, instance.__class__.__name__
-                        )
-                    )
-                    instance.send_delete(message, data.id)
+                to_delete.append((lb, data.id))
             session.commit()
+        return to_delete
 
     def start_offline_sched(self):
         # Always try to hit the expected second mark for offline checks
@@ -17,6 +17,8 @@ import threading
 from datetime import datetime
 from oslo.config import cfg
 from libra.common.api.lbaas import LoadBalancer, Device, Node, db_session
+from libra.common.api.query_stats import counted
+from libra.common.api.retry import retried
 from libra.openstack.common import log as logging
 from libra.admin_api.stats.stats_gearman import GearJobs
 
@@ -60,12 +62,13 @@ class PingStats(object):
                  .format(pings=pings, failed=failed))
         self.start_ping_sched()
 
+    @counted
     def _exec_ping(self):
         pings = 0
         failed = 0
         node_list = []
         LOG.info('Running ping check')
-        with db_session() as session:
+        with db_session(readonly=True) as session:
             devices = session.query(
                 Device.id, Device.name
             ).filter(Device.status == 'ONLINE').all()
@@ -95,7 +98,7 @@ class PingStats(object):
         return pings, failed
 
     def _send_fails(self, failed_lbs):
-        with db_session() as session:
+        with db_session(readonly=True) as session:
             for lb in failed_lbs:
                 data = self._get_lb(lb, session)
                 if not data:
@@ -131,6 +134,7 @@ class PingStats(object):
 
         return lb
 
+    @retried
     def _update_nodes(self, node_status):
         lbids = []
         degraded = []
@@ -202,6 +206,12 @@ class PingStats(object):
                         update({"status": new_status},
                                synchronize_session='fetch')
                     session.flush()
+            if lbids:
+                # The load balancer's version is part of its nodes' ETag
+                session.query(LoadBalancer).\
+                    filter(LoadBalancer.id.in_(lbids)).\
+                    update({LoadBalancer.version: LoadBalancer.version + 1},
+                           synchronize_session=False)
             session.commit()
 
         # Generate a status message per LB for the alert.
@@ -14,7 +14,8 @@
 
 from gearman.constants import JOB_UNKNOWN
 from oslo.config import cfg
-from libra.common.json_gearman import JSONGearmanClient
+from libra.common.api.codec import encode_for
+from libra.common.json_gearman import JSONGearmanClient, job_priority
 from libra.openstack.common import log
 
 
@@ -51,7 +52,10 @@ class GearJobs(object):
         # data statistics are gathered with METRICS messages.
         job_data = {"hpcs_action": "STATS"}
         for node in node_list:
-            list_of_jobs.append(dict(task=str(node), data=job_data))
+            list_of_jobs.append(dict(
+                task=str(node), data=encode_for(str(node), job_data),
+                priority=job_priority(job_data)
+            ))
         submitted_pings = self.gm_client.submit_multiple_jobs(
             list_of_jobs, background=False, wait_until_complete=True,
             poll_timeout=self.poll_timeout
@@ -84,7 +88,10 @@ class GearJobs(object):
                 "{0} pings timed out, retrying".format(len(retry_list))
             )
             for node in retry_list:
-                list_of_jobs.append(dict(task=str(node), data=job_data))
+                list_of_jobs.append(dict(
+                    task=str(node), data=encode_for(str(node), job_data),
+                    priority=job_priority(job_data)
+                ))
             submitted_pings = self.gm_client.submit_multiple_jobs(
                 list_of_jobs, background=False, wait_until_complete=True,
                 poll_timeout=self.poll_retry
@@ -118,7 +125,10 @@ class GearJobs(object):
         failed_list = []
         job_data = {"hpcs_action": "DIAGNOSTICS"}
         for node in node_list:
-            list_of_jobs.append(dict(task=str(node), data=job_data))
+            list_of_jobs.append(dict(
+                task=str(node), data=encode_for(str(node), job_data),
+                priority=job_priority(job_data)
+            ))
         submitted_pings = self.gm_client.submit_multiple_jobs(
             list_of_jobs, background=False, wait_until_complete=True,
             poll_timeout=self.poll_timeout
@@ -154,7 +164,10 @@ class GearJobs(object):
         results = {}
         job_data = {"hpcs_action": "METRICS"}
         for node in node_list:
-            list_of_jobs.append(dict(task=str(node), data=job_data))
+            list_of_jobs.append(dict(
+                task=str(node), data=encode_for(str(node), job_data),
+                priority=job_priority(job_data)
+            ))
         submitted_stats = self.gm_client.submit_multiple_jobs(
             list_of_jobs, background=False, wait_until_complete=True,
             poll_timeout=self.poll_timeout
@@ -180,7 +193,10 @@ class GearJobs(object):
                 format(len(retry_list))
             )
             for node in retry_list:
-                list_of_jobs.append(dict(task=str(node), data=job_data))
+                list_of_jobs.append(dict(
+                    task=str(node), data=encode_for(str(node), job_data),
+                    priority=job_priority(job_data)
+                ))
             submitted_stats = self.gm_client.submit_multiple_jobs(
                 list_of_jobs, background=False, wait_until_complete=True,
                 poll_timeout=self.poll_retry
@@ -18,6 +18,10 @@ import datetime
 from oslo.config import cfg
 from libra.common.api.lbaas import LoadBalancer, Device, db_session
 from libra.common.api.lbaas import Billing, Stats
+from libra.common.api.bulk import BulkInsert
+from libra.common.api import usage
+from libra.common.api.query_stats import counted
+from libra.common.api.retry import retried
 from libra.admin_api.stats.stats_gearman import GearJobs
 from libra.openstack.common import timeutils
 from libra.openstack.common import log as logging
@@ -62,6 +66,7 @@ class UsageStats(object):
                  .format(total=total, fail=fail))
         self.start_stats_sched()
 
+    @counted
     def _exec_stats(self):
         failed = 0
         node_list = []
@@ -118,6 +123,7 @@ class UsageStats(object):
 
         return failed, total
 
+    @retried
     def _update_stats(self, results, failed_list):
         with db_session() as session:
             lbs = session.query(
@@ -134,7 +140,7 @@ class UsageStats(object):
                 return
 
             total = len(lbs)
-            added = 0
+            writer = BulkInsert(Stats.__table__)
             for lb in lbs:
                 if lb.name not in results:
                     if lb.name not in failed_list:
@@ -161,19 +167,25 @@ class UsageStats(object):
                         .format(lb.name, lb.id, protocol))
                     continue
 
-                new_entry = Stats()
-                new_entry.lbid = lb.id
-                new_entry.period_start = result["utc_start"]
-                new_entry.period_end = result["utc_end"]
-                new_entry.bytes_out = bytes_out
-                new_entry.status = lb.status
-                session.add(new_entry)
-                session.flush
-                added += 1
+                writer.add(
+                    lbid=lb.id,
+                    period_start=result["utc_start"],
+                    period_end=result["utc_end"],
+                    bytes_out=bytes_out,
+                    status=lb.status
+                )
+            rollup = [(row['lbid'], row['period_end'], row['bytes_out'])
+                      for row in writer.rows]
+            added = writer.flush(session)
+            usage.add_to_rollup(
+                session, rollup, cfg.CONF['admin_api'].usage_freq
+            )
             session.commit()
             LOG.info(
-                '{total} loadbalancers stats queried, {fail} failed'
-                .format(total=total, fail=total - added))
+                '{total} loadbalancers stats queried, {fail} failed, '
+                '{added} rows written at {rate:.0f} rows/sec'
+                .format(total=total, fail=total - added, added=added,
+                        rate=writer.rate()))
 
     def _send_fails(self, failed_list):
         with db_session() as session:
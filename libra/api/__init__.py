@@ -32,7 +32,20 @@ cfg.CONF.register_opts(
                    help='IP address to bind to, 0.0.0.0 for all IPs'),
         cfg.ListOpt('ip_filters',
                     help='IP filters for backend nodes in the form '
-                         'xxx.xxx.xxx.xxx/yy'),
+                         'xxx.xxx.xxx.xxx/yy or an IPv6 network'),
+        cfg.IntOpt('limits_ttl',
+                   default=300,
+                   help='Seconds to keep the global and tenant limits in '
+                        'memory before reading them again'),
+        cfg.IntOpt('cache_check',
+                   default=10,
+                   help='Seconds between checks of whether the in-memory '
+                        'caches have been dropped through the admin API'),
+        cfg.IntOpt('response_ttl',
+                   default=300,
+                   help='Seconds to keep the versions, algorithms, '
+                        'protocols and limits responses, 0 to not keep '
+                        'them'),
         cfg.StrOpt('keystone_module',
                    default='keystoneclient.middleware.auth_token:AuthProtocol',
                    help='A colon separated module and class for keystone '
@@ -21,6 +21,7 @@ import grp
 import logging as std_logging
 import pwd
 import pecan
+import signal
 import sys
 import wsme_overrides
 
@@ -30,7 +31,12 @@ from libra import __version__
 from libra.api import config as api_config
 from libra.api import model
 from libra.api import acl
+from libra.api.library.cache_sync import CacheSync, invalidate_caches
+from libra.api.library.ip_filter import get_ip_filter
 from libra.common.api import server
+from libra.common.api.migrate import SchemaError, check_at_startup
+from libra.common.api.outbox import OutboxDrainer
+from libra.common.api.query_stats import QueryAccounting
 from libra.common.log import get_descriptors
 from libra.common.options import CONF
 from libra.common.options import add_common_opts
@@ -71,9 +77,28 @@ def setup_app(pecan_config):
         'keepalive': CONF['gearman']['keepalive'],
         'keepcnt': CONF['gearman']['keepcnt'],
         'keepidle': CONF['gearman']['keepidle'],
-        'keepintvl': CONF['gearman']['keepintvl']
+        'keepintvl': CONF['gearman']['keepintvl'],
+        'pool_size': CONF['gearman']['pool_size'],
+        'pool_idle': CONF['gearman']['pool_idle'],
+        'update_window': CONF['gearman']['update_window'],
+        'dispatch_workers': CONF['gearman']['dispatch_workers'],
+        'dispatch_queue': CONF['gearman']['dispatch_queue'],
+        'outbox_batch': CONF['gearman']['outbox_batch'],
+        'outbox_poll': CONF['gearman']['outbox_poll'],
+        'outbox_timeout': CONF['gearman']['outbox_timeout'],
+        'job_timeout': CONF['gearman']['job_timeout'],
+        'job_timeout_min': CONF['gearman']['job_timeout_min'],
+        'job_retries': CONF['gearman']['job_retries'],
+        'breaker_threshold': CONF['gearman']['breaker_threshold'],
+        'breaker_cooldown': CONF['gearman']['breaker_cooldown'],
+        'codec': CONF['gearman']['codec']
     }
     config['ip_filters'] = CONF['api']['ip_filters']
+    # Compiled now so a bad filter stops the server starting
+    get_ip_filter(config['ip_filters'])
+    config['limits_ttl'] = CONF['api']['limits_ttl']
+    config['cache_check'] = CONF['api']['cache_check']
+    config['response_ttl'] = CONF['api']['response_ttl']
     if CONF['debug']:
         config['wsme'] = {'debug': True}
         config['app']['debug'] = True
@@ -92,7 +117,7 @@ def setup_app(pecan_config):
             True)
     )
 
-    final_app = acl.AuthDirector(app)
+    final_app = QueryAccounting(acl.AuthDirector(app))
     return final_app
 
 
@@ -106,6 +131,11 @@ class LogStdout(object):
         pass
 
 
+def reload_cached(signum, frame):
+    LOG.info('Got SIGHUP, limits and cached responses will be read again')
+    invalidate_caches()
+
+
 def main():
     add_common_opts()
     CONF(project='libra', version=__version__)
@@ -152,8 +182,19 @@ def main():
 
     LOG.info('Starting on %s:%d', CONF.api.host, CONF.api.port)
     api = setup_app(pc)
+    try:
+        check_at_startup()
+    except SchemaError as e:
+        LOG.critical(str(e))
+        return 1
+    OutboxDrainer()
+    CacheSync()
     sys.stderr = LogStdout()
 
+    # Limits and protocols are changed in the database, SIGHUP (or a
+    # DELETE of /v1/caches on the admin API) has them read again
+    signal.signal(signal.SIGHUP, reload_cached)
+
     wsgi.server(sock, api, keepalive=False, debug=CONF['debug'])
 
     return 0
@@ -23,8 +23,10 @@ from libra.common.api.lbaas import LoadBalancer, db_session
 from libra.common.api.lbaas import Device, HealthMonitor
 from libra.api.acl import get_limited_to_project
 from libra.api.model.validators import LBMonitorPut, LBMonitorResp
-from libra.common.api.gearman_client import submit_job
+from libra.common.api.outbox import queue_job
+from libra.common.api.retry import retried
 from libra.api.library.exp import NotFound, ImmutableEntity, ImmutableStates
+from libra.api.library.etags import not_modified
 
 
 class HealthMonitorController(RestController):
@@ -42,6 +44,8 @@ class HealthMonitorController(RestController):
         """Retrieve the health monitor configuration, if one exists.
         Url:
            GET /loadbalancers/{load_balancer_id}/healthmonitor
+           The response has an ETag, and is 304 Not Modified if
+           If-None-Match has it.
 
         Returns: dict
         """
@@ -49,7 +53,11 @@ class HealthMonitorController(RestController):
             raise ClientSideError('Load Balancer ID has not been supplied')
 
         tenant_id = get_limited_to_project(request.headers)
-        with db_session() as session:
+        with db_session(readonly=True) as session:
+            unchanged = not_modified(session, tenant_id, self.lbid)
+            if unchanged is not None:
+                session.rollback()
+                return unchanged
             # grab the lb
             monitor = session.query(
                 HealthMonitor.type, HealthMonitor.delay,
@@ -95,6 +103,11 @@ class HealthMonitorController(RestController):
             raise ClientSideError('Load Balancer ID has not been supplied')
 
         tenant_id = get_limited_to_project(request.headers)
+        return self._update(tenant_id, body)
+
+    @retried
+    def _update(self, tenant_id, body):
+        """ Store the monitor settings, adding a monitor if there is none """
         with db_session() as session:
             # grab the lb
             query = session.query(LoadBalancer, HealthMonitor).\
@@ -240,10 +253,10 @@ class HealthMonitorController(RestController):
             if ((data["path"] is not None) and (len(data["path"]) > 0)):
                 return_data.path = data["path"]
 
-            session.commit()
-            submit_job(
-                'UPDATE', device.name, device.id, lb.id
+            queue_job(
+                session, 'UPDATE', device.name, device.id, lb.id
             )
+            session.commit()
             return return_data
 
     @wsme_pecan.wsexpose(None, status_code=202)
@@ -261,6 +274,11 @@ class HealthMonitorController(RestController):
             raise ClientSideError('Load Balancer ID has not been supplied')
 
         tenant_id = get_limited_to_project(request.headers)
+        return self._delete(tenant_id)
+
+    @retried
+    def _delete(self, tenant_id):
+        """ Remove the monitor if there is one """
         with db_session() as session:
             query = session.query(
                 LoadBalancer, HealthMonitor
@@ -282,6 +300,11 @@ class HealthMonitorController(RestController):
 
             if monitor is not None:
                 session.delete(monitor)
+                # The load balancer's version is part of the monitor's ETag
+                session.query(LoadBalancer).\
+                    filter(LoadBalancer.id == lb.id).\
+                    update({LoadBalancer.version: LoadBalancer.version + 1},
+                           synchronize_session=False)
                 session.flush()
 
             device = session.query(
@@ -289,8 +312,8 @@ class HealthMonitorController(RestController):
             ).join(LoadBalancer.devices).\
                 filter(LoadBalancer.id == self.lbid).\
                 first()
-            session.commit()
-            submit_job(
-                'UPDATE', device.name, device.id, self.lbid
+            queue_job(
+                session, 'UPDATE', device.name, device.id, self.lbid
             )
+            session.commit()
             return None
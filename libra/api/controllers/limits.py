@@ -16,29 +16,14 @@
 from pecan import expose, request
 from pecan.rest import RestController
 from libra.api.acl import get_limited_to_project
-from libra.common.api.lbaas import Limits, TenantLimits, db_session
+from libra.api.library.limits import get_limits
+from libra.api.library.response_cache import cached
 
 
 class LimitsController(RestController):
     @expose('json')
+    @cached('limits', per_tenant=True)
     def get(self):
-        resp = {}
         tenant_id = get_limited_to_project(request.headers)
-
-        with db_session() as session:
-            limits = session.query(Limits).all()
-
-            # Get per-tenant values
-            tenant_lblimit = session.query(TenantLimits.loadbalancers).\
-                filter(TenantLimits.tenantid == tenant_id).scalar()
-
-            for limit in limits:
-                resp[limit.name] = limit.value
-
-            # Set per-tenant values
-            if tenant_lblimit:
-                resp['maxLoadBalancers'] = tenant_lblimit
-
-            resp = {"limits": {"absolute": {"values": resp}}}
-            session.rollback()
-            return resp
+        resp = get_limits().for_tenant(tenant_id)
+        return {"limits": {"absolute": {"values": resp}}}
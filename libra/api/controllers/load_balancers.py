@@ -13,6 +13,7 @@
 # under the License.
 
 import ipaddress
+import urllib
 # pecan imports
 from pecan import expose, abort, response, request
 from pecan.rest import RestController
@@ -20,84 +21,124 @@ import wsmeext.pecan as wsme_pecan
 from wsme.exc import ClientSideError
 from wsme import Unset
 # other controllers
-from nodes import NodesController
+from nodes import NodesController, BulkNodesController
 from virtualips import VipsController
 from health_monitor import HealthMonitorController
 from logs import LogsController
 
 # models
 from libra.common.api.lbaas import LoadBalancer, Device, Node, db_session
-from libra.common.api.lbaas import TenantLimits
-from libra.common.api.lbaas import loadbalancers_devices, Limits, Vip, Ports
+from libra.common.api.lbaas import loadbalancers_devices, Vip, Ports
 from libra.common.api.lbaas import HealthMonitor
 from libra.common.exc import ExhaustedError
 from libra.api.model.validators import LBPut, LBPost, LBResp, LBVipResp
 from libra.api.model.validators import LBRespNode
-from libra.common.api.gearman_client import submit_job
+from libra.common.api.allocator import claim_device
+from libra.common.api.outbox import queue_job
+from libra.common.api.retry import retried
 from libra.api.acl import get_limited_to_project
 from libra.api.library.exp import OverLimit, IPOutOfRange, NotFound
 from libra.api.library.exp import ImmutableEntity, ImmutableStates
 from libra.api.library.exp import ImmutableStatesNoError
-from libra.api.library.ip_filter import ipfilter
+from libra.api.library.ip_filter import get_ip_filter
+from libra.api.library.etags import not_modified
+from libra.api.library.limits import get_limits
 from pecan import conf
+from sqlalchemy import func
 from wsme import types as wtypes
 
 
+# Most load balancers listed in one response, a next link gives the rest
+MAX_LIST_LIMIT = 1000
+
+
+def list_load_balancers(session, tenant_id, status=None, marker=None,
+                        limit=MAX_LIST_LIMIT):
+    """ A page of a tenant's load balancers in ID order, starting after the
+        ID marker, with each one's node count.  Returns the page and whether
+        there are more after it. """
+    query = session.query(
+        LoadBalancer.name, LoadBalancer.id, LoadBalancer.protocol,
+        LoadBalancer.port, LoadBalancer.algorithm, LoadBalancer.status,
+        LoadBalancer.created, LoadBalancer.updated,
+        func.count(Node.id).label('nodeCount')
+    ).outerjoin(Node, Node.lbid == LoadBalancer.id).\
+        filter(LoadBalancer.tenantid == tenant_id)
+    if status == 'DELETED':
+        query = query.filter(LoadBalancer.status == 'DELETED')
+    else:
+        query = query.filter(LoadBalancer.status != 'DELETED')
+    if marker is not None:
+        query = query.filter(LoadBalancer.id > marker)
+    # One more than asked for shows whether there is another page
+    lbs = query.group_by(LoadBalancer.id).\
+        order_by(LoadBalancer.id).\
+        limit(limit + 1).all()
+    return lbs[:limit], len(lbs) > limit
+
+
 class LoadBalancersController(RestController):
     def __init__(self, lbid=None):
         self.lbid = lbid
 
-    @wsme_pecan.wsexpose(None, wtypes.text)
-    def get(self, status=None):
+    @wsme_pecan.wsexpose(None, wtypes.text, int, int)
+    def get(self, status=None, marker=None, limit=None):
         """Fetches a list of load balancers or the details of one balancer if
         load_balancer_id is not empty.
 
         :param load_balancer_id: id of lb we want to get, if none it returns a
         list of all
+        :param marker: list the load balancers after this ID
+        :param limit: list at most this many load balancers
 
         Url:
            GET /loadbalancers
-           List all load balancers configured for the account.
+           List all load balancers configured for the account, at most
+           MAX_LIST_LIMIT at a time.  If there are more a next link gives
+           the URL of the next page.
 
         Url:
            GET /loadbalancers/{load_balancer_id}
-           List details of the specified load balancer.
+           List details of the specified load balancer.  The response has
+           an ETag, and is 304 Not Modified if If-None-Match has it.
 
         Returns: dict
         """
 
         tenant_id = get_limited_to_project(request.headers)
-        with db_session() as session:
+        with db_session(readonly=True) as session:
             # if we don't have an id then we want a list of them own by this
             # tenent
             if not self.lbid:
-                if status and status == 'DELETED':
-                    lbs = session.query(
-                        LoadBalancer.name, LoadBalancer.id,
-                        LoadBalancer.protocol,
-                        LoadBalancer.port, LoadBalancer.algorithm,
-                        LoadBalancer.status, LoadBalancer.created,
-                        LoadBalancer.updated
-                    ).filter(LoadBalancer.tenantid == tenant_id).\
-                        filter(LoadBalancer.status == 'DELETED').all()
-                else:
-                    lbs = session.query(
-                        LoadBalancer.name, LoadBalancer.id,
-                        LoadBalancer.protocol,
-                        LoadBalancer.port, LoadBalancer.algorithm,
-                        LoadBalancer.status, LoadBalancer.created,
-                        LoadBalancer.updated
-                    ).filter(LoadBalancer.tenantid == tenant_id).\
-                        filter(LoadBalancer.status != 'DELETED').all()
+                if limit is None or limit > MAX_LIST_LIMIT:
+                    limit = MAX_LIST_LIMIT
+                if limit < 1:
+                    session.rollback()
+                    raise ClientSideError('limit must be at least 1')
+                lbs, more = list_load_balancers(
+                    session, tenant_id, status, marker, limit
+                )
                 load_balancers = {'loadBalancers': []}
 
                 for lb in lbs:
                     lb = lb._asdict()
-                    lb['nodeCount'] = session.query(Node).\
-                        filter(Node.lbid == lb['id']).count()
                     lb['id'] = str(lb['id'])
                     load_balancers['loadBalancers'].append(lb)
+                if more:
+                    params = {'marker': lbs[-1].id, 'limit': limit}
+                    if status:
+                        params['status'] = status
+                    load_balancers['links'] = [{
+                        'rel': 'next',
+                        'href': '{0}?{1}'.format(
+                            request.path_url, urllib.urlencode(params)
+                        )
+                    }]
             else:
+                unchanged = not_modified(session, tenant_id, self.lbid)
+                if unchanged is not None:
+                    session.rollback()
+                    return unchanged
                 load_balancers = session.query(
                     LoadBalancer.name, LoadBalancer.id, LoadBalancer.protocol,
                     LoadBalancer.port, LoadBalancer.algorithm,
@@ -221,18 +262,6 @@ class LoadBalancersController(RestController):
                     .format(node.address, node.port)
                 )
 
-            try:
-                node.address = ipfilter(node.address, conf.ip_filters)
-            except IPOutOfRange:
-                raise ClientSideError(
-                    'IP Address {0} is not allowed as a backend node'
-                    .format(node.address)
-                )
-            except:
-                raise ClientSideError(
-                    'IP Address {0} not valid'.format(node.address)
-                )
-
             if node.weight != Unset:
                 try:
                     weight = int(node.weight)
@@ -251,6 +280,23 @@ class LoadBalancersController(RestController):
             if is_galera and not is_backup:
                 num_galera_primary_nodes += 1
 
+        # Every address in one go against the compiled filters
+        try:
+            addresses = get_ip_filter(conf.ip_filters).check_all(
+                [node.address for node in body.nodes]
+            )
+        except IPOutOfRange as e:
+            raise ClientSideError(
+                'IP Address {0} is not allowed as a backend node'
+                .format(e.args[0])
+            )
+        except ValueError as e:
+            raise ClientSideError(
+                'IP Address {0} not valid'.format(e.args[0])
+            )
+        for node, address in zip(body.nodes, addresses):
+            node.address = address
+
         # Options defaults
         client_timeout_ms = 30000
         server_timeout_ms = 30000
@@ -272,26 +318,31 @@ class LoadBalancersController(RestController):
                 'Galera load balancer must have exactly one primary node'
             )
 
+        limits = get_limits().for_tenant(tenant_id)
+        lblimit = limits['maxLoadBalancers']
+        nodelimit = limits['maxNodesPerLoadBalancer']
+        namelimit = limits['maxLoadBalancerNameLength']
+
+        return self._create(
+            tenant_id, body, (lblimit, nodelimit, namelimit),
+            (client_timeout_ms, server_timeout_ms, connect_timeout_ms,
+             connect_retries)
+        )
+
+    @retried
+    def _create(self, tenant_id, body, limits, timeouts):
+        """ Add the load balancer and its nodes, claiming a device for it if
+            it does not share a virtual IP """
+        lblimit, nodelimit, namelimit = limits
+        client_timeout_ms, server_timeout_ms, connect_timeout_ms, \
+            connect_retries = timeouts
         with db_session() as session:
-            lblimit = session.query(Limits.value).\
-                filter(Limits.name == 'maxLoadBalancers').scalar()
-            nodelimit = session.query(Limits.value).\
-                filter(Limits.name == 'maxNodesPerLoadBalancer').scalar()
-            namelimit = session.query(Limits.value).\
-                filter(Limits.name == 'maxLoadBalancerNameLength').scalar()
             count = session.query(LoadBalancer).\
                 filter(LoadBalancer.tenantid == tenant_id).\
                 filter(LoadBalancer.status != 'DELETED').count()
             ports = session.query(Ports.protocol, Ports.portnum).\
                 filter(Ports.enabled == 1).all()
 
-            # Allow per-tenant LB limit, defaulting to the global limit if
-            # the per-tenant value is not set.
-            tenant_lblimit = session.query(TenantLimits.loadbalancers).\
-                filter(TenantLimits.tenantid == tenant_id).scalar()
-            if tenant_lblimit:
-                lblimit = tenant_lblimit
-
             if len(body.name) > namelimit:
                 session.rollback()
                 raise ClientSideError(
@@ -357,17 +408,8 @@ class LoadBalancersController(RestController):
             lb.created = None
 
             if body.virtualIps == Unset:
-                # find free device
-                # lock with "for update" so multiple APIs don't grab the same
-                # LB
-                device = session.query(Device).\
-                    filter(~Device.id.in_(
-                        session.query(loadbalancers_devices.c.device)
-                    )).\
-                    filter(Device.status == "OFFLINE").\
-                    filter(Device.pingCount == 0).\
-                    with_lockmode('update').\
-                    first()
+                # Claim a free device, concurrent creates each get their own
+                device = claim_device(session, 'BUILD')
                 if device is None:
                     session.rollback()
                     raise ExhaustedError('No devices available')
@@ -505,11 +547,11 @@ class LoadBalancersController(RestController):
                     )
 
                 return_data.nodes.append(out_node)
-            session.commit()
-            # trigger gearman client to create new lb
-            submit_job(
-                'UPDATE', device.name, device.id, lb.id
+            # queue the job to create the new lb
+            queue_job(
+                session, 'UPDATE', device.name, device.id, lb.id
             )
+            session.commit()
 
             return return_data
 
@@ -519,6 +561,12 @@ class LoadBalancersController(RestController):
             raise ClientSideError('Load Balancer ID is required')
 
         tenant_id = get_limited_to_project(request.headers)
+        namelimit = get_limits().get('maxLoadBalancerNameLength')
+        return self._update(tenant_id, body, namelimit)
+
+    @retried
+    def _update(self, tenant_id, body, namelimit):
+        """ Rename the load balancer or change its algorithm """
         with db_session() as session:
             # grab the lb
             lb = session.query(LoadBalancer).\
@@ -539,8 +587,6 @@ class LoadBalancersController(RestController):
                 )
 
             if body.name != Unset:
-                namelimit = session.query(Limits.value).\
-                    filter(Limits.name == 'maxLoadBalancerNameLength').scalar()
                 if len(body.name) > namelimit:
                     session.rollback()
                     raise ClientSideError(
@@ -558,10 +604,10 @@ class LoadBalancersController(RestController):
                 filter(LoadBalancer.id == self.lbid).\
                 first()
 
-            session.commit()
-            submit_job(
-                'UPDATE', device.name, device.id, lb.id
+            queue_job(
+                session, 'UPDATE', device.name, device.id, lb.id
             )
+            session.commit()
             return ''
 
     @wsme_pecan.wsexpose(None, status_code=202)
@@ -581,8 +627,13 @@ class LoadBalancersController(RestController):
         """
         load_balancer_id = self.lbid
         tenant_id = get_limited_to_project(request.headers)
-        # grab the lb
+        return self._delete(tenant_id, load_balancer_id)
+
+    @retried
+    def _delete(self, tenant_id, load_balancer_id):
+        """ Mark the load balancer for deletion by its device """
         with db_session() as session:
+            # grab the lb
             lb = session.query(LoadBalancer).\
                 filter(LoadBalancer.id == load_balancer_id).\
                 filter(LoadBalancer.tenantid == tenant_id).\
@@ -617,10 +668,10 @@ class LoadBalancersController(RestController):
                     filter(HealthMonitor.lbid == lb.id).delete()
                 session.commit()
             else:
-                session.commit()
-                submit_job(
-                    'DELETE', device.name, device.id, lb.id
+                queue_job(
+                    session, 'DELETE', device.name, device.id, lb.id
                 )
+                session.commit()
 
             return None
 
@@ -651,6 +702,8 @@ class LoadBalancersController(RestController):
             raise abort(404)
 
         if len(remainder):
+            if list(remainder[:2]) == ['nodes', 'bulk']:
+                return BulkNodesController(lbid), remainder[2:]
             if remainder[0] == 'nodes':
                 return NodesController(lbid), remainder[1:]
             if remainder[0] == 'virtualips':
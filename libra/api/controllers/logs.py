@@ -23,6 +23,7 @@ from libra.common.api.lbaas import LoadBalancer, Device, db_session
 from libra.api.acl import get_limited_to_project
 from libra.api.model.validators import LBLogsPost
 from libra.common.api.gearman_client import submit_job
+from libra.common.api.retry import retried
 from libra.api.library.exp import NotFound, ImmutableEntity, ImmutableStates
 
 
@@ -36,6 +37,39 @@ class LogsController(RestController):
             raise ClientSideError('Load Balancer ID has not been supplied')
 
         tenant_id = get_limited_to_project(request.headers)
+        device = self._start_archive(tenant_id)
+        data = {
+            'deviceid': device.id
+        }
+        if body.objectStoreType != Unset:
+            data['objectStoreType'] = body.objectStoreType.lower()
+        else:
+            data['objectStoreType'] = 'swift'
+
+        if body.objectStoreBasePath != Unset:
+            data['objectStoreBasePath'] = body.objectStoreBasePath
+        else:
+            data['objectStoreBasePath'] = conf.swift.swift_basepath
+
+        if body.objectStoreEndpoint != Unset:
+            data['objectStoreEndpoint'] = body.objectStoreEndpoint
+        else:
+            data['objectStoreEndpoint'] = '{0}/{1}'.\
+                format(conf.swift.swift_endpoint.rstrip('/'), tenant_id)
+
+        if body.authToken != Unset:
+            data['authToken'] = body.authToken
+        else:
+            data['authToken'] = request.headers.get('X-Auth-Token')
+
+        submit_job(
+            'ARCHIVE', device.name, data, self.lbid
+        )
+
+    @retried
+    def _start_archive(self, tenant_id):
+        """ Mark the load balancer as archiving its logs, returning its
+            device """
         with db_session() as session:
             load_balancer = session.query(LoadBalancer).\
                 filter(LoadBalancer.tenantid == tenant_id).\
@@ -61,31 +95,4 @@ class LogsController(RestController):
                 first()
 
             session.commit()
-            data = {
-                'deviceid': device.id
-            }
-            if body.objectStoreType != Unset:
-                data['objectStoreType'] = body.objectStoreType.lower()
-            else:
-                data['objectStoreType'] = 'swift'
-
-            if body.objectStoreBasePath != Unset:
-                data['objectStoreBasePath'] = body.objectStoreBasePath
-            else:
-                data['objectStoreBasePath'] = conf.swift.swift_basepath
-
-            if body.objectStoreEndpoint != Unset:
-                data['objectStoreEndpoint'] = body.objectStoreEndpoint
-            else:
-                data['objectStoreEndpoint'] = '{0}/{1}'.\
-                    format(conf.swift.swift_endpoint.rstrip('/'), tenant_id)
-
-            if body.authToken != Unset:
-                data['authToken'] = body.authToken
-            else:
-                data['authToken'] = request.headers.get('X-Auth-Token')
-
-            submit_job(
-                'ARCHIVE', device.name, data, self.lbid
-            )
-            return
+            return device
@@ -19,18 +19,101 @@ import wsmeext.pecan as wsme_pecan
 from wsme.exc import ClientSideError
 from wsme import Unset
 #default response objects
-from libra.common.api.lbaas import LoadBalancer, Node, db_session, Limits
+from libra.common.api.lbaas import LoadBalancer, Node, db_session
 from libra.common.api.lbaas import Device
 from libra.api.acl import get_limited_to_project
 from libra.api.model.validators import LBNodeResp, LBNodePost, NodeResp
-from libra.api.model.validators import LBNodePut
-from libra.common.api.gearman_client import submit_job
+from libra.api.model.validators import LBNodePut, LBNodeBulk
+from libra.common.api.outbox import queue_job
+from libra.common.api.retry import retried
 from libra.api.library.exp import OverLimit, IPOutOfRange, NotFound
 from libra.api.library.exp import ImmutableEntity, ImmutableStates
-from libra.api.library.ip_filter import ipfilter
+from libra.api.library.etags import not_modified
+from libra.api.library.ip_filter import get_ip_filter
+from libra.api.library.limits import get_limits
 from pecan import conf
 
 
+def check_new_nodes(nodes):
+    """ Check nodes about to be added, putting their addresses in standard
+        form.  Raises ClientSideError for the first problem found. """
+    for node in nodes:
+        if node.address == Unset:
+            raise ClientSideError(
+                'A supplied node has no address'
+            )
+        if node.port == Unset:
+            raise ClientSideError(
+                'Node {0} is missing a port'.format(node.address)
+            )
+        if node.port < 1 or node.port > 65535:
+            raise ClientSideError(
+                'Node {0} port number {1} is invalid'
+                .format(node.address, node.port)
+            )
+        if node.weight != Unset:
+            try:
+                weight = int(node.weight)
+            except ValueError:
+                raise ClientSideError(
+                    'Node weight must be an integer'
+                )
+            if weight < 1 or weight > 256:
+                raise ClientSideError(
+                    'Node weight must be between 1 and 256'
+                )
+    try:
+        addresses = get_ip_filter(conf.ip_filters).check_all(
+            [node.address for node in nodes]
+        )
+    except IPOutOfRange as e:
+        raise ClientSideError(
+            'IP Address {0} is not allowed as a backend node'
+            .format(e.args[0])
+        )
+    except ValueError as e:
+        raise ClientSideError(
+            'IP Address {0} not valid'.format(e.args[0])
+        )
+    for node, address in zip(nodes, addresses):
+        node.address = address
+
+
+def add_node(session, lbid, node, is_backup):
+    """ Add a checked LBNode to a load balancer, returning its NodeResp """
+    if node.condition == 'DISABLED':
+        enabled = 0
+        node_status = 'OFFLINE'
+    else:
+        enabled = 1
+        node_status = 'ONLINE'
+    weight = 1
+    if node.weight != Unset:
+        weight = node.weight
+    new_node = Node(
+        lbid=lbid, port=node.port, address=node.address,
+        enabled=enabled, status=node_status,
+        weight=weight, backup=int(is_backup)
+    )
+    session.add(new_node)
+    session.flush()
+    if new_node.enabled:
+        condition = 'ENABLED'
+    else:
+        condition = 'DISABLED'
+    if weight == 1:
+        return NodeResp(
+            id=new_node.id, port=new_node.port,
+            address=new_node.address, condition=condition,
+            status=new_node.status
+        )
+    return NodeResp(
+        id=new_node.id, port=new_node.port,
+        address=new_node.address, condition=condition,
+        status=new_node.status, weight=weight
+    )
+
+
 class NodesController(RestController):
     """Functions for /loadbalancers/{load_balancer_id}/nodes/* routing"""
     def __init__(self, lbid, nodeid=None):
@@ -49,13 +132,19 @@ class NodesController(RestController):
            GET /loadbalancers/{load_balancer_id}/nodes
            GET /loadbalancers/{load_balancer_id}/nodes/{node_id}
 
+        Both have an ETag and are 304 Not Modified if If-None-Match has it.
+
         Returns: dict
         """
         tenant_id = get_limited_to_project(request.headers)
 
         if not self.lbid:
             raise ClientSideError('Load Balancer ID not supplied')
-        with db_session() as session:
+        with db_session(readonly=True) as session:
+            unchanged = not_modified(session, tenant_id, self.lbid)
+            if unchanged is not None:
+                session.rollback()
+                return unchanged
             if not self.nodeid:
                 nodes = session.query(
                     Node.id, Node.address, Node.port, Node.status,
@@ -127,43 +216,14 @@ class NodesController(RestController):
         if body.nodes == Unset or not len(body.nodes):
             raise ClientSideError('No nodes have been supplied')
 
-        for node in body.nodes:
-            if node.address == Unset:
-                raise ClientSideError(
-                    'A supplied node has no address'
-                )
-            if node.port == Unset:
-                raise ClientSideError(
-                    'Node {0} is missing a port'.format(node.address)
-                )
-            if node.port < 1 or node.port > 65535:
-                raise ClientSideError(
-                    'Node {0} port number {1} is invalid'
-                    .format(node.address, node.port)
-                )
-            try:
-                node.address = ipfilter(node.address, conf.ip_filters)
-            except IPOutOfRange:
-                raise ClientSideError(
-                    'IP Address {0} is not allowed as a backend node'
-                    .format(node.address)
-                )
-            except:
-                raise ClientSideError(
-                    'IP Address {0} not valid'.format(node.address)
-                )
+        check_new_nodes(body.nodes)
 
-            if node.weight != Unset:
-                try:
-                    weight = int(node.weight)
-                except ValueError:
-                    raise ClientSideError(
-                        'Node weight must be an integer'
-                    )
-                if weight < 1 or weight > 256:
-                    raise ClientSideError(
-                        'Node weight must be between 1 and 256'
-                    )
+        nodelimit = get_limits().get('maxNodesPerLoadBalancer')
+        return self._add(tenant_id, body, nodelimit)
+
+    @retried
+    def _add(self, tenant_id, body, nodelimit):
+        """ Add the nodes to the load balancer """
         with db_session() as session:
             load_balancer = session.query(LoadBalancer).\
                 filter(LoadBalancer.tenantid == tenant_id).\
@@ -185,8 +245,6 @@ class NodesController(RestController):
             load_balancer.status = 'PENDING_UPDATE'
 
             # check if we are over limit
-            nodelimit = session.query(Limits.value).\
-                filter(Limits.name == 'maxNodesPerLoadBalancer').scalar()
             nodecount = session.query(Node).\
                 filter(Node.lbid == self.lbid).count()
             if (nodecount + len(body.nodes)) > nodelimit:
@@ -197,6 +255,7 @@ class NodesController(RestController):
 
             return_data = LBNodeResp()
             return_data.nodes = []
+            node_ids = []
 
             is_galera = False
             if load_balancer.protocol.lower() == 'galera':
@@ -213,42 +272,9 @@ class NodesController(RestController):
                     raise ClientSideError(
                         'Galera load balancer may have only one primary node'
                     )
-                if node.condition == 'DISABLED':
-                    enabled = 0
-                    node_status = 'OFFLINE'
-                else:
-                    enabled = 1
-                    node_status = 'ONLINE'
-                weight = 1
-                if node.weight != Unset:
-                    weight = node.weight
-                new_node = Node(
-                    lbid=self.lbid, port=node.port, address=node.address,
-                    enabled=enabled, status=node_status,
-                    weight=weight, backup=int(is_backup)
-                )
-                session.add(new_node)
-                session.flush()
-                if new_node.enabled:
-                    condition = 'ENABLED'
-                else:
-                    condition = 'DISABLED'
-                if weight == 1:
-                    return_data.nodes.append(
-                        NodeResp(
-                            id=new_node.id, port=new_node.port,
-                            address=new_node.address, condition=condition,
-                            status=new_node.status
-                        )
-                    )
-                else:
-                    return_data.nodes.append(
-                        NodeResp(
-                            id=new_node.id, port=new_node.port,
-                            address=new_node.address, condition=condition,
-                            status=new_node.status, weight=weight
-                        )
-                    )
+                new_node = add_node(session, self.lbid, node, is_backup)
+                node_ids.append(new_node.id)
+                return_data.nodes.append(new_node)
 
             device = session.query(
                 Device.id, Device.name, Device.status
@@ -256,10 +282,11 @@ class NodesController(RestController):
                 filter(LoadBalancer.id == self.lbid).\
                 first()
 
-            session.commit()
-            submit_job(
-                'UPDATE', device.name, device.id, self.lbid
+            queue_job(
+                session, 'PATCH', device.name,
+                {'deviceid': device.id, 'nodes': node_ids}, self.lbid
             )
+            session.commit()
             return return_data
 
     @wsme_pecan.wsexpose(None, body=LBNodePut, status_code=202)
@@ -273,6 +300,11 @@ class NodesController(RestController):
             raise ClientSideError('Node condition or weight is required')
 
         tenant_id = get_limited_to_project(request.headers)
+        return self._update(tenant_id, body)
+
+    @retried
+    def _update(self, tenant_id, body):
+        """ Change the condition or weight of the node """
         with db_session() as session:
             # grab the lb
             lb = session.query(LoadBalancer).\
@@ -336,10 +368,11 @@ class NodesController(RestController):
                 filter(LoadBalancer.id == self.lbid).\
                 first()
 
-            session.commit()
-            submit_job(
-                'UPDATE', device.name, device.id, lb.id
+            queue_job(
+                session, 'PATCH', device.name,
+                {'deviceid': device.id, 'nodes': [node.id]}, lb.id
             )
+            session.commit()
             return ''
 
     @wsme_pecan.wsexpose(None, status_code=202)
@@ -360,6 +393,11 @@ class NodesController(RestController):
             raise ClientSideError('Load Balancer ID has not been supplied')
 
         tenant_id = get_limited_to_project(request.headers)
+        return self._delete(tenant_id, node_id)
+
+    @retried
+    def _delete(self, tenant_id, node_id):
+        """ Remove the node from its load balancer """
         with db_session() as session:
             load_balancer = session.query(LoadBalancer).\
                 filter(LoadBalancer.tenantid == tenant_id).\
@@ -406,16 +444,18 @@ class NodesController(RestController):
                     "Cannot delete the primary node in a Galera load balancer"
                 )
 
+            node_id = node.id
             session.delete(node)
             device = session.query(
                 Device.id, Device.name
             ).join(LoadBalancer.devices).\
                 filter(LoadBalancer.id == self.lbid).\
                 first()
-            session.commit()
-            submit_job(
-                'UPDATE', device.name, device.id, self.lbid
+            queue_job(
+                session, 'PATCH', device.name,
+                {'deviceid': device.id, 'nodes': [node_id]}, self.lbid
             )
+            session.commit()
             return None
 
     @expose('json')
@@ -428,3 +468,160 @@ class NodesController(RestController):
         if nodeid:
             return NodesController(self.lbid, nodeid), remainder
         abort(404)
+
+
+class BulkNodesController(RestController):
+    """Functions for /loadbalancers/{load_balancer_id}/nodes/bulk routing"""
+    def __init__(self, lbid):
+        self.lbid = lbid
+
+    @wsme_pecan.wsexpose(LBNodeResp, body=LBNodeBulk, status_code=202)
+    def post(self, body=None):
+        """Add, change and remove nodes of the load balancer at once.
+
+        The changes are made in one transaction, all or none of them, and
+        sent to the device in a single job, so it is reloaded once.
+
+        :param load_balancer_id: id of lb
+        :param *args: holds the posted json or xml data, with a list of
+        nodes to add, a list of node ids with the condition or weight to
+        change, and a list of node ids to remove
+
+        Url:
+           POST /loadbalancers/{load_balancer_id}/nodes/bulk
+
+        Returns: dict of the added nodes
+        """
+        tenant_id = get_limited_to_project(request.headers)
+        if self.lbid is None:
+            raise ClientSideError('Load Balancer ID has not been supplied')
+
+        add = body.add if body.add != Unset else []
+        update = body.update if body.update != Unset else []
+        remove = body.remove if body.remove != Unset else []
+        if not (add or update or remove):
+            raise ClientSideError('No node changes have been supplied')
+
+        check_new_nodes(add)
+        for change in update:
+            if change.condition == Unset and change.weight == Unset:
+                raise ClientSideError(
+                    'Node {0} condition or weight is required'
+                    .format(change.id)
+                )
+            if change.weight != Unset and \
+                    (change.weight < 1 or change.weight > 256):
+                raise ClientSideError(
+                    'Node weight must be between 1 and 256'
+                )
+        changed_ids = [change.id for change in update] + list(remove)
+        if len(set(changed_ids)) != len(changed_ids):
+            raise ClientSideError(
+                'A node may only be updated or removed once'
+            )
+
+        nodelimit = get_limits().get('maxNodesPerLoadBalancer')
+        return self._apply(
+            tenant_id, add, update, remove, changed_ids, nodelimit
+        )
+
+    @retried
+    def _apply(self, tenant_id, add, update, remove, changed_ids,
+               nodelimit):
+        """ Make every node change in one transaction """
+        with db_session() as session:
+            load_balancer = session.query(LoadBalancer).\
+                filter(LoadBalancer.tenantid == tenant_id).\
+                filter(LoadBalancer.id == self.lbid).\
+                filter(LoadBalancer.status != 'DELETED').\
+                first()
+            if load_balancer is None:
+                session.rollback()
+                raise NotFound('Load Balancer not found')
+
+            if load_balancer.status in ImmutableStates:
+                session.rollback()
+                raise ImmutableEntity(
+                    'Cannot modify a Load Balancer in a non-ACTIVE state'
+                    ', current state: {0}'
+                    .format(load_balancer.status)
+                )
+
+            load_balancer.status = 'PENDING_UPDATE'
+
+            nodes = session.query(Node).\
+                filter(Node.lbid == self.lbid).\
+                all()
+            nodes = dict((node.id, node) for node in nodes)
+            for node_id in changed_ids:
+                if node_id not in nodes:
+                    session.rollback()
+                    raise NotFound(
+                        'Node {0} not found in supplied Load Balancer'
+                        .format(node_id)
+                    )
+
+            # One limit check for the whole batch
+            if len(nodes) - len(remove) + len(add) > nodelimit:
+                session.rollback()
+                raise OverLimit(
+                    'Command would exceed Load Balancer node limit'
+                )
+
+            for change in update:
+                node = nodes[change.id]
+                if change.condition == 'DISABLED':
+                    node.enabled = 0
+                    node.status = 'OFFLINE'
+                elif change.condition == 'ENABLED':
+                    node.enabled = 1
+                    node.status = 'ONLINE'
+                if change.weight != Unset:
+                    node.weight = change.weight
+            for node_id in remove:
+                session.delete(nodes.pop(node_id))
+
+            # Judge the load balancer as it will be after every change
+            added_backups = [
+                new.backup != Unset and new.backup == 'TRUE' for new in add
+            ]
+            enabled = len([old for old in nodes.values() if old.enabled])
+            enabled += len([new for new in add
+                            if new.condition != 'DISABLED'])
+            if not enabled:
+                session.rollback()
+                raise ClientSideError(
+                    'Cannot disable or delete every enabled node in a load '
+                    'balancer'
+                )
+            if load_balancer.protocol.lower() == 'galera':
+                primaries = len(
+                    [old for old in nodes.values() if not old.backup]
+                )
+                primaries += added_backups.count(False)
+                if primaries != 1:
+                    session.rollback()
+                    raise ClientSideError(
+                        'Galera load balancer must have exactly one primary '
+                        'node'
+                    )
+
+            return_data = LBNodeResp()
+            return_data.nodes = []
+            for node, is_backup in zip(add, added_backups):
+                return_data.nodes.append(
+                    add_node(session, self.lbid, node, is_backup)
+                )
+
+            device = session.query(
+                Device.id, Device.name
+            ).join(LoadBalancer.devices).\
+                filter(LoadBalancer.id == self.lbid).\
+                first()
+            node_ids = [node.id for node in return_data.nodes] + changed_ids
+            queue_job(
+                session, 'PATCH', device.name,
+                {'deviceid': device.id, 'nodes': node_ids}, self.lbid
+            )
+            session.commit()
+            return return_data
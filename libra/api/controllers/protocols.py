@@ -16,13 +16,15 @@
 from pecan import expose
 from pecan.rest import RestController
 from libra.common.api.lbaas import Ports, db_session
+from libra.api.library.response_cache import cached
 
 
 class ProtocolsController(RestController):
     @expose('json')
+    @cached('protocols')
     def get(self):
         protocols = []
-        with db_session() as session:
+        with db_session(readonly=True) as session:
             ports = session.query(Ports.protocol, Ports.portnum).\
                 filter(Ports.enabled == 1).all()
             for item in ports:
@@ -16,6 +16,7 @@
 from pecan import expose, response
 from v1 import V1Controller
 from libra.api.model.responses import Responses
+from libra.api.library.response_cache import cached
 
 
 class RootController(object):
@@ -41,6 +42,7 @@ class RootController(object):
         return Responses._default
 
     @expose('json')
+    @cached('versions')
     def index(self):
         response.status = 200
         return Responses.versions
@@ -18,17 +18,20 @@ from load_balancers import LoadBalancersController
 from limits import LimitsController
 from protocols import ProtocolsController
 from libra.api.model.responses import Responses
+from libra.api.library.response_cache import cached
 
 
 class V1Controller(object):
     """v1 control object."""
 
     @expose('json')
+    @cached('v1.1')
     def index(self):
         response.status = 200
         return Responses.versions
 
     @expose('json')
+    @cached('algorithms')
     def algorithms(self):
         """List all supported load balancing algorithms.
 
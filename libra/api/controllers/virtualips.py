@@ -42,7 +42,7 @@ class VipsController(RestController):
                 message="Bad Request",
                 details="Load Balancer ID not provided"
             )
-        with db_session() as session:
+        with db_session(readonly=True) as session:
             vip = session.query(
                 Vip.id, Vip.ip
             ).join(LoadBalancer.devices).\
@@ -0,0 +1,94 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Keep the in-memory caches of every API server in step.
+
+    A DELETE of /v1/caches on the admin API raises the number in the
+    cache_version table.  Every cache_check seconds each API server reads
+    it, drops its caches if it has gone up, and writes its cache counters
+    to its row in api_caches, which GET /v1/caches on the admin API
+    reports. """
+
+import json
+import os
+import socket
+
+from datetime import datetime, timedelta
+
+import eventlet
+from pecan import conf
+
+from libra.api.library.limits import get_limits
+from libra.api.library.response_cache import get_response_cache
+from libra.common.api.lbaas import ApiCaches, CacheVersion, db_session
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+# Rows of API servers which have not reported for this long are removed
+STALE_AFTER = timedelta(days=1)
+
+
+def cache_stats():
+    """ The counters of each in-memory cache in this server """
+    return {'limits': get_limits().stats(),
+            'responses': get_response_cache().stats()}
+
+
+def invalidate_caches():
+    """ Drop everything kept in memory in this server """
+    get_limits().invalidate()
+    get_response_cache().invalidate()
+
+
+class CacheSync(object):
+    def __init__(self):
+        self.name = '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        self.interval = getattr(conf, 'cache_check', 10)
+        self.version = None
+        self.running = True
+        eventlet.spawn_n(self.run)
+
+    def shutdown(self):
+        self.running = False
+
+    def run(self):
+        while self.running:
+            try:
+                self.check()
+            except Exception:
+                LOG.exception('Exception occurred checking the cache version')
+            eventlet.sleep(self.interval)
+
+    def check(self):
+        """ Drop the caches if the version has been raised since the last
+            check, and report the counters """
+        with db_session() as session:
+            version = session.query(CacheVersion.version).\
+                filter(CacheVersion.id == 1).scalar() or 0
+            if self.version is not None and version != self.version:
+                LOG.info('Cache version is now {0}, dropping the caches'
+                         .format(version))
+                invalidate_caches()
+            self.version = version
+            now = datetime.now()
+            session.merge(ApiCaches(
+                name=self.name, version=version,
+                stats=json.dumps(cache_stats()), updated=now
+            ))
+            session.query(ApiCaches).\
+                filter(ApiCaches.updated < now - STALE_AFTER).\
+                delete(synchronize_session=False)
+            session.commit()
@@ -0,0 +1,131 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Conditional GETs of a load balancer, its nodes and its health monitor.
+
+    The entity tag of all three is a digest of the load balancer's version
+    and updated time and the configuration version of its device, read
+    with one primary key lookup.  Every ORM change to the load balancer row
+    raises its version, and changing a node or the monitor either changes
+    the load balancer's status or raises its version directly (see the
+    ping scheduler and the monitor delete).  The configuration version
+    moves on with every UPDATE or PATCH sent to the device.  A GET whose
+    If-None-Match has the tag is answered 304 Not Modified before the full
+    response is built.
+
+    The size of each tagged response is remembered so a 304 can count the
+    bytes it saved, and a summary is logged every REPORT_EVERY conditional
+    GETs. """
+
+import hashlib
+
+from pecan import request, response
+from webob.exc import HTTPNotModified
+
+from libra.common.api.lbaas import Device, LoadBalancer
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+REPORT_EVERY = 1000
+# Response sizes remembered, forgotten all at once when full
+MAX_SIZES = 10000
+
+_etags = None
+
+
+def get_etags():
+    """ Return the process-wide conditional GET counters, creating them if
+        needed """
+    global _etags
+    if _etags is None:
+        _etags = ETags()
+    return _etags
+
+
+def lb_etag(session, tenant_id, lbid):
+    """ The entity tag of a load balancer and its nodes and monitor, or
+        None if the tenant has no such load balancer """
+    lb = session.query(
+        LoadBalancer.version, LoadBalancer.updated, Device.configVersion
+    ).outerjoin(LoadBalancer.devices).\
+        filter(LoadBalancer.tenantid == tenant_id).\
+        filter(LoadBalancer.id == lbid).\
+        filter(LoadBalancer.status != 'DELETED').\
+        first()
+    if lb is None:
+        return None
+    state = (lbid, lb.version, str(lb.updated), lb.configVersion)
+    return '"{0}"'.format(hashlib.md5(repr(state)).hexdigest())
+
+
+def not_modified(session, tenant_id, lbid):
+    """ Tag the response with the load balancer's entity tag.  Returns the
+        304 response to send if the request's If-None-Match has the tag,
+        otherwise None and the caller builds the response as usual. """
+    etag = lb_etag(session, tenant_id, lbid)
+    if etag is None:
+        # Let the caller give its own 404
+        return None
+    etags = get_etags()
+    if etag.strip('"') in request.if_none_match:
+        etags.hit(request.path, etag)
+        return HTTPNotModified(headers={'ETag': etag})
+    if request.if_none_match:
+        etags.miss()
+    response.headers['ETag'] = etag
+    return None
+
+
+class ETags(object):
+    """ Conditional GETs answered 304 ('hits'), those which had to send the
+        response ('misses') and the bytes of response body the hits did
+        not send ('saved') """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0
+        self.sizes = {}
+
+    def sent(self, path, etag, size):
+        """ Remember the size of a tagged response body """
+        if len(self.sizes) >= MAX_SIZES:
+            self.sizes.clear()
+        self.sizes[(path, etag)] = size
+
+    def hit(self, path, etag):
+        self.hits += 1
+        self.saved += self.sizes.get((path, etag), 0)
+        self._report()
+
+    def miss(self):
+        self.misses += 1
+        self._report()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'saved': self.saved}
+
+    def _report(self):
+        total = self.hits + self.misses
+        if total % REPORT_EVERY == 0:
+            LOG.info(
+                'Conditional GETs: {0} not modified, {1} modified ({2:.1%} '
+                'hit ratio), {3} response bytes saved'.format(
+                    self.hits, self.misses, float(self.hits) / total,
+                    self.saved
+                )
+            )
@@ -12,18 +12,94 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+""" Check backend node addresses against the ip_filters option.
+
+    The filters are parsed once into a table per IP version of the address
+    ranges they allow, overlapping and adjacent ranges merged and sorted by
+    their first address, so an address is checked with one bisect of the
+    table however many filters there are.  The table is kept until the
+    filters given change. """
+
+import bisect
+
 import ipaddress
 from libra.api.library.exp import IPOutOfRange
 
 
+_filter = None
+
+
+def get_ip_filter(masks):
+    """ Return the compiled filter for masks, compiling it if masks are not
+        the ones last compiled """
+    global _filter
+    masks = list(masks or [])
+    if _filter is None or _filter.masks != masks:
+        _filter = IPFilter(masks)
+    return _filter
+
+
 def ipfilter(address, masks):
-    address = ipaddress.IPv4Address(address)
-    if masks and len(masks) > 0:
-        in_mask = False
-        for mask in masks:
-            if address in ipaddress.IPv4Network(unicode(mask), True):
-                in_mask = True
-                break
-        if not in_mask:
+    """ The address in standard form if masks allow it, raising
+        IPOutOfRange if not """
+    return get_ip_filter(masks).check(address)
+
+
+class IPFilter(object):
+    """ The address ranges allowed by a list of IPv4 and IPv6 networks in
+        the form address/prefix.  No networks allows every address. """
+
+    def __init__(self, masks):
+        self.masks = list(masks)
+        ranges = {4: [], 6: []}
+        for mask in self.masks:
+            network = ipaddress.ip_network(unicode(mask).strip(), True)
+            ranges[network.version].append((
+                int(network.network_address),
+                int(network.broadcast_address)
+            ))
+        # version: ([first address], [last address]) of disjoint ranges
+        self.tables = {}
+        for version, found in ranges.items():
+            firsts = []
+            lasts = []
+            for first, last in sorted(found):
+                if lasts and first <= lasts[-1] + 1:
+                    lasts[-1] = max(lasts[-1], last)
+                else:
+                    firsts.append(first)
+                    lasts.append(last)
+            self.tables[version] = (firsts, lasts)
+
+    def allows(self, address):
+        """ True if the ipaddress address is in one of the ranges """
+        if not self.masks:
+            return True
+        firsts, lasts = self.tables[address.version]
+        value = int(address)
+        i = bisect.bisect_right(firsts, value) - 1
+        return i >= 0 and value <= lasts[i]
+
+    def check(self, address):
+        """ The address in standard form, raising ValueError if it is not an
+            IP address and IPOutOfRange if it is not allowed """
+        parsed = ipaddress.ip_address(unicode(address))
+        if not self.allows(parsed):
             raise IPOutOfRange('IP Address not in mask')
-    return str(address)
+        return str(parsed)
+
+    def check_all(self, addresses):
+        """ Every address in standard form, in the same order.  The first
+            which is not an IP address raises ValueError and the first
+            which is not allowed raises IPOutOfRange, either with the
+            address as its argument. """
+        checked = []
+        for address in addresses:
+            try:
+                parsed = ipaddress.ip_address(unicode(address))
+            except ValueError:
+                raise ValueError(address)
+            if not self.allows(parsed):
+                raise IPOutOfRange(address)
+            checked.append(str(parsed))
+        return checked
@@ -0,0 +1,100 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" The global and per-tenant limits, kept in memory.
+
+    Both tables are small and rarely change, so they are read whole at most
+    once every limits_ttl seconds and every limit lookup in between is
+    served from memory.  After changing a limit send a DELETE to
+    /v1/caches on the admin API, or the API servers a SIGHUP, to have them
+    read the tables again on their next lookup (see
+    libra.api.library.cache_sync). """
+
+import time
+
+from pecan import conf
+
+from libra.common.api.lbaas import Limits, TenantLimits, db_session
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+_limits = None
+
+
+def get_limits():
+    """ Return the process-wide limits cache, creating it if needed """
+    global _limits
+    if _limits is None:
+        _limits = LimitsCache(getattr(conf, 'limits_ttl', 300))
+    return _limits
+
+
+class LimitsCache(object):
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.loaded = None
+        self.limits = {}
+        self.tenants = {}
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        """ Read the tables again on the next lookup """
+        self.loaded = None
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'limits': len(self.limits), 'tenants': len(self.tenants)}
+
+    def _load(self):
+        with db_session(readonly=True) as session:
+            limits = dict(session.query(Limits.name, Limits.value).all())
+            tenants = dict(
+                session.query(TenantLimits.tenantid,
+                              TenantLimits.loadbalancers).all()
+            )
+            session.rollback()
+        self.limits = limits
+        self.tenants = tenants
+        self.loaded = time.time()
+        LOG.info(
+            'Loaded {0} limits and {1} tenant limits, {2} hits and {3} '
+            'misses so far'.format(
+                len(limits), len(tenants), self.hits, self.misses
+            )
+        )
+
+    def _fresh(self):
+        if self.loaded is None or time.time() - self.loaded >= self.ttl:
+            self.misses += 1
+            self._load()
+        else:
+            self.hits += 1
+
+    def get(self, name):
+        """ The global value of one limit """
+        self._fresh()
+        return self.limits.get(name)
+
+    def for_tenant(self, tenant_id):
+        """ All the limits as they apply to a tenant.  A per-tenant load
+            balancer limit replaces the global one when set. """
+        self._fresh()
+        limits = dict(self.limits)
+        tenant_lblimit = self.tenants.get(tenant_id)
+        if tenant_lblimit:
+            limits['maxLoadBalancers'] = tenant_lblimit
+        return limits
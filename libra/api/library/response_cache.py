@@ -0,0 +1,116 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Rendered responses of the endpoints which rarely change.
+
+    The version documents, algorithms, protocols and limits are fetched by
+    every client when it starts.  A GET of one of these decorated with
+    cached is answered with the JSON body rendered for the last one,
+    without touching the database, for up to response_ttl seconds.  The
+    limits differ between tenants so they are kept per tenant.  Everything
+    kept is dropped along with the limits by a DELETE of /v1/caches on the
+    admin API or a SIGHUP (see libra.api.library.cache_sync). """
+
+import functools
+import json
+import time
+
+from pecan import conf, request, response
+
+from libra.api.acl import get_limited_to_project
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+# Responses kept before the expired ones are dropped
+MAX_ENTRIES = 10000
+
+_cache = None
+
+
+def get_response_cache():
+    """ Return the process-wide response cache, creating it if needed """
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(getattr(conf, 'response_ttl', 300))
+    return _cache
+
+
+def cached(name, per_tenant=False):
+    """ Decorator for a JSON GET method taking no arguments, inside its
+        expose, keeping its response under name and the tenant if
+        per_tenant is set """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(self):
+            key = name
+            if per_tenant:
+                key = (name, get_limited_to_project(request.headers))
+            cache = get_response_cache()
+            body = cache.get(key)
+            if body is None:
+                result = func(self)
+                if response.status_int != 200:
+                    return result
+                body = json.dumps(result)
+                cache.put(key, body)
+            response.content_type = 'application/json'
+            response.body = body
+            return response
+        return wrapper
+    return decorate
+
+
+class ResponseCache(object):
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.bodies = {}
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        """ Drop every response kept """
+        self.bodies = {}
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.bodies)}
+
+    def get(self, key):
+        """ The body kept under key, None if there is none or it is older
+            than the TTL """
+        found = self.bodies.get(key)
+        if found is None or time.time() - found[0] >= self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return found[1]
+
+    def put(self, key, body):
+        if self.ttl <= 0:
+            return
+        now = time.time()
+        if len(self.bodies) >= MAX_ENTRIES:
+            self.bodies = dict(
+                (k, v) for k, v in self.bodies.items()
+                if now - v[0] < self.ttl
+            )
+            LOG.info(
+                'Response cache full, {0} responses still fresh, {1} hits '
+                'and {2} misses so far'.format(
+                    len(self.bodies), self.hits, self.misses
+                )
+            )
+        self.bodies[key] = (now, body)
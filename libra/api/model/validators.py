@@ -55,6 +55,18 @@ class LBNodeResp(Base):
     nodes = wsattr(['NodeResp'])
 
 
+class LBNodeChange(Base):
+    id = wsattr(int, mandatory=True)
+    condition = Enum(wtypes.text, 'ENABLED', 'DISABLED')
+    weight = int
+
+
+class LBNodeBulk(Base):
+    add = wsattr(['LBNode'])
+    update = wsattr(['LBNodeChange'])
+    remove = wsattr([int])
+
+
 class LBVip(Base):
     id = wsattr(int, mandatory=True)
 
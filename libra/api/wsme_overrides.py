@@ -24,8 +24,10 @@ import wsme.rest.json
 import wsme.rest.xml
 import wsmeext.pecan
 import pecan
+import webob
 from libra.api.library.exp import OverLimit, NotFound, NotAuthorized
 from libra.api.library.exp import ImmutableEntity
+from libra.api.library.etags import get_etags
 from libra.openstack.common import log
 from libra.common.exc import DetailError
 from wsme.rest.json import tojson
@@ -101,6 +103,9 @@ def wsexpose(*args, **kwargs):
                 if funcdef.pass_request:
                     kwargs[funcdef.pass_request] = pecan.request
                 result = f(self, *args, **kwargs)
+                # A ready made response such as 304 Not Modified
+                if isinstance(result, webob.Response):
+                    return result
 
                 # NOTE: Support setting of status_code with default 201
                 pecan.response.status = funcdef.status_code
@@ -109,6 +114,8 @@ def wsexpose(*args, **kwargs):
                     result = result.obj
 
             except:
+                # An error is not the tagged entity
+                pecan.response.headers.pop('ETag', None)
                 data = wsme.api.format_exception(
                     sys.exc_info(),
                     pecan.conf.get('wsme', {}).get('debug', False)
@@ -151,9 +158,13 @@ class JSonRenderer(object):
     def render(self, template_path, namespace):
         if 'message' in namespace:
             return wsme.rest.json.encode_error(None, namespace)
-        return wsme.rest.json.encode_result(
+        body = wsme.rest.json.encode_result(
             namespace['result'],
             namespace['datatype']
         )
+        etag = pecan.response.headers.get('ETag')
+        if etag:
+            get_etags().sent(pecan.request.path, etag, len(body))
+        return body
 
 pecan.templating._builtin_renderers['wsmejson'] = JSonRenderer
@@ -0,0 +1,136 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Take free devices from the pool.
+
+    A free device is OFFLINE, has never failed a ping and has no load
+    balancer.  Locking the first one with SELECT ... FOR UPDATE makes
+    concurrent creates queue on the same row, and InnoDB locks every row
+    the scan passes on the way.
+
+    Where the server has SKIP LOCKED (MySQL 8.0.1 and MariaDB 10.6 on) the
+    first free device no other transaction has locked is locked and
+    claimed, so concurrent claims never wait for each other.  Otherwise a
+    few free devices are read without locks and one of them, picked at
+    random, is claimed with an UPDATE of that row only which matches only
+    if it is still free.  Concurrent claims almost always pick different
+    devices, one which loses the race matches no row and moves on to the
+    next candidate, but it does wait for the winner's transaction to end
+    to find that out.
+
+    The claim is part of the caller's transaction, so it is undone if that
+    rolls back.  Row locks are only taken on the Galera node they are made
+    on and every API server writes to the same node (see RoutingSession),
+    so two claims of one device only meet in certification after a write
+    failover.  The loser is then replayed by libra.common.api.retry. """
+
+import random
+
+from libra.common.api.lbaas import Device, loadbalancers_devices
+
+
+# Free devices read per attempt, the more there are the less likely two
+# concurrent claims pick the same one
+CANDIDATES = 16
+
+
+def free_devices(session, az=None):
+    """ A query for the IDs of free devices, in az if it is given """
+    query = session.query(Device.id).\
+        filter(~Device.id.in_(
+            session.query(loadbalancers_devices.c.device)
+        )).\
+        filter(Device.status == 'OFFLINE').\
+        filter(Device.pingCount == 0)
+    if az is not None:
+        query = query.filter(Device.az == az)
+    return query
+
+
+# The first free device nobody else has locked, locked for this transaction
+SKIP_LOCKED = (
+    'SELECT devices.id FROM devices '
+    'WHERE devices.status = \'OFFLINE\' AND devices.`pingCount` = 0 '
+    '{0}AND devices.id NOT IN (SELECT device FROM loadbalancers_devices) '
+    'ORDER BY devices.id LIMIT 1 FOR UPDATE SKIP LOCKED'
+)
+
+
+def has_skip_locked(dialect):
+    """ Whether the database server supports SELECT ... SKIP LOCKED """
+    if dialect.name != 'mysql':
+        return False
+    version = dialect.server_version_info or ()
+    numbers = tuple(part for part in version if isinstance(part, int))
+    if any('mariadb' in str(part).lower() for part in version):
+        # MariaDB 10 may report itself as 5.5.5-10.x
+        if numbers[:3] == (5, 5, 5):
+            numbers = numbers[3:]
+        return numbers >= (10, 6)
+    return numbers >= (8, 0, 1)
+
+
+def _lock_free_device(session, az):
+    """ Lock and return the ID of a free device, skipping locked ones """
+    if az is None:
+        row = session.execute(SKIP_LOCKED.format('')).first()
+    else:
+        row = session.execute(
+            SKIP_LOCKED.format('AND devices.az = :az '), {'az': az}
+        ).first()
+    return row and row[0]
+
+
+def claim_device(session, status, az=None):
+    """ Claim a free device by setting its status, preferring one in az if
+        az is given.  Returns the device, or None if none are free. """
+    zones = [None] if az is None else [az, None]
+    if has_skip_locked(session.connection().dialect):
+        for zone in zones:
+            device_id = _lock_free_device(session, zone)
+            if device_id is not None:
+                session.query(Device).\
+                    filter(Device.id == device_id).\
+                    update({Device.status: status,
+                            Device.version: Device.version + 1},
+                           synchronize_session=False)
+                return session.query(Device).populate_existing().\
+                    filter(Device.id == device_id).one()
+        return None
+
+    tried = []
+    for zone in zones:
+        while True:
+            query = free_devices(session, zone)
+            if tried:
+                # A device claimed since this transaction started still
+                # looks free to it
+                query = query.filter(~Device.id.in_(tried))
+            candidates = [row.id for row in query.limit(CANDIDATES)]
+            if not candidates:
+                break
+            random.shuffle(candidates)
+            for device_id in candidates:
+                claimed = session.query(Device).\
+                    filter(Device.id == device_id).\
+                    filter(Device.status == 'OFFLINE').\
+                    filter(Device.pingCount == 0).\
+                    update({Device.status: status,
+                            Device.version: Device.version + 1},
+                           synchronize_session=False)
+                if claimed:
+                    return session.query(Device).populate_existing().\
+                        filter(Device.id == device_id).one()
+                tried.append(device_id)
+    return None
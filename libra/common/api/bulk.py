@@ -0,0 +1,56 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import time
+
+
+class BulkInsert(object):
+    """ Collect rows for one table and insert them in chunks.
+
+        Each chunk is a single Core insert given a list of rows, which the
+        driver sends as one executemany instead of the statement per object
+        the ORM would make.  The chunks all go in the session's transaction,
+        commit or roll back afterwards as usual. """
+
+    def __init__(self, table, chunk_size=1000):
+        self.table = table
+        self.chunk_size = chunk_size
+        self.rows = []
+        self.inserted = 0
+        self.seconds = 0.0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, **row):
+        self.rows.append(row)
+
+    def flush(self, session):
+        """ Insert the rows collected so far, returning how many """
+        count = len(self.rows)
+        start = time.time()
+        for first in xrange(0, count, self.chunk_size):
+            session.execute(
+                self.table.insert(), self.rows[first:first + self.chunk_size]
+            )
+        self.seconds += time.time() - start
+        self.inserted += count
+        self.rows = []
+        return count
+
+    def rate(self):
+        """ Rows inserted per second by flush() """
+        if not self.seconds:
+            return 0
+        return self.inserted / self.seconds
@@ -0,0 +1,110 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import time
+
+import eventlet
+from pecan import conf
+
+from libra.common.api.gearman_pool import get_pool
+from libra.common.json_gearman import codec_names, encode, job_priority
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+_negotiator = None
+
+
+def get_negotiator():
+    """ Return the process-wide codec negotiator, creating it if needed """
+    global _negotiator
+    if _negotiator is None:
+        _negotiator = CodecNegotiator(
+            conf.gearman.codec, conf.gearman.job_timeout_min
+        )
+    return _negotiator
+
+
+def encode_for(host, message):
+    """ Encode a message for a worker with the best codec it supports """
+    return encode(message, get_negotiator().codec_for(host))
+
+
+class CodecNegotiator(object):
+    """ Work out which message codec to use with each worker.
+
+        Workers list the codecs they understand in their DISCOVER response,
+        older ones do not list any and only get plain JSON.  Until a worker
+        has answered, plain JSON is used and a DISCOVER is sent to it in the
+        background.  The answer is kept for an hour so upgraded workers are
+        picked up, or a minute if the worker did not answer. """
+
+    ttl = 3600
+    retry = 60
+
+    def __init__(self, preferred, timeout):
+        self.preferred = preferred
+        self.timeout = timeout
+        self.codecs = {}
+        self.pending = set()
+        if preferred != 'json' and preferred not in codec_names():
+            LOG.error(
+                'Gearman codec {0} is not available, using json'
+                .format(preferred)
+            )
+            self.preferred = 'json'
+
+    def codec_for(self, host):
+        if self.preferred == 'json':
+            return 'json'
+        known = self.codecs.get(host)
+        if known is not None and known[1] > time.time():
+            return known[0]
+        if host not in self.pending:
+            self.pending.add(host)
+            eventlet.spawn_n(self._discover, host)
+        if known is not None:
+            return known[0]
+        return 'json'
+
+    def _discover(self, host):
+        codec = 'json'
+        expires = time.time() + self.retry
+        try:
+            pool = get_pool()
+            client = pool.get()
+            try:
+                message = {'hpcs_action': 'DISCOVER'}
+                job_status = client.submit_job(
+                    host, message, priority=job_priority(message),
+                    background=False, wait_until_complete=True,
+                    poll_timeout=self.timeout
+                )
+            except Exception:
+                pool.discard(client)
+                raise
+            pool.put(client)
+            if job_status.complete and not job_status.timed_out:
+                expires = time.time() + self.ttl
+                if self.preferred in job_status.result.get('codecs', []):
+                    codec = self.preferred
+                LOG.info(
+                    'Using {0} codec for worker {1}'.format(codec, host)
+                )
+        except Exception:
+            LOG.exception('DISCOVER to {0} failed'.format(host))
+        finally:
+            self.codecs[host] = (codec, expires)
+            self.pending.discard(host)
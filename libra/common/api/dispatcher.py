@@ -0,0 +1,265 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import time
+
+import eventlet
+from eventlet import semaphore
+
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+
+class UpdateCoalescer(object):
+    """ Merge UPDATE requests for the same device into a single job.
+
+        An UPDATE always sends the complete device configuration read from
+        the DB at send time, so any number of UPDATEs queued for a device
+        can be replaced by one sent after the last of them.  The first
+        request for a device starts a window; every further request for that
+        device pushes the send back by another window, up to max_windows
+        windows after the first request so a busy device still gets updated.
+
+        dispatch is called as dispatch(host, device_id, lbids, outbox_ids,
+        traces) with the IDs of every load balancer that asked for the
+        update, of every outbox job that is covered by it and the trace of
+        each request. """
+
+    job_type = 'UPDATE'
+
+    def __init__(self, window, dispatch, max_windows=5):
+        self.window = window
+        self.max_delay = window * max_windows
+        self.dispatch = dispatch
+        self.pending = {}
+        self.requested = 0
+        self.sent = 0
+
+    def add(self, host, device_id, lbid, outbox_ids=None, trace=None):
+        self._add(device_id, host, device_id, lbid, outbox_ids, trace)
+
+    def stats(self):
+        return {
+            'pending': len(self.pending),
+            'requested': self.requested,
+            'sent': self.sent
+        }
+
+    def _merge(self, entry, data):
+        """ Add a later request's data to the pending entry's """
+        # The UPDATE reads everything it needs at send time
+        pass
+
+    def _add(self, key, host, data, lbid, outbox_ids, trace):
+        self.requested += 1
+        outbox_ids = outbox_ids or []
+        traces = [trace] if trace is not None else []
+        if self.window <= 0:
+            self._send(host, data, [lbid], outbox_ids, traces)
+            return
+
+        now = time.time()
+        entry = self.pending.get(key)
+        if entry is None:
+            self.pending[key] = {
+                'host': host,
+                'data': data,
+                'lbids': [lbid],
+                'outbox_ids': list(outbox_ids),
+                'traces': traces,
+                'deadline': now + self.window,
+                'last_deadline': now + self.max_delay
+            }
+            eventlet.spawn_n(self._wait, key)
+            return
+
+        self._merge(entry, data)
+        if lbid not in entry['lbids']:
+            entry['lbids'].append(lbid)
+        entry['outbox_ids'].extend(outbox_ids)
+        entry['traces'].extend(traces)
+        entry['deadline'] = min(now + self.window, entry['last_deadline'])
+
+    def _wait(self, key):
+        while True:
+            delay = self.pending[key]['deadline'] - time.time()
+            if delay <= 0:
+                break
+            eventlet.sleep(delay)
+        entry = self.pending.pop(key)
+        if len(entry['traces']) > 1:
+            LOG.info(
+                'Coalesced {0} {1} for {2} on behalf of load balancers {3}'
+                .format(len(entry['traces']), self.job_type, key,
+                        entry['lbids'])
+            )
+        self._send(
+            entry['host'], entry['data'], entry['lbids'],
+            entry['outbox_ids'], entry['traces']
+        )
+
+    def _send(self, host, data, lbids, outbox_ids, traces):
+        self.sent += 1
+        try:
+            self.dispatch(host, data, lbids, outbox_ids, traces)
+        except Exception:
+            LOG.exception('Failed to dispatch {0} for {1}'
+                          .format(self.job_type, host))
+
+
+class PatchCoalescer(UpdateCoalescer):
+    """ Merge PATCH requests for the same load balancer into a single job.
+
+        A PATCH names the nodes which changed and reads them from the DB at
+        send time, so PATCHes queued for a load balancer can be replaced by
+        one naming all their nodes, and the device reloads once.  Timing is
+        as for UpdateCoalescer.
+
+        dispatch is called as dispatch(host, data, lbids, outbox_ids,
+        traces) where data is the PATCH job data with the merged node
+        IDs and lbids holds the one load balancer. """
+
+    job_type = 'PATCH'
+
+    def add(self, host, data, lbid, outbox_ids=None, trace=None):
+        data = {'deviceid': data['deviceid'], 'nodes': list(data['nodes'])}
+        self._add(
+            (data['deviceid'], lbid), host, data, lbid, outbox_ids, trace
+        )
+
+    def _merge(self, entry, data):
+        nodes = entry['data']['nodes']
+        for node_id in data['nodes']:
+            if node_id not in nodes:
+                nodes.append(node_id)
+
+
+class JobDispatcher(object):
+    """ Run Gearman jobs on a bounded pool of greenthreads.
+
+        Jobs wait in one of two lanes and the HIGH lane is always served
+        first, so user facing changes are not stuck behind housekeeping.
+        Jobs for the same device never run at the same time; later ones are
+        held back, in order, until the running one finishes.
+
+        At most queue_size jobs can be waiting.  Beyond that submit() blocks
+        the caller until a job starts, unless block is False, in which case
+        the job is queued regardless.  Jobs submitted by a running job must
+        not block, or every worker could end up waiting for itself. """
+
+    HIGH = 0
+    LOW = 1
+
+    def __init__(self, size, queue_size):
+        self.pool = eventlet.GreenPool(size)
+        self.lanes = (collections.deque(), collections.deque())
+        self.slots = semaphore.Semaphore(queue_size)
+        self.busy = set()
+        self.held = {}
+        self.queued = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.full = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def submit(self, lane, key, func, *args, **kwargs):
+        block = kwargs.pop('block', True)
+        if block:
+            if not self.slots.acquire(blocking=False):
+                self.full += 1
+                LOG.warning(
+                    'Gearman job queue full, waiting: {0}'
+                    .format(self.stats())
+                )
+                self.slots.acquire()
+            limited = True
+        else:
+            limited = self.slots.acquire(blocking=False)
+            if not limited:
+                self.full += 1
+
+        self.submitted += 1
+        self.queued += 1
+        job = (lane, key, func, args, time.time(), limited)
+        if key in self.busy:
+            self.held.setdefault(key, collections.deque()).append(job)
+        else:
+            self.busy.add(key)
+            self.lanes[lane].append(job)
+            if self.pool.free():
+                self.pool.spawn_n(self._run)
+
+    def stats(self):
+        """ Queue and worker counters for logging and monitoring """
+        started = self.submitted - self.queued
+        if started:
+            wait_avg = self.wait_total / started
+        else:
+            wait_avg = 0.0
+        return {
+            'queued': self.queued,
+            'queued_high': len(self.lanes[self.HIGH]),
+            'queued_low': len(self.lanes[self.LOW]),
+            'held': sum(len(jobs) for jobs in self.held.values()),
+            'busy_keys': len(self.busy),
+            'in_flight': self.pool.running(),
+            'full': self.full,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'wait_avg': round(wait_avg, 3),
+            'wait_max': round(self.wait_max, 3)
+        }
+
+    def _next(self):
+        for lane in self.lanes:
+            if lane:
+                return lane.popleft()
+        return None
+
+    def _run(self):
+        # Keep taking jobs until the lanes are empty, a new greenthread is
+        # only started when a job is submitted and a worker is free
+        job = self._next()
+        while job is not None:
+            lane, key, func, args, queued_at, limited = job
+            self.queued -= 1
+            if limited:
+                self.slots.release()
+            waited = time.time() - queued_at
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            try:
+                func(*args)
+                self.completed += 1
+            except Exception:
+                self.failed += 1
+                LOG.exception('Gearman job for {0} failed'.format(key))
+            self._release(key)
+            job = self._next()
+
+    def _release(self, key):
+        held = self.held.get(key)
+        if held:
+            job = held.popleft()
+            if not held:
+                del self.held[key]
+            self.lanes[job[0]].append(job)
+        else:
+            self.busy.discard(key)
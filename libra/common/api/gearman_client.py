@@ -15,11 +15,22 @@
 import eventlet
 eventlet.monkey_patch()
 import ipaddress
-from libra.common.json_gearman import JSONGearmanClient
+import time
 from libra.common.api.lbaas import LoadBalancer, db_session, Device, Node, Vip
 from libra.common.api.lbaas import HealthMonitor
 from libra.common.api.lbaas import loadbalancers_devices
+from libra.common.api.codec import encode_for
+from libra.common.api.dispatcher import JobDispatcher, PatchCoalescer, \
+    UpdateCoalescer
+from libra.common.api.gearman_pool import get_pool
 from libra.common.api.mnb import update_mnb
+from libra.common.api.outbox import job_done, job_started
+from libra.common.api.payload import device_loadbalancers, build_update
+from libra.common.api.payload import build_patch, next_version
+from libra.common.api.retry import retried
+from libra.common.api.timeouts import backoff, get_breaker, get_tracker
+from libra.common import tracing
+from libra.common.json_gearman import job_priority, job_unique
 from libra.openstack.common import log
 from pecan import conf
 
@@ -29,6 +40,7 @@ LOG = log.getLogger(__name__)
 
 gearman_workers = [
     'UPDATE',  # Create/Update a Load Balancer.
+    'PATCH',  # Apply node changes to a Load Balancer.
     'SUSPEND',  # Suspend a Load Balancer.
     'ENABLE',  # Enable a suspended Load Balancer.
     'DELETE',  # Delete a Load Balancer.
@@ -39,26 +51,159 @@ gearman_workers = [
 ]
 
 
-def submit_job(job_type, host, data, lbid):
-    eventlet.spawn_n(client_job, job_type, str(host), data, lbid)
+# Housekeeping jobs, anything else goes in the HIGH lane.  ASSIGN moves a
+# floating IP onto a new or failed over device and a load balancer is
+# unreachable until it runs, so it is not housekeeping.
+_low_priority_jobs = ['ARCHIVE', 'REMOVE']
+
+# Worker actions that are safe to send again after a time out
+_retry_actions = ['UPDATE', 'DELETE']
+
+_coalescer = None
+_patch_coalescer = None
+_dispatcher = None
+
+
+def submit_job(job_type, host, data, lbid, outbox_ids=None):
+    """ Send a job now, outbox_ids are the job_outbox rows to remove once
+        it has run.  API requests should use outbox.queue_job() instead. """
+    trace = tracing.Trace(job=job_type, device=str(host), lbid=lbid)
+    if job_type == 'UPDATE':
+        # UPDATEs for the same device are merged, data is the device ID
+        trace.open('coalesce')
+        _get_coalescer().add(str(host), data, lbid, outbox_ids, trace)
+    elif job_type == 'PATCH':
+        # PATCHes for the same load balancer are merged into one naming all
+        # their nodes
+        trace.open('coalesce')
+        _get_patch_coalescer().add(str(host), data, lbid, outbox_ids, trace)
+    else:
+        _dispatch(
+            job_type, str(host), data, lbid, outbox_ids=outbox_ids,
+            trace=trace
+        )
+
+
+def get_dispatch_stats():
+    """ Queue counters of the job dispatcher and the UPDATE and PATCH
+        coalescers in this server """
+    stats = _get_dispatcher().stats()
+    stats['updates'] = _get_coalescer().stats()
+    stats['patches'] = _get_patch_coalescer().stats()
+    return stats
+
+
+def _get_coalescer():
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = UpdateCoalescer(
+            conf.gearman.update_window, _dispatch_update
+        )
+    return _coalescer
+
+
+def _get_patch_coalescer():
+    global _patch_coalescer
+    if _patch_coalescer is None:
+        _patch_coalescer = PatchCoalescer(
+            conf.gearman.update_window, _dispatch_patch
+        )
+    return _patch_coalescer
+
+
+def _get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = JobDispatcher(
+            conf.gearman.dispatch_workers, conf.gearman.dispatch_queue
+        )
+    return _dispatcher
+
+
+def _dispatch_update(host, device_id, lbids, outbox_ids, traces):
+    _dispatch(
+        'UPDATE', host, device_id, lbids, outbox_ids=outbox_ids,
+        trace=_merge_traces(traces)
+    )
+
+
+def _dispatch_patch(host, data, lbids, outbox_ids, traces):
+    # A PATCH is only ever merged with others for the same load balancer
+    _dispatch(
+        'PATCH', host, data, lbids[0], outbox_ids=outbox_ids,
+        trace=_merge_traces(traces)
+    )
+
+
+def _merge_traces(traces):
+    # The merged job carries on the first request's trace, the others end
+    # here and say which trace to follow
+    trace = None
+    for merged in traces:
+        if trace is None:
+            trace = merged
+            merged.close('coalesce', merged=len(traces))
+        else:
+            merged.close('coalesce', merged_into=trace.id)
+    return trace
+
+
+def _dispatch(job_type, host, data, lbid, key=None, block=True,
+              outbox_ids=None, trace=None):
+    if job_type in _low_priority_jobs:
+        lane = JobDispatcher.LOW
+    else:
+        lane = JobDispatcher.HIGH
+    if trace is None:
+        # Jobs started by another job are part of its trace
+        parent = tracing.current()
+        trace = tracing.Trace(
+            parent and parent.id, job=job_type, device=host, lbid=lbid
+        )
+    trace.open('queue')
+    _get_dispatcher().submit(
+        lane, key or host, client_job, job_type, host, data, lbid,
+        outbox_ids, trace, block=block
+    )
 
 
 def submit_vip_job(job_type, device, vip):
-    eventlet.spawn_n(
-        client_job, job_type, "libra_pool_mgm", device, vip
+    # Serialise with other jobs for the device, or with other jobs for the
+    # IP when it is being removed.  These are also submitted by running jobs
+    # so must not block on a full queue.
+    _dispatch(
+        job_type, "libra_pool_mgm", device, vip,
+        key=device or vip, block=False
     )
 
 
-def client_job(job_type, host, data, lbid):
+def client_job(job_type, host, data, lbid, outbox_ids=None, trace=None):
+    if trace is None:
+        trace = tracing.Trace(job=job_type, device=host, lbid=lbid)
+    trace.close('queue')
+    with trace.activate():
+        with trace.span('job'):
+            _client_job(job_type, host, data, lbid, outbox_ids, trace)
+
+
+def _client_job(job_type, host, data, lbid, outbox_ids, trace):
+    if outbox_ids and not _start_outbox_jobs(outbox_ids):
+        LOG.warning(
+            "Not sending Gearman job {0} to {1} for loadbalancer {2}, "
+            "outbox jobs {3} were claimed by another server while it "
+            "waited".format(job_type, host, lbid, outbox_ids)
+        )
+        return
     try:
         client = GearmanClientThread(host, lbid)
         LOG.info(
-            "Sending Gearman job {0} to {1} for loadbalancer {2}".format(
-                job_type, host, lbid
-            )
+            "Sending Gearman job {0} to {1} for loadbalancer {2} "
+            "(trace {3})".format(job_type, host, lbid, trace.id)
         )
         if job_type == 'UPDATE':
             client.send_update(data)
+        if job_type == 'PATCH':
+            client.send_patch(data)
         if job_type == 'DELETE':
             client.send_delete(data)
         if job_type == 'ARCHIVE':
@@ -69,52 +214,45 @@ def client_job(job_type, host, data, lbid):
                 status = client.send_assign(data)
                 if status:
                     break
-            with db_session() as session:
-                device = session.query(Device).\
-                    filter(Device.name == data).first()
-                if device is None:
-                    LOG.error(
-                        "Device {0} not found in ASSIGN, this shouldn't happen"
-                        .format(data)
-                    )
-                    return
-                mnb_data = {}
-                if not status:
-                    LOG.error(
-                        "Giving up vip assign for device {0}".format(data)
-                    )
-                    errmsg = 'Floating IP assign failed'
-                    client._set_error(device.id, errmsg, session)
-                else:
-                    lbs = session.query(
-                        LoadBalancer
-                    ).join(LoadBalancer.nodes).\
-                        join(LoadBalancer.devices).\
-                        filter(Device.id == device.id).\
-                        filter(LoadBalancer.status != 'DELETED').\
-                        all()
-                    for lb in lbs:
-                        if lb.status == 'BUILD':
-                            # Only send a create message to MnB if we
-                            # are going from BUILD to ACTIVE. After the
-                            # DB is updated.
-                            mnb_data["lbid"] = lb.id
-                            mnb_data["tenantid"] = lb.tenantid
-                        lb.status = 'ACTIVE'
-                    device.status = 'ONLINE'
-                session.commit()
+            if not status:
+                LOG.error(
+                    "Giving up vip assign for device {0}".format(data)
+                )
+            mnb_data = client._assign_done(data, status)
 
-                # Send the MnB create if needed
-                if "lbid" in mnb_data:
-                    update_mnb('lbaas.instance.create',
-                               mnb_data["lbid"],
-                               mnb_data["tenantid"])
+            # Send the MnB create if needed
+            if "lbid" in mnb_data:
+                update_mnb('lbaas.instance.create',
+                           mnb_data["lbid"],
+                           mnb_data["tenantid"])
 
         if job_type == 'REMOVE':
             client.send_remove(data)
         return
     except:
         LOG.exception("Gearman thread unhandled exception")
+    finally:
+        # Failed jobs are removed too, they have already set an error
+        if outbox_ids:
+            try:
+                job_done(outbox_ids)
+            except Exception:
+                LOG.exception(
+                    'Failed to remove jobs {0} from the outbox'
+                    .format(outbox_ids)
+                )
+
+
+def _start_outbox_jobs(outbox_ids):
+    try:
+        return job_started(outbox_ids)
+    except Exception:
+        # Better to risk sending a job twice than not at all
+        LOG.exception(
+            'Failed to renew the claim on jobs {0} in the outbox'
+            .format(outbox_ids)
+        )
+        return True
 
 
 class GearmanClientThread(object):
@@ -122,21 +260,40 @@ class GearmanClientThread(object):
         self.host = host
         self.lbid = lbid
 
-        server_list = []
-        for server in conf.gearman.server:
-            ghost, gport = server.split(':')
-            server_list.append({'host': ghost,
-                                'port': int(gport),
-                                'keyfile': conf.gearman.ssl_key,
-                                'certfile': conf.gearman.ssl_cert,
-                                'ca_certs': conf.gearman.ssl_ca,
-                                'keepalive': conf.gearman.keepalive,
-                                'keepcnt': conf.gearman.keepcnt,
-                                'keepidle': conf.gearman.keepidle,
-                                'keepintvl': conf.gearman.keepintvl})
-        self.gearman_client = JSONGearmanClient(server_list)
-
     def send_assign(self, data):
+        vip = self._claim_vip(data)
+        if vip is None:
+            return False
+        vip_id, vip_ip = vip
+        ip_str = str(ipaddress.IPv4Address(vip_ip))
+
+        job_data = {
+            'action': 'ASSIGN_IP',
+            'name': data,
+            'ip': ip_str
+        }
+        status, response = self._send_message(job_data, 'response')
+        if status:
+            return True
+        elif self.lbid:
+            self.LOG.error(
+                "Failed to assign IP {0} to device {1}"
+                .format(ip_str, data)
+            )
+        else:
+            self.LOG.error(
+                "Failed to assign IP {0} to device {1}"
+                .format(ip_str, data)
+            )
+            # set to device 0 to make sure it won't be used again
+            self._retire_vip(vip_id)
+            submit_vip_job('REMOVE', None, ip_str)
+        return False
+
+    @retried
+    def _claim_vip(self, data):
+        """ Point a floating IP at the device, returning its ID and IP or
+            None if there is none to use """
         NULL = None  # For pep8
         with db_session() as session:
             device = session.query(Device).\
@@ -147,7 +304,7 @@ class GearmanClientThread(object):
                     .format(data)
                 )
                 session.rollback()
-                return False
+                return None
             if not self.lbid:
                 vip = session.query(Vip).\
                     filter(Vip.device == NULL).\
@@ -161,7 +318,7 @@ class GearmanClientThread(object):
                     )
                     self._set_error(device.id, errmsg, session)
                     session.commit()
-                    return False
+                    return None
             else:
                 vip = session.query(Vip).\
                     filter(Vip.id == self.lbid).first()
@@ -173,38 +330,56 @@ class GearmanClientThread(object):
                     )
                     self._set_error(device.id, errmsg, session)
                     session.commit()
-                    return False
+                    return None
             vip.device = device.id
             vip_id = vip.id
             vip_ip = vip.ip
             session.commit()
-        ip_str = str(ipaddress.IPv4Address(vip_ip))
+        return vip_id, vip_ip
 
-        job_data = {
-            'action': 'ASSIGN_IP',
-            'name': data,
-            'ip': ip_str
-        }
-        status, response = self._send_message(job_data, 'response')
-        if status:
-            return True
-        elif self.lbid:
-            self.LOG.error(
-                "Failed to assign IP {0} to device {1}"
-                .format(ip_str, data)
-            )
-        else:
-            self.LOG.error(
-                "Failed to assign IP {0} to device {1}"
-                .format(ip_str, data)
-            )
-            # set to device 0 to make sure it won't be used again
-            with db_session() as session:
-                vip = session.query(Vip).filter(Vip.id == vip_id).first()
-                vip.device = 0
-                session.commit()
-            submit_vip_job('REMOVE', None, ip_str)
-        return False
+    @retried
+    def _retire_vip(self, vip_id):
+        with db_session() as session:
+            vip = session.query(Vip).filter(Vip.id == vip_id).first()
+            vip.device = 0
+            session.commit()
+
+    @retried
+    def _assign_done(self, data, status):
+        """ Record the outcome of a floating IP assign, returning the
+            load balancer going ACTIVE for the first time if there is one """
+        mnb_data = {}
+        with db_session() as session:
+            device = session.query(Device).\
+                filter(Device.name == data).first()
+            if device is None:
+                LOG.error(
+                    "Device {0} not found in ASSIGN, this shouldn't happen"
+                    .format(data)
+                )
+                return mnb_data
+            if not status:
+                errmsg = 'Floating IP assign failed'
+                self._set_error(device.id, errmsg, session)
+            else:
+                lbs = session.query(
+                    LoadBalancer
+                ).join(LoadBalancer.nodes).\
+                    join(LoadBalancer.devices).\
+                    filter(Device.id == device.id).\
+                    filter(LoadBalancer.status != 'DELETED').\
+                    all()
+                for lb in lbs:
+                    if lb.status == 'BUILD':
+                        # Only send a create message to MnB if we
+                        # are going from BUILD to ACTIVE. After the
+                        # DB is updated.
+                        mnb_data["lbid"] = lb.id
+                        mnb_data["tenantid"] = lb.tenantid
+                    lb.status = 'ACTIVE'
+                device.status = 'ONLINE'
+            session.commit()
+        return mnb_data
 
     def send_remove(self, data=None):
         job_data = {
@@ -220,12 +395,17 @@ class GearmanClientThread(object):
             status, response = self._send_message(job_data, 'response')
             if status:
                 break
+        if not status:
+            LOG.error(
+                "Failed to delete IP {0}"
+                .format(self.lbid)
+            )
+        self._remove_done(ip_int, status)
+
+    @retried
+    def _remove_done(self, ip_int, status):
         with db_session() as session:
             if not status:
-                LOG.error(
-                    "Failed to delete IP {0}"
-                    .format(self.lbid)
-                )
                 # Set to 0 to mark as something that needs cleaning up
                 # but cannot be used again
                 vip = session.query(Vip).\
@@ -249,34 +429,14 @@ class GearmanClientThread(object):
             if count >= 1:
                 # This is an update message because we want to retain the
                 # remaining LB
-                keep_lb = session.query(LoadBalancer).\
-                    join(LoadBalancer.nodes).\
-                    join(LoadBalancer.devices).\
-                    filter(Device.id == data).\
-                    filter(LoadBalancer.id != self.lbid).\
-                    filter(LoadBalancer.status != 'DELETED').\
-                    filter(LoadBalancer.status != 'PENDING_DELETE').\
-                    first()
-                job_data = {
-                    'hpcs_action': 'UPDATE',
-                    'loadBalancers': [{
-                        'name': keep_lb.name,
-                        'protocol': keep_lb.protocol,
-                        'algorithm': keep_lb.algorithm,
-                        'port': keep_lb.port,
-                        'nodes': []
-                    }]
-                }
-                for node in keep_lb.nodes:
-                    if not node.enabled:
-                        continue
-                    condition = 'ENABLED'
-                    node_data = {
-                        'id': node.id, 'port': node.port,
-                        'address': node.address, 'weight': node.weight,
-                        'condition': condition
-                    }
-                    job_data['loadBalancers'][0]['nodes'].append(node_data)
+                with tracing.span('db_build'):
+                    keep_lbs = device_loadbalancers(
+                        session, data, exclude_lbid=self.lbid
+                    )
+                    job_data, _ = build_update(session, keep_lbs)
+                    # Without a version the worker forgets the one it has
+                    # and every later PATCH falls back to an UPDATE
+                    job_data['configVersion'] = self._next_version(data)
             else:
                 # This is a delete
                 dev = session.query(Device.name).\
@@ -288,15 +448,28 @@ class GearmanClientThread(object):
                         'REMOVE', dev.name, str(ipaddress.IPv4Address(vip.ip))
                     )
                 job_data = {"hpcs_action": "DELETE"}
+            # Commit rather than roll back to keep any default health
+            # monitors build_update added, nothing else has been written
+            session.commit()
+
+        status, response = self._send_message(job_data, 'hpcs_response')
+        if not status:
+            LOG.error(
+                "Failed Gearman delete for LB {0}".format(self.lbid)
+            )
+        tenant_id = self._delete_done(data, count, status, response)
+
+        #Notify billing of the LB deletion
+        update_mnb('lbaas.instance.delete', self.lbid, tenant_id)
 
-            status, response = self._send_message(job_data, 'hpcs_response')
+    @retried
+    def _delete_done(self, data, count, status, response):
+        """ Remove a deleted load balancer, returning its tenant """
+        with db_session() as session:
             lb = session.query(LoadBalancer).\
                 filter(LoadBalancer.id == self.lbid).\
                 first()
             if not status:
-                LOG.error(
-                    "Failed Gearman delete for LB {0}".format(lb.id)
-                )
                 self._set_error(data, response, session)
             lb.status = 'DELETED'
             tenant_id = lb.tenantid
@@ -315,9 +488,7 @@ class GearmanClientThread(object):
             session.query(HealthMonitor).\
                 filter(HealthMonitor.lbid == lb.id).delete()
             session.commit()
-
-            #Notify billing of the LB deletion
-            update_mnb('lbaas.instance.delete', self.lbid, tenant_id)
+        return tenant_id
 
     def _set_error(self, device_id, errmsg, session):
         lbs = session.query(
@@ -356,9 +527,19 @@ class GearmanClientThread(object):
                     'protocol': lb.protocol
                 }]
             }
-            status, response = self._send_message(job_data, 'hpcs_response')
+            session.rollback()
+
+        status, response = self._send_message(job_data, 'hpcs_response')
+        self._archive_done(data['deviceid'], status, response)
+
+    @retried
+    def _archive_done(self, device_id, status, response):
+        with db_session() as session:
+            lb = session.query(LoadBalancer).\
+                filter(LoadBalancer.id == self.lbid).\
+                first()
             device = session.query(Device).\
-                filter(Device.id == data['deviceid']).\
+                filter(Device.id == device_id).\
                 first()
             if status:
                 device.errmsg = 'Log archive successful'
@@ -368,20 +549,17 @@ class GearmanClientThread(object):
             session.commit()
 
     def send_update(self, data):
+        # A coalesced UPDATE is sent on behalf of several load balancers
+        if isinstance(self.lbid, list):
+            lbids = self.lbid
+        else:
+            lbids = [self.lbid]
         with db_session() as session:
-            lbs = session.query(
-                LoadBalancer
-            ).join(LoadBalancer.nodes).\
-                join(LoadBalancer.devices).\
-                filter(Device.id == data).\
-                filter(LoadBalancer.status != 'DELETED').\
-                all()
-            job_data = {
-                'hpcs_action': 'UPDATE',
-                'loadBalancers': []
-            }
-
-            degraded = []
+            with tracing.span('db_build'):
+                lbs = device_loadbalancers(session, data)
+                if lbs is not None:
+                    job_data, degraded = build_update(session, lbs)
+                    job_data['configVersion'] = self._next_version(data)
             if lbs is None:
                 LOG.error(
                     'Attempting to send empty LB data for device {0} ({1}), '
@@ -390,74 +568,37 @@ class GearmanClientThread(object):
                 self._set_error(data, "LB config error", session)
                 session.commit()
                 return
+            lb_ids = [lb.id for lb in lbs]
+            # Keep any default health monitors build_update added, nothing
+            # else has been written
+            session.commit()
 
-            for lb in lbs:
-                lb_data = {
-                    'name': lb.name,
-                    'protocol': lb.protocol,
-                    'algorithm': lb.algorithm,
-                    'port': lb.port,
-                    'nodes': [],
-                    'monitor': {}
-                }
-                for node in lb.nodes:
-                    if not node.enabled:
-                        continue
-                    condition = 'ENABLED'
-                    backup = 'FALSE'
-                    if node.backup != 0:
-                        backup = 'TRUE'
-                    node_data = {
-                        'id': node.id, 'port': node.port,
-                        'address': node.address, 'weight': node.weight,
-                        'condition': condition, 'backup': backup
-                    }
-
-                    lb_data['nodes'].append(node_data)
-                    # Track if we have a DEGRADED LB
-                    if node.status == 'ERROR':
-                        degraded.append(lb.id)
-
-                # Add a default health monitor if one does not exist
-                monitor = session.query(HealthMonitor).\
-                    filter(HealthMonitor.lbid == lb.id).first()
-
-                if monitor is None:
-                    # Set it to a default configuration
-                    monitor = HealthMonitor(
-                        lbid=lb.id, type="CONNECT", delay=30,
-                        timeout=30, attempts=2, path=None
-                    )
-                    session.add(monitor)
-                    session.flush()
-
-                monitor_data = {
-                    'type': monitor.type,
-                    'delay': monitor.delay,
-                    'timeout': monitor.timeout,
-                    'attempts': monitor.attempts
-                }
-                if monitor.path is not None:
-                    monitor_data['path'] = monitor.path
-
-                # All new LBs created since these options were supported
-                # will have default values in the DB. Pre-existing LBs will
-                # not have any values, so we need to check for that.
-                if any([lb.client_timeout, lb.server_timeout,
-                        lb.connect_timeout, lb.connect_retries]):
-                    lb_data['options'] = {
-                        'client_timeout': lb.client_timeout,
-                        'server_timeout': lb.server_timeout,
-                        'connect_timeout': lb.connect_timeout,
-                        'connect_retries': lb.connect_retries
-                    }
-
-                lb_data['monitor'] = monitor_data
-                job_data['loadBalancers'].append(lb_data)
-
-            # Update the worker
-            mnb_data = {}
-            status, response = self._send_message(job_data, 'hpcs_response')
+        # Update the worker
+        status, response = self._send_message(job_data, 'hpcs_response')
+        done = self._update_done(
+            data, lbids, lb_ids, degraded, status, response
+        )
+        if done is None:
+            return
+        device_name, device_status, mnb_data = done
+        if device_status == 'BUILD':
+            submit_vip_job(
+                'ASSIGN', device_name, None
+            )
+
+        # Send the MnB creates if needed
+        for lbid, tenantid in mnb_data:
+            update_mnb('lbaas.instance.create', lbid, tenantid)
+
+    @retried
+    def _update_done(self, data, lbids, lb_ids, degraded, status, response):
+        """ Record the outcome of an UPDATE, returning the device's name and
+            status and the load balancers going ACTIVE for the first time,
+            or None if the device has gone """
+        mnb_data = []
+        with db_session() as session:
+            lbs = session.query(LoadBalancer).\
+                filter(LoadBalancer.id.in_(lb_ids)).all()
             if not status:
                 self._set_error(data, response, session)
             else:
@@ -472,15 +613,14 @@ class GearmanClientThread(object):
                     elif lb.status == 'BUILD':
                         # Do nothing if a new device, stay in BUILD state until
                         # floating IP assign finishes
-                        if len(lbs) > 1:
+                        if len(lb_ids) > 1:
                             lb.status = 'ACTIVE'
-                            if lb.id == self.lbid:
-                                # This is the new LB being added to a device.
+                            if lb.id in lbids:
+                                # This is a new LB being added to a device.
                                 # We don't have to assign a vip so we can
                                 # notify billing of the LB creation (once the
                                 # DB is updated)
-                                mnb_data["lbid"] = lb.id
-                                mnb_data["tenantid"] = lb.tenantid
+                                mnb_data.append((lb.id, lb.tenantid))
                     else:
                         lb.status = 'ACTIVE'
                         lb.errmsg = None
@@ -490,38 +630,135 @@ class GearmanClientThread(object):
             if device is None:
                 # Shouldn't hit here, but just to be safe
                 session.commit()
-                return
-            if device.status == 'BUILD' and len(lbs) > 1:
+                return None
+            if device.status == 'BUILD' and len(lb_ids) > 1:
                 device.status = 'ONLINE'
             device_name = device.name
             device_status = device.status
             session.commit()
-            if device_status == 'BUILD':
-                submit_vip_job(
-                    'ASSIGN', device_name, None
-                )
+        return device_name, device_status, mnb_data
 
-            # Send the MnB create if needed
-            if "lbid" in mnb_data:
-                update_mnb('lbaas.instance.create',
-                           mnb_data["lbid"],
-                           mnb_data["tenantid"])
+    def send_patch(self, data):
+        """ Send only the node changes for a load balancer to its device.
+
+            If the device is not running the configuration version we last
+            sent it, or the PATCH fails for any other reason, a full UPDATE
+            is sent instead. """
+        device_id = data['deviceid']
+        with db_session() as session, tracing.span('db_build'):
+            lb = session.query(LoadBalancer).\
+                filter(LoadBalancer.id == self.lbid).\
+                filter(LoadBalancer.status != 'DELETED').\
+                first()
+            if lb is None:
+                # Deleted since, the DELETE takes care of the device
+                session.rollback()
+                return
+            base = session.query(Device.configVersion).\
+                filter(Device.id == device_id).scalar()
+            job_data = build_patch(session, lb, data['nodes'])
+            session.rollback()
+
+        # Version 0 has never had a versioned UPDATE
+        version = None
+        if base:
+            version = self._next_version(device_id, base)
+        if version is None:
+            self.send_update(device_id)
+            return
+        job_data['baseVersion'] = base
+        job_data['configVersion'] = version
+
+        status, response = self._send_message(job_data, 'hpcs_response')
+        if not status:
+            LOG.info(
+                'PATCH for device {0} failed ({1}), sending UPDATE'
+                .format(self.host, response)
+            )
+            self.send_update(device_id)
+            return
+        self._patch_done()
+
+    @retried
+    def _patch_done(self):
+        with db_session() as session:
+            lb = session.query(LoadBalancer).\
+                filter(LoadBalancer.id == self.lbid).\
+                first()
+            errors = session.query(Node).\
+                filter(Node.lbid == self.lbid).\
+                filter(Node.enabled == 1).\
+                filter(Node.status == 'ERROR').\
+                count()
+            if lb is None or lb.status in \
+                    ('ERROR', 'BUILD', 'PENDING_DELETE', 'DELETED'):
+                # Something else happened in the mean time
+                pass
+            elif errors:
+                lb.status = 'DEGRADED'
+                lb.errmsg = "A node on the load balancer has failed"
+            else:
+                lb.status = 'ACTIVE'
+                lb.errmsg = None
+            session.commit()
+
+    @retried
+    def _next_version(self, device_id, base=None):
+        # Committed straight away so the device row is not kept locked
+        # while waiting for the worker
+        with db_session() as session:
+            version = next_version(session, device_id, base)
+            session.commit()
+        return version
 
     def _send_message(self, message, response_name):
-        job_status = self.gearman_client.submit_job(
-            self.host, message, background=False, wait_until_complete=True,
-            max_retries=10, poll_timeout=120.0
-        )
-        if job_status.state == 'UNKNOWN':
-            # Gearman server connection failed
-            LOG.error('Could not talk to gearman server')
-            return False, "System error communicating with load balancer"
-        if job_status.timed_out:
-            # Job timed out
+        action = message.get('hpcs_action', message.get('action'))
+        trace = tracing.current()
+        if trace is not None:
+            message[tracing.TRACE_FIELD] = trace.id
+        tracker = get_tracker()
+        breaker = get_breaker()
+        if action in _retry_actions:
+            attempts = 1 + conf.gearman.job_retries
+        else:
+            attempts = 1
+
+        for attempt in xrange(attempts):
+            if attempt:
+                delay = backoff(attempt)
+                LOG.info(
+                    'Retrying {0} for {1} in {2:.1f} seconds'
+                    .format(action, self.host, delay)
+                )
+                eventlet.sleep(delay)
+            if not breaker.allow(self.host):
+                LOG.warning(
+                    'Not sending {0} to {1}, it is not responding'
+                    .format(action, self.host)
+                )
+                return False, "Load balancer is not responding"
+
+            timeout = tracker.timeout(self.host, action)
+            start = time.time()
+            with tracing.span('gearman', action=action, attempt=attempt + 1):
+                job_status = self._submit(message, timeout)
+            if job_status is None:
+                LOG.error('Could not talk to gearman server')
+                return False, "System error communicating with load balancer"
+            if not job_status.timed_out:
+                tracker.record(self.host, action, time.time() - start)
+                breaker.success(self.host)
+                break
+            # A time out says the device needs at least this long
+            tracker.record(self.host, action, timeout)
+            breaker.failure(self.host)
             LOG.warning(
-                'Gearman timeout talking to {0}'.format(self.host)
+                'Gearman timeout talking to {0} after {1:.1f} seconds'
+                .format(self.host, timeout)
             )
+        else:
             return False, "Timeout error communicating with load balancer"
+
         LOG.debug(job_status.result)
         if 'badRequest' in job_status.result:
             error = job_status.result['badRequest']['validationErrors']
@@ -538,3 +775,26 @@ class GearmanClientThread(object):
             return False, error
         LOG.info('Gearman success from {0}'.format(self.host))
         return True, job_status.result
+
+    def _submit(self, message, timeout):
+        """ Run a job on a pooled client, None if the job server failed """
+        pool = get_pool()
+        gearman_client = pool.get()
+        try:
+            job_status = gearman_client.submit_job(
+                self.host, encode_for(self.host, message),
+                unique=job_unique(self.host, message),
+                priority=job_priority(message), background=False,
+                wait_until_complete=True, max_retries=10,
+                poll_timeout=timeout
+            )
+        except Exception:
+            pool.discard(gearman_client)
+            raise
+        if job_status.state == 'UNKNOWN':
+            # Gearman server connection failed, don't reuse this client
+            pool.discard(gearman_client)
+            return None
+        pool.put(gearman_client)
+        LOG.debug('Gearman client pool: {0}'.format(pool.stats()))
+        return job_status
@@ -0,0 +1,160 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import select
+import time
+
+from eventlet import pools
+from pecan import conf
+
+from libra.common.json_gearman import JSONGearmanClient
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+_pool = None
+
+
+def get_pool():
+    """ Return the process-wide Gearman client pool, creating it if needed """
+    global _pool
+    if _pool is None:
+        _pool = GearmanClientPool(
+            _server_list(), conf.gearman.pool_size, conf.gearman.pool_idle
+        )
+    return _pool
+
+
+def _server_list():
+    server_list = []
+    for server in conf.gearman.server:
+        ghost, gport = server.split(':')
+        server_list.append({'host': ghost,
+                            'port': int(gport),
+                            'keyfile': conf.gearman.ssl_key,
+                            'certfile': conf.gearman.ssl_cert,
+                            'ca_certs': conf.gearman.ssl_ca,
+                            'keepalive': conf.gearman.keepalive,
+                            'keepcnt': conf.gearman.keepcnt,
+                            'keepidle': conf.gearman.keepidle,
+                            'keepintvl': conf.gearman.keepintvl})
+    return server_list
+
+
+class GearmanClientPool(pools.Pool):
+    """ A bounded pool of Gearman clients shared by all job greenthreads.
+
+        Each JSONGearmanClient holds a connection (possibly SSL) to every
+        job server, so building one per job is expensive.  Clients are
+        handed out most recently used first, so under light load only a few
+        connections stay warm.  A client is thrown away and replaced if its
+        connections have failed or it has sat idle for longer than max_idle
+        seconds, since the job server or a firewall may have dropped it.
+        A client returned with a job that timed out or lost its connection
+        is thrown away too, as the job server may still send that job's
+        result down the connection to whoever uses the client next. """
+
+    def __init__(self, server_list, max_size, max_idle):
+        self.server_list = server_list
+        self.max_idle = max_idle
+        self.last_used = {}
+        self.created = 0
+        self.discarded = 0
+        self.checkouts = 0
+        self.waits = 0
+        super(GearmanClientPool, self).__init__(
+            max_size=max_size, order_as_stack=True
+        )
+
+    def create(self):
+        self.created += 1
+        return JSONGearmanClient(self.server_list)
+
+    def get(self):
+        self.checkouts += 1
+        if self.free() == 0:
+            self.waits += 1
+            LOG.warning(
+                'Gearman client pool exhausted, waiting: {0}'
+                .format(self.stats())
+            )
+        client = super(GearmanClientPool, self).get()
+        if not self._is_healthy(client):
+            # Replace in place so the pool size stays the same
+            self._close(client)
+            client = self.create()
+        return client
+
+    def put(self, client):
+        if client.request_to_rotating_connection_queue:
+            # gearman only forgets a request once it completes, so anything
+            # left here was abandoned on a time out or connection error
+            LOG.info('Discarding Gearman client with an unfinished job')
+            self.discard(client)
+            return
+        self.last_used[id(client)] = time.time()
+        super(GearmanClientPool, self).put(client)
+
+    def discard(self, client):
+        """ Throw away a client which failed and put a new one in its place.
+
+            The replacement connects lazily on its first job, so this also
+            serves to reconnect after a job server failure. """
+        self._close(client)
+        self.put(self.create())
+
+    def stats(self):
+        """ Pool utilisation counters for logging and monitoring """
+        free = len(self.free_items)
+        return {
+            'size': self.current_size,
+            'max_size': self.max_size,
+            'in_use': self.current_size - free,
+            'free': free,
+            'waiting': self.waiting(),
+            'created': self.created,
+            'discarded': self.discarded,
+            'checkouts': self.checkouts,
+            'waits': self.waits
+        }
+
+    def _close(self, client):
+        self.discarded += 1
+        self.last_used.pop(id(client), None)
+        try:
+            client.shutdown()
+        except Exception:
+            LOG.exception('Error closing Gearman client')
+
+    def _is_healthy(self, client):
+        last_used = self.last_used.get(id(client))
+        if last_used is not None and time.time() - last_used > self.max_idle:
+            LOG.debug('Recycling idle Gearman client')
+            return False
+        # An idle connection should have nothing to read. If it does then
+        # the job server has closed it (or sent us something unexpected).
+        connections = [c for c in client.connection_list if c.connected]
+        if not connections:
+            return True
+        try:
+            readable, _, errored = select.select(
+                connections, [], connections, 0
+            )
+        except Exception:
+            return False
+        if readable or errored:
+            LOG.info('Recycling Gearman client with a dead connection')
+            return False
+        return True
@@ -19,11 +19,14 @@ import time
 
 from oslo.config import cfg
 from pecan import conf
-from sqlalchemy import Table, Column, Integer, ForeignKey, create_engine
-from sqlalchemy import INTEGER, VARCHAR, BIGINT, DATETIME
+from sqlalchemy import Table, Column, Index, Integer, ForeignKey
+from sqlalchemy import create_engine
+from sqlalchemy import event, exc
+from sqlalchemy import INTEGER, VARCHAR, BIGINT, DATETIME, TEXT
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, backref, sessionmaker, Session
 
+from libra.common.api import query_stats
 from libra.openstack.common import log
 
 LOG = log.getLogger(__name__)
@@ -36,7 +39,9 @@ loadbalancers_devices = Table(
     'loadbalancers_devices',
     metadata,
     Column('loadbalancer', Integer, ForeignKey('loadbalancers.id')),
-    Column('device', Integer, ForeignKey('devices.id'))
+    Column('device', Integer, ForeignKey('devices.id')),
+    Index('loadbalancers_devices_loadbalancer', 'loadbalancer'),
+    Index('loadbalancers_devices_device', 'device')
 )
 
 
@@ -69,6 +74,7 @@ class PoolBuilding(DeclarativeBase):
     id = Column(u'id', Integer, primary_key=True, nullable=False)
     server_id = Column(u'server_id', Integer, nullable=False)
     qty = Column(u'qty', Integer, nullable=False)
+    __table_args__ = (Index('server_id', 'server_id'),)
 
 
 class Vip(DeclarativeBase):
@@ -76,6 +82,7 @@ class Vip(DeclarativeBase):
     id = Column(u'id', Integer, primary_key=True, nullable=False)
     ip = Column(u'ip', Integer, nullable=True)
     device = Column(u'device', Integer, ForeignKey('devices.id'))
+    __table_args__ = (Index('device', 'device'),)
 
 
 class Device(DeclarativeBase):
@@ -83,6 +90,9 @@ class Device(DeclarativeBase):
     __tablename__ = 'devices'
     #column definitions
     az = Column(u'az', INTEGER(), nullable=False)
+    configVersion = Column(
+        u'configVersion', INTEGER(), nullable=False, default=0
+    )
     created = Column(u'created', FormatedDateTime(), nullable=False)
     floatingIpAddr = Column(
         u'floatingIpAddr', VARCHAR(length=128), nullable=False
@@ -94,7 +104,17 @@ class Device(DeclarativeBase):
     type = Column(u'type', VARCHAR(length=128), nullable=False)
     pingCount = Column(u'pingCount', INTEGER(), nullable=False)
     updated = Column(u'updated', FormatedDateTime(), nullable=False)
+    # Raised by every ORM update, which only applies if the row is still at
+    # the version read; otherwise StaleDataError is raised and the unit of
+    # work replayed rather than a concurrent change being lost.  Bulk
+    # query.update() calls skip this and must raise it themselves.
+    version = Column(u'version', INTEGER(), nullable=False, default=0)
     vip = relationship("Vip", uselist=False, backref="devices")
+    __table_args__ = (
+        Index('devices_status', 'status'),
+        Index('devices_name', 'name')
+    )
+    __mapper_args__ = {'version_id_col': version}
 
 
 class LoadBalancer(DeclarativeBase):
@@ -115,6 +135,8 @@ class LoadBalancer(DeclarativeBase):
     server_timeout = Column(u'server_timeout', INTEGER(), nullable=True)
     connect_timeout = Column(u'connect_timeout', INTEGER(), nullable=True)
     connect_retries = Column(u'connect_retries', INTEGER(), nullable=True)
+    # Compare and swap updates, as Device.version
+    version = Column(u'version', INTEGER(), nullable=False, default=0)
     nodes = relationship(
         'Node', backref=backref('loadbalancers', order_by='Node.id')
     )
@@ -127,6 +149,10 @@ class LoadBalancer(DeclarativeBase):
         'Device', secondary=loadbalancers_devices, backref='loadbalancers',
         lazy='joined'
     )
+    __table_args__ = (
+        Index('loadbalancers_tenantid_status', 'tenantid', 'status'),
+    )
+    __mapper_args__ = {'version_id_col': version}
 
 
 class Node(DeclarativeBase):
@@ -143,6 +169,7 @@ class Node(DeclarativeBase):
     status = Column(u'status', VARCHAR(length=128), nullable=False)
     weight = Column(u'weight', INTEGER(), nullable=False)
     backup = Column(u'backup', INTEGER(), nullable=False, default=0)
+    __table_args__ = (Index('nodes_lbid', 'lbid'),)
 
 
 class HealthMonitor(DeclarativeBase):
@@ -162,6 +189,13 @@ class HealthMonitor(DeclarativeBase):
     path = Column(u'path', VARCHAR(length=2000))
 
 
+class Versions(DeclarativeBase):
+    """schema version, major versions are not backward compatible"""
+    __tablename__ = 'versions'
+    major = Column(u'major', INTEGER(), primary_key=True, nullable=False)
+    minor = Column(u'minor', INTEGER(), nullable=False)
+
+
 class Billing(DeclarativeBase):
     __tablename__ = 'billing'
     id = Column(u'id', Integer, primary_key=True, nullable=False)
@@ -182,6 +216,22 @@ class Stats(DeclarativeBase):
     period_end = Column(u'period_end', DATETIME(), nullable=False)
     bytes_out = Column(u'bytes_out', BIGINT(), nullable=False)
     status = Column(u'status', VARCHAR(length=50), nullable=False)
+    __table_args__ = (Index('stats_period_end', 'period_end'),)
+
+
+class StatsRollup(DeclarativeBase):
+    """stats totals for each usage period"""
+    __tablename__ = 'stats_rollup'
+    #column definitions
+    lbid = Column(u'lbid', BIGINT(), primary_key=True, nullable=False)
+    bucket_start = Column(
+        u'bucket_start', DATETIME(), primary_key=True, nullable=False
+    )
+    bytes_out = Column(u'bytes_out', BIGINT(), nullable=False)
+    samples = Column(u'samples', INTEGER(), nullable=False)
+    __table_args__ = (
+        Index('stats_rollup_bucket_start', 'bucket_start'),
+    )
 
 
 class Ports(DeclarativeBase):
@@ -194,27 +244,252 @@ class Ports(DeclarativeBase):
     enabled = Column(u'enabled', INTEGER(), nullable=False, default=0)
 
 
+class JobOutbox(DeclarativeBase):
+    """Gearman jobs waiting to be sent"""
+    __tablename__ = 'job_outbox'
+    #column definitions
+    id = Column(u'id', BIGINT(), primary_key=True, nullable=False)
+    job_type = Column(u'job_type', VARCHAR(length=32), nullable=False)
+    host = Column(u'host', VARCHAR(length=128), nullable=False)
+    data = Column(u'data', TEXT(), nullable=False)
+    lbid = Column(u'lbid', BIGINT(), nullable=True)
+    created = Column(u'created', DATETIME(), nullable=False)
+    claimed = Column(u'claimed', DATETIME(), nullable=True)
+    claimed_by = Column(u'claimed_by', VARCHAR(length=128), nullable=True)
+    __table_args__ = (Index('claimed', 'claimed'),)
+
+
+class CacheVersion(DeclarativeBase):
+    """raised to have the API servers drop their in-memory caches"""
+    __tablename__ = 'cache_version'
+    #column definitions
+    id = Column(u'id', INTEGER(), primary_key=True, nullable=False)
+    version = Column(u'version', INTEGER(), nullable=False, default=0)
+
+
+class ApiCaches(DeclarativeBase):
+    """in-memory cache counters last reported by each API server"""
+    __tablename__ = 'api_caches'
+    #column definitions
+    name = Column(u'name', VARCHAR(length=128), primary_key=True,
+                  nullable=False)
+    version = Column(u'version', INTEGER(), nullable=False)
+    stats = Column(u'stats', TEXT(), nullable=False)
+    updated = Column(u'updated', DATETIME(), nullable=False)
+
+
+# Pooled connections idle for longer than this are checked before use
+PING_AFTER_IDLE = 30
+
+
+def _checkin(dbapi_connection, connection_record):
+    connection_record.info['checked_in'] = time.time()
+
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    """ Check a connection that has been idle in the pool still works.
+
+        Raising DisconnectionError makes the pool drop the connection and
+        connect again, so a DB server restart or idle timeout costs one
+        reconnect rather than a failed request.  Connections in steady use
+        are not checked. """
+    checked_in = connection_record.info.get('checked_in')
+    if checked_in is None or time.time() - checked_in < PING_AFTER_IDLE:
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+    except Exception:
+        raise exc.DisconnectionError()
+    finally:
+        cursor.close()
+
+
+class EngineHealth(object):
+    """ How one DB server is doing, used to pick where reads go.
+
+        Query latency is kept as an EWMA measured around every cursor
+        execute, in_use counts the connections checked out of its pool.  A
+        server which could not be connected to is left out of reads for
+        FAIL_TIME seconds. """
+
+    FAIL_TIME = 60
+    # Servers whose latency is within this many seconds count as equally
+    # fast, otherwise the fastest would get every read
+    LATENCY_STEP = 0.005
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.latency = None
+        self.in_use = 0
+        self.failures = 0
+        self.failed_until = 0
+
+    def record(self, seconds):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.alpha * (seconds - self.latency)
+
+    def failed(self):
+        self.failures += 1
+        self.failed_until = time.time() + self.FAIL_TIME
+
+    def healthy(self, now=None):
+        return (now or time.time()) >= self.failed_until
+
+    def load(self):
+        # A server we have no timings for yet counts as fast so it gets
+        # tried
+        step = int((self.latency or 0) / self.LATENCY_STEP)
+        return (self.in_use + 1) * (step + 1)
+
+    def stats(self):
+        return {
+            'healthy': self.healthy(),
+            'latency': None if self.latency is None
+            else round(self.latency * 1000, 3),
+            'in_use': self.in_use,
+            'failures': self.failures
+        }
+
+
+def _watch_engine(engine, health):
+    """ Keep health up to date from the engine's events, and count every
+        query in query_stats """
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.time())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.time() - conn.info['query_start'].pop()
+        health.record(seconds)
+        query_stats.record(statement, parameters, seconds, cursor.rowcount)
+
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        health.in_use += 1
+
+    @event.listens_for(engine, 'checkin')
+    def checkin(dbapi_connection, connection_record):
+        # Connections invalidated without being checked out again are
+        # checked in too
+        health.in_use = max(0, health.in_use - 1)
+
+
+def make_engine(db_conf, echo=False):
+    """ An engine for the MySQL server described by a db_sections config
+        section """
+    conn_string = '''mysql+mysqlconnector://%s:%s@%s:%s/%s''' % (
+        db_conf['username'],
+        db_conf['password'],
+        db_conf['host'],
+        db_conf['port'],
+        db_conf['schema']
+    )
+
+    if 'ssl_key' in db_conf:
+        ssl_args = {'ssl': {
+            'cert': db_conf['ssl_cert'],
+            'key': db_conf['ssl_key'],
+            'ca': db_conf['ssl_ca']
+        }}
+
+        return create_engine(
+            conn_string, isolation_level="READ COMMITTED",
+            pool_size=20, connect_args=ssl_args, pool_recycle=3600,
+            echo=echo
+        )
+    return create_engine(
+        conn_string, isolation_level="READ COMMITTED",
+        pool_size=20, pool_recycle=3600,
+        echo=echo
+    )
+
+
 class RoutingSession(Session):
-    """ Try to use the first engine provided.  If this fails use the next in
-        sequence and so on.  Reset to the first after 60 seconds
+    """ Writes try to use the first engine provided.  If this fails use the
+        next in sequence and so on.  Reset to the first after 60 seconds
         we do this because we can end up with deadlocks in Galera, see
-        http://tinyurl.com/9h6qlly """
+        http://tinyurl.com/9h6qlly
+        A transaction which still loses a deadlock or certification check
+        is replayed by libra.common.api.retry.
+
+        Read only sessions are spread over every engine instead, each going
+        to the healthy engine with the least load in the health table.  A
+        read only session stays on the engine it started on so it sees one
+        consistent view. """
 
     engines = {}
     engines_count = 0
     use_engine = 0
     last_engine_time = 0
+    health = {}
+    read_turn = 0
+
+    def __init__(self, readonly=False, **kwargs):
+        super(RoutingSession, self).__init__(**kwargs)
+        self.readonly = readonly
+        self.engine_index = None
+
+    @classmethod
+    def add_engine(cls, engine):
+        index = cls.engines_count
+        cls.engines[index] = engine
+        cls.health[index] = EngineHealth()
+        _watch_engine(engine, cls.health[index])
+        cls.engines_count += 1
+
+    @classmethod
+    def pick_reader(cls):
+        """ The index of the engine the next read only session should use """
+        now = time.time()
+        candidates = [
+            index for index in xrange(cls.engines_count)
+            if index not in cls.health or cls.health[index].healthy(now)
+        ]
+        if not candidates:
+            return cls.use_engine
+        # Rotate where min() starts so engines with the same load take
+        # turns
+        cls.read_turn += 1
+        start = cls.read_turn % len(candidates)
+        candidates = candidates[start:] + candidates[:start]
+        return min(
+            candidates,
+            key=lambda index: cls.health[index].load()
+            if index in cls.health else 0
+        )
+
+    @classmethod
+    def health_table(cls):
+        table = []
+        for index in sorted(cls.health):
+            row = cls.health[index].stats()
+            row['host'] = cls.engines[index].url.host
+            row['writes'] = index == cls.use_engine
+            table.append(row)
+        return table
 
     def get_bind(self, mapper=None, clause=None):
         if not RoutingSession.engines:
             self._build_engines()
 
+        if self.readonly:
+            if self.engine_index is None:
+                self.engine_index = RoutingSession.pick_reader()
+            return RoutingSession.engines[self.engine_index]
+
         if (
             RoutingSession.use_engine > 0
             and time.time() < RoutingSession.last_engine_time + 60
         ):
             RoutingSession.last_engine_time = time.time()
             RoutingSession.use_engine = 0
+        self.engine_index = RoutingSession.use_engine
         engine = RoutingSession.engines[RoutingSession.use_engine]
         return engine
 
@@ -230,54 +505,66 @@ class RoutingSession(Session):
             echo = False
 
         for section in conf.database:
-            db_conf = config._sections[section]
-
-            conn_string = '''mysql+mysqlconnector://%s:%s@%s:%s/%s''' % (
-                db_conf['username'],
-                db_conf['password'],
-                db_conf['host'],
-                db_conf['port'],
-                db_conf['schema']
-            )
-
-            if 'ssl_key' in db_conf:
-                ssl_args = {'ssl': {
-                    'cert': db_conf['ssl_cert'],
-                    'key': db_conf['ssl_key'],
-                    'ca': db_conf['ssl_ca']
-                }}
-
-                engine = create_engine(
-                    conn_string, isolation_level="READ COMMITTED",
-                    pool_size=20, connect_args=ssl_args, pool_recycle=3600,
-                    echo=echo
-                )
-            else:
-                engine = create_engine(
-                    conn_string, isolation_level="READ COMMITTED",
-                    pool_size=20, pool_recycle=3600,
-                    echo=echo
-                )
-            RoutingSession.engines[RoutingSession.engines_count] = engine
-            RoutingSession.engines_count += 1
+            engine = make_engine(config._sections[section], echo)
+            event.listen(engine, 'checkin', _checkin)
+            event.listen(engine, 'checkout', _checkout)
+            RoutingSession.add_engine(engine)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _readonly_flush(session, flush_context, instances):
+    if session.readonly and (session.new or session.dirty or session.deleted):
+        raise exc.InvalidRequestError(
+            'Cannot write from a read only session'
+        )
+
+
+# Built once, making a session from it is cheap
+_session_factory = sessionmaker(class_=RoutingSession)
 
 
 class db_session(object):
-    def __init__(self):
+    """ A session for the length of a with block.
+
+        Every block gets a session of its own rather than a thread scoped
+        one, as blocks are nested: jobs holding a session update the outbox
+        and device versions in separate transactions.
+
+        Pass readonly=True for blocks which only query, they are spread over
+        all the DB servers rather than pinned to the one taking writes.  As
+        Galera replicates asynchronously such a block can briefly miss a
+        write just made through another session. """
+
+    def __init__(self, readonly=False):
+        self.readonly = readonly
         self.session = None
 
     def __enter__(self):
         for x in xrange(10):
             try:
-                self.session = sessionmaker(class_=RoutingSession)()
-                self.session.execute("SELECT 1")
+                self.session = _session_factory(readonly=self.readonly)
+                # Checking out a connection is enough to find a DB server
+                # that is down, the pool only pings connections that have
+                # been idle
+                self.session.connection()
                 return self.session
             except:
+                index = RoutingSession.use_engine
+                if self.session is not None:
+                    if self.session.engine_index is not None:
+                        index = self.session.engine_index
+                    self.session.close()
                 LOG.error(
                     'Could not connect to DB server: {0}'.format(
-                        RoutingSession.engines[RoutingSession.use_engine].url
+                        RoutingSession.engines[index].url
                     )
                 )
+                if index in RoutingSession.health:
+                    RoutingSession.health[index].failed()
+                if self.readonly:
+                    # Leave writes where they are, the next read only
+                    # session skips this server
+                    continue
                 RoutingSession.last_engine_time = time.time()
                 RoutingSession.use_engine += 1
                 if RoutingSession.use_engine == RoutingSession.engines_count:
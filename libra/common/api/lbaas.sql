@@ -12,7 +12,7 @@ create TABLE versions (
    minor     INT                       NOT NULL,
    PRIMARY KEY (major)
 );
-INSERT INTO versions values (2,0);
+INSERT INTO versions values (2,7);
 
 # loadbalancers
 CREATE TABLE loadbalancers (
@@ -30,7 +30,9 @@ CREATE TABLE loadbalancers (
     server_timeout INT,
     connect_timeout INT,
     connect_retries INT,
-    PRIMARY KEY (id)                                             # ids are unique accross all LBs
+    version   INT                      NOT NULL DEFAULT 0,       # raised by every update, so concurrent updates are detected
+    PRIMARY KEY (id),                                            # ids are unique accross all LBs
+    KEY loadbalancers_tenantid_status (tenantid, status)
  ) DEFAULT CHARSET utf8 DEFAULT COLLATE utf8_general_ci;
 
  #nodes
@@ -43,7 +45,8 @@ CREATE TABLE loadbalancers (
     enabled        BOOLEAN               NOT NULL,                  # is node enabled or not
     status         VARCHAR(128)          NOT NULL,                  # status of node 'OFFLINE', 'ONLINE', 'ERROR', this value is reported by the device
     backup         BOOLEAN               NOT NULL DEFAULT FALSE,    # true if a backup node
-    PRIMARY KEY (id)                                                # ids are unique accross all Nodes
+    PRIMARY KEY (id),                                               # ids are unique accross all Nodes
+    KEY nodes_lbid (lbid)
  ) DEFAULT CHARSET utf8 DEFAULT COLLATE utf8_general_ci;
 
 
@@ -59,14 +62,20 @@ CREATE TABLE devices (
     updated        TIMESTAMP             NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,                  # timestamp of when device was last updated
     pingCount      INT                   NOT NULL,                  # Number of ping failures against an OFFLINE device
     status         VARCHAR(128)          NOT NULL,                  # status of device 'OFFLINE', 'ONLINE', 'ERROR', this value is reported by the device
-    PRIMARY KEY (id)
+    configVersion  INT                   NOT NULL DEFAULT 0,        # version of the configuration last sent to the device
+    version        INT                   NOT NULL DEFAULT 0,        # raised by every update, so concurrent updates are detected
+    PRIMARY KEY (id),
+    KEY devices_status (status),
+    KEY devices_name (name)
 ) DEFAULT CHARSET utf8 DEFAULT COLLATE utf8_general_ci;
 
 CREATE TABLE `loadbalancers_devices` (
   `id` int(11) NOT NULL AUTO_INCREMENT,
   `loadbalancer` int(11) DEFAULT NULL,
   `device` int(11) DEFAULT NULL,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  KEY `loadbalancers_devices_loadbalancer` (`loadbalancer`),
+  KEY `loadbalancers_devices_device` (`device`)
 ) ENGINE=InnoDB AUTO_INCREMENT=16 DEFAULT CHARSET=latin1;
 
 CREATE TABLE monitors (
@@ -130,7 +139,19 @@ CREATE TABLE stats (
     period_end     DATETIME                 NOT NULL,                              # timestamp of when this period ended
     bytes_out      BIGINT                   NOT NULL,                              # bytes transferred in this period
     status         VARCHAR(50)              NOT NULL,                              # Current LB status
-    PRIMARY KEY (id)                                                               # ids are unique across all LBs
+    PRIMARY KEY (id, period_end),                                                  # ids are unique across all LBs, period_end is needed to partition
+    KEY stats_period_end (period_end)
+ ) ENGINE=InnoDB DEFAULT CHARSET latin1
+ PARTITION BY RANGE (TO_DAYS(period_end)) (PARTITION pmax VALUES LESS THAN MAXVALUE);  # day partitions are split out of pmax by the usage scheduler
+
+# Stats totals per load balancer for each usage_freq period, read for usage notifications
+CREATE TABLE stats_rollup (
+    lbid           BIGINT                   NOT NULL,                              # fk for lbid
+    bucket_start   DATETIME                 NOT NULL,                              # start of the usage period
+    bytes_out      BIGINT                   NOT NULL,                              # bytes transferred in the period
+    samples        INT                      NOT NULL,                              # stats rows added up
+    PRIMARY KEY (lbid, bucket_start),
+    KEY stats_rollup_bucket_start (bucket_start)
  ) ENGINE=InnoDB DEFAULT CHARSET latin1;
  
 # Ports
@@ -144,3 +165,34 @@ CREATE TABLE ports (
 
 INSERT INTO ports VALUES (1, 'HTTP', 80, true),(2, 'HTTP', 8080, false),(3, 'HTTP', 8088, false),(4,'TCP', 443, true),(5, 'TCP', 8443, false),(6, 'TCP', 3306, true),(7, 'GALERA', 3306, true);
 
+# Gearman jobs written with the change that needs them, sent by the API servers
+CREATE TABLE job_outbox (
+    id             BIGINT                   NOT NULL AUTO_INCREMENT,               # unique id, also the order jobs are sent in
+    job_type       VARCHAR(32)              NOT NULL,                              # Gearman job type, e.g. UPDATE or DELETE
+    host           VARCHAR(128)             NOT NULL,                              # device name the job is for
+    data           TEXT                     NOT NULL,                              # JSON encoded job data
+    lbid           BIGINT                   DEFAULT NULL,                          # loadbalancer the job is for
+    created        DATETIME                 NOT NULL,                              # timestamp of when the job was queued
+    claimed        DATETIME                 DEFAULT NULL,                          # timestamp of when an API server took the job, NULL if waiting
+    claimed_by     VARCHAR(128)             DEFAULT NULL,                          # host:pid of the API server running the job
+    PRIMARY KEY (id),
+    KEY claimed (claimed)
+) ENGINE=InnoDB DEFAULT CHARSET latin1;
+
+# Raised to have the API servers drop their in-memory caches of limits and responses
+CREATE TABLE cache_version (
+    id             INT                      NOT NULL,                              # always 1
+    version        INT                      NOT NULL DEFAULT 0,                    # raised by DELETE /v1/caches on the admin API
+    PRIMARY KEY (id)
+) ENGINE=InnoDB DEFAULT CHARSET latin1;
+
+INSERT INTO cache_version VALUES (1, 0);
+
+# In-memory cache counters last reported by each API server
+CREATE TABLE api_caches (
+    name           VARCHAR(128)             NOT NULL,                              # host:pid of the API server
+    version        INT                      NOT NULL,                              # cache_version the server's caches were last dropped for
+    stats          TEXT                     NOT NULL,                              # JSON encoded counters of each cache
+    updated        DATETIME                 NOT NULL,                              # timestamp of the last report
+    PRIMARY KEY (name)
+) ENGINE=InnoDB DEFAULT CHARSET latin1;
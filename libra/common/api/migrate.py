@@ -0,0 +1,303 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Bring an existing LBaaS database up to the schema the models expect.
+
+    lbaas.sql creates a new database at the latest version.  A database
+    made by an older lbaas.sql is upgraded by running the MIGRATIONS it has
+    not had yet, each one raising the minor number in the versions table.
+    Every step looks at what is already there first, so it is safe to run
+    against a database which has some of the changes already. """
+
+import ConfigParser
+import datetime
+import sys
+
+from oslo.config import cfg
+from sqlalchemy import inspect
+
+from libra import __version__
+from libra.common.api import usage
+from libra.common.api.lbaas import ApiCaches, CacheVersion, JobOutbox
+from libra.common.api.lbaas import StatsRollup, Versions
+from libra.common.api.lbaas import db_session
+from libra.common.api.lbaas import make_engine, metadata
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+SCHEMA_MAJOR = 2
+
+# Indexes for the queries the API servers and schedulers run most, as
+# declared on the models
+INDEX_PACK = [
+    'devices_status',
+    'devices_name',
+    'nodes_lbid',
+    'loadbalancers_tenantid_status',
+    'stats_period_end',
+    'loadbalancers_devices_loadbalancer',
+    'loadbalancers_devices_device',
+    'device'
+]
+
+
+def _add_job_outbox(conn):
+    JobOutbox.__table__.create(conn, checkfirst=True)
+
+
+def _add_config_version(conn):
+    if 'configVersion' not in _columns(conn, 'devices'):
+        conn.execute(
+            'ALTER TABLE devices ADD COLUMN configVersion INT NOT NULL '
+            'DEFAULT 0'
+        )
+
+
+def _add_indexes(conn):
+    for index in pack_indexes():
+        if not _has_index(conn, index):
+            index.create(conn)
+
+
+def _add_stats_rollup(conn):
+    StatsRollup.__table__.create(conn, checkfirst=True)
+
+
+def _partition_stats(conn):
+    """ Partition stats by day so old stats can be dropped a day at a time.
+        MySQL only, the table is rebuilt so this takes a while. """
+    if conn.dialect.name != 'mysql':
+        return
+    partitioned = conn.execute(
+        'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = \'stats\' '
+        'AND PARTITION_NAME IS NOT NULL'
+    ).first()
+    if partitioned:
+        return
+    today = datetime.datetime.utcnow().date()
+    last = today + datetime.timedelta(days=usage.PARTITIONS_AHEAD)
+    oldest = conn.execute('SELECT MIN(period_end) FROM stats').scalar()
+    first = oldest.date() if oldest else today
+    # The partition column has to be in the primary key
+    conn.execute(
+        'ALTER TABLE stats DROP PRIMARY KEY, '
+        'ADD PRIMARY KEY (id, period_end) '
+        'PARTITION BY RANGE (TO_DAYS(period_end)) {0}'
+        .format(usage.partition_clause(first, last))
+    )
+
+
+def _add_row_versions(conn):
+    for table in ('loadbalancers', 'devices'):
+        if 'version' not in _columns(conn, table):
+            conn.execute(
+                'ALTER TABLE {0} ADD COLUMN version INT NOT NULL DEFAULT 0'
+                .format(table)
+            )
+
+
+def _add_cache_tables(conn):
+    CacheVersion.__table__.create(conn, checkfirst=True)
+    ApiCaches.__table__.create(conn, checkfirst=True)
+    if conn.execute(CacheVersion.__table__.select()).first() is None:
+        conn.execute(CacheVersion.__table__.insert(), id=1, version=0)
+
+
+# (minor version, description, step)
+MIGRATIONS = [
+    (1, 'Gearman job outbox', _add_job_outbox),
+    (2, 'Device configuration versions', _add_config_version),
+    (3, 'Indexes for hot queries', _add_indexes),
+    (4, 'Usage statistics rollup', _add_stats_rollup),
+    (5, 'Partition stats by day', _partition_stats),
+    (6, 'Row versions on load balancers and devices', _add_row_versions),
+    (7, 'API server cache versions and counters', _add_cache_tables)
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def pack_indexes():
+    """ The model Index objects named in INDEX_PACK """
+    return [
+        index for table in metadata.sorted_tables for index in table.indexes
+        if index.name in INDEX_PACK
+    ]
+
+
+def _columns(conn, table):
+    return set(column['name'] for column in inspect(conn).get_columns(table))
+
+
+def _has_index(conn, index):
+    """ True if the table has an index starting with the index's columns,
+        whatever it is called """
+    columns = tuple(column.name for column in index.columns)
+    for found in inspect(conn).get_indexes(index.table.name):
+        if tuple(found['column_names'][:len(columns)]) == columns:
+            return True
+    return False
+
+
+def get_version(conn):
+    """ The minor schema version, None if there is no version recorded """
+    if 'versions' not in inspect(conn).get_table_names():
+        return None
+    return conn.execute(
+        Versions.__table__.select().
+        where(Versions.major == SCHEMA_MAJOR)
+    ).fetchone().minor
+
+
+def migrate(conn, to=LATEST):
+    """ Run the migrations the database has not had, up to version to.
+        Returns the descriptions of the steps run. """
+    current = get_version(conn)
+    if current is None:
+        raise Exception(
+            'No schema version {0} found, is this an LBaaS database?'
+            .format(SCHEMA_MAJOR)
+        )
+    done = []
+    for version, description, step in MIGRATIONS:
+        if version <= current or version > to:
+            continue
+        LOG.info(
+            'Migrating schema to {0}.{1}: {2}'
+            .format(SCHEMA_MAJOR, version, description)
+        )
+        step(conn)
+        conn.execute(
+            Versions.__table__.update().
+            where(Versions.major == SCHEMA_MAJOR).
+            values(minor=version)
+        )
+        done.append(description)
+    return done
+
+
+class SchemaError(Exception):
+    pass
+
+
+def check_schema(conn):
+    """ Compare the database with the models, returning a list of what is
+        missing or out of date """
+    missing, problems = _compare(conn)
+    return missing + problems
+
+
+def _compare(conn):
+    # Tables and columns the models query, which break the ORM if they are
+    # missing, and everything else (indexes, the version number) which only
+    # costs performance
+    missing = []
+    problems = []
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    for table in metadata.sorted_tables:
+        if table.name not in tables:
+            missing.append('table {0} is missing'.format(table.name))
+            continue
+        columns = _columns(conn, table.name)
+        for column in table.columns:
+            if column.name not in columns:
+                missing.append(
+                    'column {0}.{1} is missing'
+                    .format(table.name, column.name)
+                )
+        for index in table.indexes:
+            if not _has_index(conn, index):
+                problems.append(
+                    'index on {0}({1}) is missing'.format(
+                        table.name,
+                        ', '.join(column.name for column in index.columns)
+                    )
+                )
+    if 'versions' in tables:
+        version = get_version(conn)
+        if version < LATEST:
+            problems.append(
+                'schema version {0}.{1} is older than {0}.{2}'
+                .format(SCHEMA_MAJOR, version, LATEST)
+            )
+    return missing, problems
+
+
+def check_at_startup():
+    """ Compare the database with the models when a server starts.
+
+        Raises SchemaError if a table or column is missing, as every query
+        of that model fails, the version columns included.  Missing indexes
+        are only logged.  If the database cannot be reached the check is
+        skipped, the server starts and waits for it as usual. """
+    try:
+        with db_session() as session:
+            missing, problems = _compare(session.connection())
+            session.commit()
+    except Exception:
+        LOG.exception('Could not check the database schema')
+        return
+    for problem in missing + problems:
+        LOG.error('Database schema: {0}'.format(problem))
+    if missing:
+        raise SchemaError(
+            'Database schema is missing {0} tables or columns, run '
+            'libra_db_migrate to bring it up to date'.format(len(missing))
+        )
+    if problems:
+        LOG.error('Run libra_db_migrate to bring the database up to date')
+
+
+def main():
+    # Registers the [admin_api] options, the migration runs against the
+    # admin API's database servers
+    import libra.admin_api  # noqa
+
+    cfg.CONF.register_cli_opts([
+        cfg.BoolOpt('check',
+                    default=False,
+                    help='Only report what the database is missing'),
+        cfg.IntOpt('to',
+                   default=LATEST,
+                   help='Minor schema version to migrate to'),
+    ])
+    cfg.CONF(project='libra', version=__version__)
+    log.setup('libra')
+
+    # DDL only goes to the first server, Galera replicates it to the rest
+    config = ConfigParser.SafeConfigParser()
+    config.read(cfg.CONF['config_file'])
+    section = cfg.CONF['admin_api']['db_sections'][0]
+    engine = make_engine(config._sections[section])
+
+    with engine.connect() as conn:
+        if cfg.CONF['check']:
+            problems = check_schema(conn)
+            for problem in problems:
+                print problem
+            return 1 if problems else 0
+        for description in migrate(conn, cfg.CONF['to']):
+            print 'Done: {0}'.format(description)
+        problems = check_schema(conn)
+        for problem in problems:
+            print 'Still to fix: {0}'.format(problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,6 +19,7 @@ eventlet.monkey_patch()
 from libra.common.options import CONF
 from libra.common.api.lbaas import LoadBalancer, db_session
 from libra.common.api.lbaas import Stats
+from libra.common.api import usage
 from libra.openstack.common.notifier import api as notifier_api
 from libra.openstack.common import timeutils
 from libra.openstack.common import log as logging
@@ -198,14 +199,23 @@ def _send_usage(event_type, start, stop):
             LOG.info("Starting usage notifications from first saved {0}".
                      format(start))
 
-        # Now that we know where to start, make sure we have stats to
-        # send for the time period. Use stats that end in this period.
-        # It's ok if the stats started in a previous period. Some skew
-        # is allowed.
-        total = session.query(Stats).\
-            filter(Stats.period_end >= start).\
-            filter(Stats.period_end < stop).\
-            count()
+        # Periods after the first one in the rollup are read from it in
+        # one go, earlier ones (from before there was a rollup) are summed
+        # from the raw stats.  The first rollup period can be incomplete.
+        rollup_start = usage.rollup_start(session)
+        if rollup_start is not None and start > rollup_start:
+            rollup = usage.rollup_usage(session, start, stop, N)
+            total = sum(len(lbs) for lbs in rollup.values())
+        else:
+            rollup = None
+            # Now that we know where to start, make sure we have stats to
+            # send for the time period. Use stats that end in this period.
+            # It's ok if the stats started in a previous period. Some skew
+            # is allowed.
+            total = session.query(Stats).\
+                filter(Stats.period_end >= start).\
+                filter(Stats.period_end < stop).\
+                count()
         if total == 0:
             LOG.info("No usage statistics to send between {0} and {1}"
                      .format(start, stop))
@@ -226,13 +236,20 @@ def _send_usage(event_type, start, stop):
         while end <= stop:
             # Loop through all N periods up to the current period
             # sending usage notifications to MnB
-            stats = session.query(
-                Stats.lbid,
-                func.sum(Stats.bytes_out)
-            ).group_by(Stats.lbid).\
-                filter(Stats.period_end >= start).\
-                filter(Stats.period_end < end).\
-                all()
+            if rollup is not None:
+                stats = rollup.get(start)
+            elif rollup_start is not None and start > rollup_start:
+                # Caught up with the rollup
+                rollup = usage.rollup_usage(session, start, stop, N)
+                stats = rollup.get(start)
+            else:
+                stats = session.query(
+                    Stats.lbid,
+                    func.sum(Stats.bytes_out)
+                ).group_by(Stats.lbid).\
+                    filter(Stats.period_end >= start).\
+                    filter(Stats.period_end < end).\
+                    all()
 
             # Prep for the next loop here in case of continue
             prev_start = start
@@ -283,19 +300,21 @@ def _send_usage(event_type, start, stop):
                 _notify('lbaas', event_type, payload)
                 count += 1
 
+        session.commit()
+
         # Purge old stats
+        exp = None
         if CONF['admin_api']['stats_purge_enable']:
             hours = CONF['admin_api']['stats_purge_days'] * 24
             delta = datetime.timedelta(hours=hours)
             exp = timeutils.utcnow() - delta
-            exp_time = exp.strftime('%Y-%m-%d %H:%M:%S')
-            purged = session.query(Stats).\
-                filter(Stats.period_end < exp_time).\
-                delete()
-            LOG.info("Purged {0} usage statistics from before {1}".
-                     format(purged, exp_time))
+            usage.purge_stats(session, exp)
+            usage.purge_rollup(session, exp)
 
         session.commit()
+        usage.update_stats_partitions(
+            session.get_bind(), timeutils.utcnow().date(), exp
+        )
     LOG.info("Sent {0} MnB {1} notifications to MnB".format(count, event_type))
 
 
@@ -0,0 +1,179 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import socket
+
+from datetime import datetime, timedelta
+
+import eventlet
+from eventlet import queue
+from pecan import conf
+from sqlalchemy import event, or_
+
+from libra.common.api.lbaas import JobOutbox, RoutingSession, db_session
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+_drainer = None
+
+
+def queue_job(session, job_type, host, data, lbid):
+    """ Add a Gearman job to the outbox as part of the caller's transaction.
+
+        The job is only sent once the transaction commits, and is not lost
+        if this API server restarts before it has been sent. """
+    session.add(JobOutbox(
+        job_type=job_type, host=str(host), data=json.dumps(data),
+        lbid=lbid, created=datetime.now()
+    ))
+    session.outbox_queued = True
+
+
+def job_started(outbox_ids):
+    """ Claim jobs taken from the outbox afresh as they start to run, so the
+        time spent waiting to be sent does not count towards the claim
+        timeout.  Returns False if another server has claimed all of them
+        again in the meantime, in which case they must not be sent. """
+    name = _drainer and _drainer.name
+    with db_session() as session:
+        claimed = session.query(JobOutbox).\
+            filter(JobOutbox.id.in_(outbox_ids)).\
+            filter(JobOutbox.claimed_by == name).\
+            update({'claimed': datetime.now()}, synchronize_session=False)
+        session.commit()
+    return claimed > 0
+
+
+def job_done(outbox_ids):
+    """ Remove jobs from the outbox once they have been run """
+    with db_session() as session:
+        session.query(JobOutbox).\
+            filter(JobOutbox.id.in_(outbox_ids)).\
+            delete(synchronize_session=False)
+        session.commit()
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(session):
+    # Don't wait for the next poll if we have just queued something
+    if getattr(session, 'outbox_queued', False):
+        session.outbox_queued = False
+        if _drainer is not None:
+            _drainer.wake()
+
+
+class OutboxDrainer(object):
+    """ Send the jobs in the outbox.
+
+        Every API server runs a drainer.  They take up to batch_size jobs at a
+        time, oldest first, marking them as claimed so other servers leave
+        them alone.  The claim is renewed when the job leaves the dispatcher
+        queue to be sent (see job_started) and the job is removed from the
+        outbox when it has run.  If it is still there claim_timeout seconds
+        after it was last claimed the server is assumed to have died and the
+        job is claimed again, so a job may be sent more than once but is
+        never lost. """
+
+    def __init__(self):
+        global _drainer
+        self.name = '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        self.poll = conf.gearman.outbox_poll
+        self.batch_size = conf.gearman.outbox_batch
+        self.claim_timeout = conf.gearman.outbox_timeout
+        self.signal = queue.LightQueue()
+        self.running = True
+        _drainer = self
+        eventlet.spawn_n(self.run)
+
+    def shutdown(self):
+        self.running = False
+        self.wake()
+
+    def wake(self):
+        if not self.signal.qsize():
+            self.signal.put(None)
+
+    def run(self):
+        # Imported here as gearman_client needs this module
+        from libra.common.api.gearman_client import submit_job
+
+        while self.running:
+            try:
+                self.signal.get(timeout=self.poll)
+            except queue.Empty:
+                pass
+            try:
+                # Keep going while there is a backlog
+                while self.running and self.drain(submit_job) == \
+                        self.batch_size:
+                    pass
+            except Exception:
+                LOG.exception('Exception occurred draining the job outbox')
+
+    def drain(self, submit_job):
+        jobs = self._claim()
+        # Drop duplicate jobs in the batch, they are all removed once the
+        # first has run.  UPDATEs for a device are coalesced further along.
+        unique = {}
+        order = []
+        for outbox_id, job_type, host, data, lbid in jobs:
+            key = (job_type, host, data, lbid)
+            if key in unique:
+                unique[key].append(outbox_id)
+            else:
+                unique[key] = [outbox_id]
+                order.append(key)
+        if len(order) < len(jobs):
+            LOG.info(
+                'Dropped {0} duplicate jobs from the outbox'
+                .format(len(jobs) - len(order))
+            )
+        for key in order:
+            job_type, host, data, lbid = key
+            submit_job(
+                job_type, host, json.loads(data), lbid,
+                outbox_ids=unique[key]
+            )
+        return len(jobs)
+
+    def _claim(self):
+        now = datetime.now()
+        expired = now - timedelta(seconds=self.claim_timeout)
+        NULL = None  # For pep8
+        with db_session() as session:
+            rows = session.query(JobOutbox).\
+                filter(or_(JobOutbox.claimed == NULL,
+                           JobOutbox.claimed < expired)).\
+                order_by(JobOutbox.id).\
+                limit(self.batch_size).\
+                with_lockmode('update').\
+                all()
+            jobs = []
+            for row in rows:
+                if row.claimed is not None:
+                    LOG.warning(
+                        'Reclaiming job {0} from {1}, it was not completed'
+                        .format(row.id, row.claimed_by)
+                    )
+                row.claimed = now
+                row.claimed_by = self.name
+                jobs.append(
+                    (row.id, row.job_type, row.host, row.data, row.lbid)
+                )
+            session.commit()
+        return jobs
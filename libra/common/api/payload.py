@@ -0,0 +1,175 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from sqlalchemy.orm import subqueryload
+
+from libra.common.api.lbaas import LoadBalancer, Device, HealthMonitor, Node
+
+
+def device_loadbalancers(session, device_id, exclude_lbid=None):
+    """ Load the live load balancers on a device for an UPDATE message.
+
+        Nodes and monitors are loaded up front, so this is always three
+        queries (load balancers, nodes, monitors) however many load
+        balancers and nodes the device has.  Load balancers without nodes are
+        skipped as before.  If exclude_lbid is given that load balancer and
+        any others pending delete are left out, for the device's remaining
+        configuration after a delete. """
+    query = session.query(LoadBalancer).\
+        join(LoadBalancer.devices).\
+        filter(Device.id == device_id).\
+        filter(LoadBalancer.status != 'DELETED').\
+        filter(LoadBalancer.nodes.any())
+    if exclude_lbid is not None:
+        query = query.filter(LoadBalancer.id != exclude_lbid).\
+            filter(LoadBalancer.status != 'PENDING_DELETE')
+    return query.options(
+        subqueryload(LoadBalancer.nodes),
+        subqueryload(LoadBalancer.monitors)
+    ).order_by(LoadBalancer.id).all()
+
+
+def build_update(session, lbs):
+    """ Build the worker UPDATE message for a list of load balancers.
+
+        The load balancers should come from device_loadbalancers() so no
+        further queries are made, apart from a single flush if any of them
+        need a default health monitor adding, which the caller must commit
+        to keep.  Returns the message and the IDs of the load balancers
+        with a node in ERROR. """
+    job_data = {
+        'hpcs_action': 'UPDATE',
+        'loadBalancers': []
+    }
+    degraded = []
+    new_monitors = []
+
+    for lb in lbs:
+        lb_data = {
+            'name': lb.name,
+            'protocol': lb.protocol,
+            'algorithm': lb.algorithm,
+            'port': lb.port,
+            'nodes': [],
+            'monitor': {}
+        }
+        for node in lb.nodes:
+            if not node.enabled:
+                continue
+            lb_data['nodes'].append(_node_data(node))
+            # Track if we have a DEGRADED LB
+            if node.status == 'ERROR' and lb.id not in degraded:
+                degraded.append(lb.id)
+
+        # Add a default health monitor if one does not exist
+        if lb.monitors:
+            monitor = lb.monitors[0]
+        else:
+            # Set it to a default configuration
+            monitor = HealthMonitor(
+                lbid=lb.id, type="CONNECT", delay=30,
+                timeout=30, attempts=2, path=None
+            )
+            new_monitors.append(monitor)
+
+        monitor_data = {
+            'type': monitor.type,
+            'delay': monitor.delay,
+            'timeout': monitor.timeout,
+            'attempts': monitor.attempts
+        }
+        if monitor.path is not None:
+            monitor_data['path'] = monitor.path
+
+        # All new LBs created since these options were supported
+        # will have default values in the DB. Pre-existing LBs will
+        # not have any values, so we need to check for that.
+        if any([lb.client_timeout, lb.server_timeout,
+                lb.connect_timeout, lb.connect_retries]):
+            lb_data['options'] = {
+                'client_timeout': lb.client_timeout,
+                'server_timeout': lb.server_timeout,
+                'connect_timeout': lb.connect_timeout,
+                'connect_retries': lb.connect_retries
+            }
+
+        lb_data['monitor'] = monitor_data
+        job_data['loadBalancers'].append(lb_data)
+
+    if new_monitors:
+        session.add_all(new_monitors)
+        session.flush()
+
+    return job_data, degraded
+
+
+def build_patch(session, lb, node_ids):
+    """ Build the worker PATCH message for changed nodes of a load balancer.
+
+        node_ids are the nodes which have been added, changed or deleted;
+        those no longer in the DB are sent as removed.  Disabled nodes are
+        sent with a DISABLED condition, the worker keeps them but stops
+        sending them traffic.  The caller adds the configuration versions. """
+    lb_data = {
+        'protocol': lb.protocol,
+        'nodes': [],
+        'removed': []
+    }
+    nodes = session.query(Node).\
+        filter(Node.lbid == lb.id).\
+        filter(Node.id.in_(node_ids)).\
+        all()
+    for node in nodes:
+        lb_data['nodes'].append(_node_data(node))
+    found = set(node.id for node in nodes)
+    lb_data['removed'] = [node_id for node_id in node_ids
+                          if node_id not in found]
+    return {
+        'hpcs_action': 'PATCH',
+        'loadBalancers': [lb_data]
+    }
+
+
+def next_version(session, device_id, base=None):
+    """ Move a device on to a new configuration version.
+
+        Returns the new version, or None if base is given and the device is
+        no longer at that version because another change has been sent. """
+    query = session.query(Device).filter(Device.id == device_id)
+    if base is not None:
+        query = query.filter(Device.configVersion == base)
+    updated = query.update(
+        {Device.configVersion: Device.configVersion + 1,
+         Device.version: Device.version + 1},
+        synchronize_session=False
+    )
+    if not updated:
+        return None
+    return session.query(Device.configVersion).\
+        filter(Device.id == device_id).scalar()
+
+
+def _node_data(node):
+    if node.enabled:
+        condition = 'ENABLED'
+    else:
+        condition = 'DISABLED'
+    backup = 'FALSE'
+    if node.backup != 0:
+        backup = 'TRUE'
+    return {
+        'id': node.id, 'port': node.port,
+        'address': node.address, 'weight': node.weight,
+        'condition': condition, 'backup': backup
+    }
@@ -0,0 +1,184 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Count the SQL queries made by each API request and scheduler run.
+
+    The engines RoutingSession builds call record() after every query.  The
+    query, the rows it returned and the time it took are added to the
+    scope active in the greenthread, opened by the QueryAccounting WSGI
+    middleware for a request or the counted decorator for a scheduler
+    method.  When a scope ends its totals are logged and kept in a rolling
+    window of recent runs, reported by the admin API.  A query taking more
+    than the slow_query_time option is logged with its parameters whether
+    or not there is a scope. """
+
+import collections
+import contextlib
+import functools
+import re
+import threading
+import time
+
+from oslo.config import cfg
+
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+# Path segments which are IDs, so requests for different objects add up
+_ID = re.compile(r'/\d+(?=/|$)')
+
+_local = threading.local()
+_window = None
+_slow_query_time = None
+
+
+def get_window():
+    """ Return the process-wide window of recent runs, creating it if
+        needed """
+    global _window
+    if _window is None:
+        _window = QueryWindow()
+    return _window
+
+
+def slow_query_time():
+    global _slow_query_time
+    if _slow_query_time is None:
+        try:
+            _slow_query_time = cfg.CONF['slow_query_time']
+        except cfg.NoSuchOptError:
+            # Not a server which registers the option
+            _slow_query_time = 0
+    return _slow_query_time
+
+
+def current():
+    """ The scope active in this greenthread, or None """
+    return getattr(_local, 'stats', None)
+
+
+def record(statement, parameters, seconds, rows):
+    stats = current()
+    if stats is not None:
+        stats.add(1, rows, seconds)
+    limit = slow_query_time()
+    if limit and seconds >= limit:
+        LOG.warning(
+            'Slow query, {0:.3f} seconds{1}: {2} {3!r}'.format(
+                seconds,
+                ' in {0}'.format(stats.name) if stats is not None else '',
+                statement, parameters
+            )
+        )
+
+
+@contextlib.contextmanager
+def scope(name):
+    """ Count the queries made in the block towards name.  A scope opened
+        inside another is counted in both. """
+    previous = current()
+    stats = QueryStats(name)
+    _local.stats = stats
+    start = time.time()
+    try:
+        yield stats
+    finally:
+        _local.stats = previous
+        elapsed = time.time() - start
+        if previous is not None:
+            previous.add(stats.queries, stats.rows, stats.seconds)
+        if stats.queries:
+            LOG.info(
+                'SQL {0}: {1} queries, {2} rows, {3:.1f} ms of {4:.1f} ms'
+                .format(
+                    name, stats.queries, stats.rows, stats.seconds * 1000,
+                    elapsed * 1000
+                )
+            )
+        get_window().add(stats, elapsed)
+
+
+def counted(func):
+    """ Decorator for scheduler methods, counting each run under
+        Class.method """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        name = '{0}.{1}'.format(self.__class__.__name__, func.__name__)
+        with scope(name):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+class QueryStats(object):
+    """ The totals for one run of a scope """
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+    def add(self, queries, rows, seconds):
+        self.queries += queries
+        # Drivers give -1 when they do not know
+        self.rows += max(rows, 0)
+        self.seconds += seconds
+
+
+class QueryWindow(object):
+    """ The last size runs of each API route and scheduler method """
+
+    def __init__(self, size=100):
+        self.size = size
+        self.runs = {}
+
+    def add(self, stats, elapsed):
+        if stats.name not in self.runs:
+            self.runs[stats.name] = collections.deque(maxlen=self.size)
+        self.runs[stats.name].append(
+            (stats.queries, stats.rows, stats.seconds, elapsed)
+        )
+
+    def summary(self):
+        result = {}
+        for name, runs in self.runs.items():
+            count = len(runs)
+            queries, rows, seconds, elapsed = zip(*runs)
+            result[name] = {
+                'runs': count,
+                'queries_avg': round(float(sum(queries)) / count, 1),
+                'queries_max': max(queries),
+                'rows_avg': round(float(sum(rows)) / count, 1),
+                'sql_ms_avg': round(sum(seconds) * 1000 / count, 3),
+                'sql_ms_max': round(max(seconds) * 1000, 3),
+                'total_ms_avg': round(sum(elapsed) * 1000 / count, 3)
+            }
+        return result
+
+
+class QueryAccounting(object):
+    """ WSGI middleware counting the queries each request makes under its
+        method and path, with IDs in the path replaced by {id} """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, env, start_response):
+        route = '{0} {1}'.format(
+            env.get('REQUEST_METHOD'), _ID.sub('/{id}', env['PATH_INFO'])
+        )
+        with scope(route):
+            return self.app(env, start_response)
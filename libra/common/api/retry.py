@@ -0,0 +1,133 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Replay write transactions which lose a deadlock.
+
+    Galera fails a transaction at commit if another node committed a
+    conflicting write first (a certification failure), and InnoDB fails
+    one which deadlocks or waits too long for a row lock.  An ORM update of
+    a load balancer or device fails with StaleDataError if the row has
+    been changed since it was read.  Either way the transaction has been
+    rolled back and running it again usually works.
+
+    A unit of work given to run(), or a method decorated with retried, must
+    open its own db_session and do nothing outside the database before it
+    commits, so running it again is safe.  Retries are counted per unit
+    and reported by the admin API. """
+
+import collections
+import functools
+
+import eventlet
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm.exc import StaleDataError
+
+from libra.common.api.timeouts import backoff
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+# ER_LOCK_WAIT_TIMEOUT and ER_LOCK_DEADLOCK, which Galera also gives for a
+# certification failure
+RETRY_ERRORS = (1205, 1213)
+
+ATTEMPTS = 5
+BACKOFF = 0.05
+BACKOFF_CAP = 1.0
+
+_stats = None
+
+
+def get_retry_stats():
+    """ Return the process-wide retry counters, creating them if needed """
+    global _stats
+    if _stats is None:
+        _stats = RetryStats()
+    return _stats
+
+
+def is_retryable(error):
+    """ True if error is a deadlock, lock wait time out or version
+        conflict """
+    if isinstance(error, StaleDataError):
+        return True
+    if not isinstance(error, DBAPIError):
+        return False
+    # MySQLdb gives the server error number as the first argument, other
+    # drivers such as mysql-connector keep it in errno
+    errno = getattr(error.orig, 'errno', None)
+    if errno is None:
+        args = getattr(error.orig, 'args', None)
+        errno = args[0] if args else None
+    return errno in RETRY_ERRORS
+
+
+def run(name, func, *args, **kwargs):
+    """ Call func, calling it again after a short random wait if it fails
+        with a deadlock or conflict, up to ATTEMPTS times in all """
+    stats = get_retry_stats()
+    attempt = 0
+    while True:
+        try:
+            result = func(*args, **kwargs)
+        except (DBAPIError, StaleDataError) as e:
+            if not is_retryable(e):
+                raise
+            attempt += 1
+            if attempt == ATTEMPTS:
+                stats.add(name, 'failed')
+                LOG.error(
+                    'Giving up on {0} after {1} conflicts: {2}'
+                    .format(name, attempt, getattr(e, 'orig', e))
+                )
+                raise
+            stats.add(name, 'retried')
+            delay = backoff(attempt, BACKOFF, BACKOFF_CAP)
+            LOG.warning(
+                'Conflict in {0}, retrying in {1:.3f} seconds: {2}'
+                .format(name, delay, getattr(e, 'orig', e))
+            )
+            eventlet.sleep(delay)
+            continue
+        if attempt:
+            stats.add(name, 'recovered')
+        return result
+
+
+def retried(func):
+    """ Decorator for methods which are a unit of work, counting retries
+        under Class.method """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        name = '{0}.{1}'.format(self.__class__.__name__, func.__name__)
+        return run(name, func, self, *args, **kwargs)
+    return wrapper
+
+
+class RetryStats(object):
+    """ How often each unit of work has been retried ('retried'), has then
+        succeeded ('recovered') or ran out of attempts ('failed') """
+
+    def __init__(self):
+        self.counts = collections.defaultdict(
+            lambda: {'retried': 0, 'recovered': 0, 'failed': 0}
+        )
+
+    def add(self, name, outcome):
+        self.counts[name][outcome] += 1
+
+    def summary(self):
+        return dict((name, dict(counts))
+                    for name, counts in self.counts.items())
@@ -0,0 +1,169 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import random
+import time
+
+from pecan import conf
+
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+_tracker = None
+_breaker = None
+
+
+def get_tracker():
+    """ Return the process-wide latency tracker, creating it if needed """
+    global _tracker
+    if _tracker is None:
+        _tracker = LatencyTracker(
+            conf.gearman.job_timeout_min, conf.gearman.job_timeout
+        )
+    return _tracker
+
+
+def get_breaker():
+    """ Return the process-wide circuit breaker, creating it if needed """
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker(
+            conf.gearman.breaker_threshold, conf.gearman.breaker_cooldown
+        )
+    return _breaker
+
+
+def backoff(attempt, base=1.0, cap=30.0):
+    """ Seconds to wait before retry number attempt (from 1), with jitter """
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    return random.uniform(delay / 2, delay)
+
+
+class LatencyTracker(object):
+    """ Derive Gearman poll timeouts from how fast each worker answers.
+
+        Response times are kept per (device, action) as an EWMA and the last
+        window samples, used as a cheap percentile estimate.  Until
+        min_samples responses have been seen the full max_timeout is used,
+        after that the timeout is a few times the 99th percentile (or EWMA
+        if higher), but never outside min_timeout and max_timeout.  A time
+        out is recorded as a sample of the timeout used, so a device that
+        slows down gets longer timeouts rather than failing every job. """
+
+    def __init__(self, min_timeout, max_timeout, window=100, min_samples=10,
+                 alpha=0.2):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.window = window
+        self.min_samples = min_samples
+        self.alpha = alpha
+        self.ewma = {}
+        self.samples = {}
+
+    def record(self, host, action, seconds):
+        key = (host, action)
+        if key in self.ewma:
+            self.ewma[key] += self.alpha * (seconds - self.ewma[key])
+        else:
+            self.ewma[key] = seconds
+            self.samples[key] = collections.deque(maxlen=self.window)
+        self.samples[key].append(seconds)
+
+    def percentile(self, host, action, pct):
+        samples = self.samples.get((host, action))
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100.0))
+        return ordered[index]
+
+    def timeout(self, host, action):
+        key = (host, action)
+        samples = self.samples.get(key)
+        if samples is None or len(samples) < self.min_samples:
+            return self.max_timeout
+        expected = max(
+            self.percentile(host, action, 99) * 3, self.ewma[key] * 5
+        )
+        return max(self.min_timeout, min(self.max_timeout, expected))
+
+    def stats(self, host, action):
+        key = (host, action)
+        if key not in self.ewma:
+            return None
+        return {
+            'samples': len(self.samples[key]),
+            'ewma': round(self.ewma[key], 3),
+            'p50': round(self.percentile(host, action, 50), 3),
+            'p99': round(self.percentile(host, action, 99), 3),
+            'timeout': round(self.timeout(host, action), 3)
+        }
+
+
+class CircuitBreaker(object):
+    """ Stop sending jobs to devices which keep failing to answer.
+
+        After threshold consecutive failures jobs for the device fail
+        immediately for cooldown seconds.  The first job after that is let
+        through as a trial; if it fails too the device is cut off again for
+        twice as long (up to ten times cooldown), if it succeeds the device
+        is back to normal. """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = collections.defaultdict(int)
+        self.open_until = {}
+        self.open_for = {}
+
+    def allow(self, host):
+        if self.threshold <= 0:
+            return True
+        until = self.open_until.get(host)
+        if until is None:
+            return True
+        if time.time() < until:
+            return False
+        # Let one trial job through, the rest fail until it has answered
+        self.open_until[host] = time.time() + self.open_for[host]
+        return True
+
+    def success(self, host):
+        self.failures.pop(host, None)
+        if self.open_until.pop(host, None) is not None:
+            LOG.info('Device {0} is answering again'.format(host))
+            del self.open_for[host]
+
+    def failure(self, host):
+        if self.threshold <= 0:
+            return
+        self.failures[host] += 1
+        if host in self.open_until:
+            # The trial job failed
+            self.open_for[host] = min(
+                self.open_for[host] * 2, self.cooldown * 10
+            )
+        elif self.failures[host] >= self.threshold:
+            self.open_for[host] = self.cooldown
+        else:
+            return
+        self.open_until[host] = time.time() + self.open_for[host]
+        LOG.warning(
+            'Device {0} failed {1} times in a row, not sending it jobs for '
+            '{2} seconds'
+            .format(host, self.failures[host], self.open_for[host])
+        )
@@ -0,0 +1,221 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Storage of usage statistics.
+
+    Every METRICS result is kept as a raw row in stats and also added to
+    its load balancer's row in stats_rollup for the usage_freq bucket the
+    result's period ends in, so usage notifications read one row per load
+    balancer per period rather than summing raw rows.
+
+    On MySQL the stats table can be partitioned by day (schema 2.5), in
+    which case old stats are purged by dropping whole days and
+    partitions for the next few days are added ahead of time.  Without
+    partitions old rows are deleted as before. """
+
+import collections
+import datetime
+
+from sqlalchemy import func
+
+from libra.common.api.lbaas import Stats, StatsRollup
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+# Days of stats partitions kept ready ahead of today
+PARTITIONS_AHEAD = 3
+
+
+def bucket(ts, minutes):
+    """ The start of the usage period ts falls in, periods being minutes
+        long and aligned to the hour like the usage scheduler's """
+    return ts - datetime.timedelta(minutes=ts.minute % minutes,
+                                   seconds=ts.second,
+                                   microseconds=ts.microsecond)
+
+
+def parse_time(value):
+    """ A METRICS utc_start or utc_end, which the worker sends as str() of
+        a datetime """
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.strptime(value.split('.')[0],
+                                      '%Y-%m-%d %H:%M:%S')
+
+
+def add_to_rollup(session, rows, minutes):
+    """ Add (lbid, period_end, bytes_out) rows to their rollup buckets.
+        Returns the number of buckets touched. """
+    totals = collections.defaultdict(lambda: [0, 0])
+    for lbid, period_end, bytes_out in rows:
+        total = totals[(lbid, bucket(parse_time(period_end), minutes))]
+        total[0] += bytes_out
+        total[1] += 1
+    if not totals:
+        return 0
+    params = [{
+        'lbid': lbid, 'bucket_start': bucket_start,
+        'bytes_out': bytes_out, 'samples': samples
+    } for (lbid, bucket_start), (bytes_out, samples) in totals.items()]
+
+    if session.get_bind().dialect.name == 'mysql':
+        session.execute(
+            'INSERT INTO stats_rollup '
+            '(lbid, bucket_start, bytes_out, samples) '
+            'VALUES (:lbid, :bucket_start, :bytes_out, :samples) '
+            'ON DUPLICATE KEY UPDATE '
+            'bytes_out = bytes_out + VALUES(bytes_out), '
+            'samples = samples + VALUES(samples)',
+            params
+        )
+        return len(params)
+
+    table = StatsRollup.__table__
+    for row in params:
+        updated = session.execute(
+            table.update().
+            where(table.c.lbid == row['lbid']).
+            where(table.c.bucket_start == row['bucket_start']).
+            values(bytes_out=table.c.bytes_out + row['bytes_out'],
+                   samples=table.c.samples + row['samples'])
+        ).rowcount
+        if not updated:
+            session.execute(table.insert(), row)
+    return len(params)
+
+
+def rollup_start(session):
+    """ The first bucket in the rollup, None if it is empty """
+    return session.query(func.min(StatsRollup.bucket_start)).scalar()
+
+
+def rollup_usage(session, start, stop, minutes):
+    """ Bytes out per load balancer for each usage period from start to
+        stop, as {period start: [(lbid, bytes_out)]} """
+    rows = session.query(
+        StatsRollup.lbid, StatsRollup.bucket_start, StatsRollup.bytes_out
+    ).filter(StatsRollup.bucket_start >= start).\
+        filter(StatsRollup.bucket_start < stop).all()
+
+    # Buckets are added up in case usage_freq has changed since they were
+    # made
+    periods = collections.defaultdict(lambda: collections.defaultdict(int))
+    for lbid, bucket_start, bytes_out in rows:
+        periods[bucket(bucket_start, minutes)][lbid] += bytes_out
+    return dict(
+        (period, lbs.items()) for period, lbs in periods.items()
+    )
+
+
+def purge_rollup(session, before):
+    return session.query(StatsRollup).\
+        filter(StatsRollup.bucket_start < before).\
+        delete(synchronize_session=False)
+
+
+def _partition_name(day):
+    return day.strftime('p%Y%m%d')
+
+
+def _partition_day(name):
+    return datetime.datetime.strptime(name, 'p%Y%m%d').date()
+
+
+def stats_partitions(conn):
+    """ The names of the stats table's partitions, empty if it is not
+        partitioned """
+    if conn.dialect.name != 'mysql':
+        return []
+    return [row[0] for row in conn.execute(
+        'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = \'stats\' '
+        'AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION'
+    )]
+
+
+def partition_clause(first_day, last_day):
+    """ Partition definitions for each day from first_day to last_day and a
+        pmax partition catching anything later """
+    parts = []
+    day = first_day
+    while day <= last_day:
+        parts.append(
+            'PARTITION {0} VALUES LESS THAN (TO_DAYS(\'{1}\'))'.format(
+                _partition_name(day), day + datetime.timedelta(days=1)
+            )
+        )
+        day += datetime.timedelta(days=1)
+    parts.append('PARTITION pmax VALUES LESS THAN MAXVALUE')
+    return '({0})'.format(', '.join(parts))
+
+
+def add_stats_partitions(conn, today, partitions):
+    """ Make sure stats has a partition for today and PARTITIONS_AHEAD days
+        after, split out of pmax """
+    days = [_partition_day(name) for name in partitions if name != 'pmax']
+    first = max(days) + datetime.timedelta(days=1) if days else today
+    last = today + datetime.timedelta(days=PARTITIONS_AHEAD)
+    if first > last:
+        return
+    conn.execute(
+        'ALTER TABLE stats REORGANIZE PARTITION pmax INTO {0}'.format(
+            partition_clause(first, last)
+        )
+    )
+    LOG.info('Added stats partitions from {0} to {1}'.format(first, last))
+
+
+def update_stats_partitions(engine, today, before=None):
+    """ Drop the stats partitions for days before the datetime before, if
+        given, and add any missing for the days ahead.
+
+        MySQL commits any open transaction when it runs DDL, so this uses a
+        connection of its own rather than a session and should only be
+        called once the caller's session has committed. """
+    if engine.dialect.name != 'mysql':
+        return
+    conn = engine.connect()
+    try:
+        partitions = stats_partitions(conn)
+        if not partitions:
+            return
+        if before is not None:
+            old = [name for name in partitions
+                   if name != 'pmax' and _partition_day(name) < before.date()]
+            if old:
+                conn.execute(
+                    'ALTER TABLE stats DROP PARTITION {0}'.format(
+                        ', '.join(old)
+                    )
+                )
+                LOG.info('Dropped stats partitions {0}'.format(', '.join(old)))
+                partitions = [name for name in partitions if name not in old]
+        add_stats_partitions(conn, today, partitions)
+    finally:
+        conn.close()
+
+
+def purge_stats(session, before):
+    """ Delete raw stats which ended before the datetime before.  A
+        partitioned stats table is left alone, update_stats_partitions drops
+        whole days of it instead, so up to a day more is kept. """
+    if stats_partitions(session.connection()):
+        return
+    purged = session.query(Stats).\
+        filter(Stats.period_end < before).\
+        delete(synchronize_session=False)
+    LOG.info('Purged {0} usage statistics from before {1}'
+             .format(purged, before))
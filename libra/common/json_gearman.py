@@ -12,8 +12,136 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import hashlib
 import json
+import zlib
 from gearman import GearmanClient, GearmanWorker, DataEncoder
+from gearman import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NONE
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Anything other than plain JSON starts with this and a codec tag byte, JSON
+# text never does so plain JSON from or to older versions still works.
+CODEC_MARKER = '\x00'
+
+# zjson only compresses messages at least this long
+COMPRESS_THRESHOLD = 1024
+
+# Changes a user is waiting for go ahead of other jobs for the same worker,
+# routine polling goes behind them.  Anything else is normal priority.
+_high_priority_actions = ['UPDATE', 'PATCH', 'DELETE', 'SUSPEND', 'ENABLE',
+                          'ASSIGN_IP']
+_low_priority_actions = ['STATS', 'METRICS', 'DIAGNOSTICS', 'DISCOVER']
+
+
+class Message(dict):
+    """ A decoded message, remembering the codec it arrived in. """
+    codec = 'json'
+
+
+class EncodedData(str):
+    """ A message already encoded with a codec, sent as is. """
+
+
+def _dump_json(obj):
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def _encode_zjson(obj):
+    data = _dump_json(obj)
+    if len(data) < COMPRESS_THRESHOLD:
+        # Still framed so the reply comes back as zjson
+        return CODEC_MARKER + 'j' + data
+    return CODEC_MARKER + 'z' + zlib.compress(data, 1)
+
+
+def _decode_zjson(data):
+    return json.loads(zlib.decompress(data))
+
+
+def _encode_msgpack(obj):
+    return CODEC_MARKER + 'm' + msgpack.packb(obj)
+
+
+def _decode_msgpack(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+# Codec name to encoder
+_encoders = {
+    'zjson': _encode_zjson
+}
+# Tag byte to codec name and decoder for the data after the tag
+_decoders = {
+    'j': ('zjson', json.loads),
+    'z': ('zjson', _decode_zjson)
+}
+if msgpack is not None:
+    _encoders['msgpack'] = _encode_msgpack
+    _decoders['m'] = ('msgpack', _decode_msgpack)
+
+
+def codec_names():
+    """ Names of the codecs this host can encode and decode """
+    return ['json'] + sorted(_encoders)
+
+
+def encode(obj, codec):
+    """ Encode a message with the named codec for sending as is.
+
+        Only use a codec the other end has listed in its DISCOVER response,
+        plain JSON is used for 'json' or an unknown codec. """
+    if codec in _encoders:
+        return EncodedData(_encoders[codec](obj))
+    return EncodedData(_dump_json(obj))
+
+
+def decode(data):
+    """ Decode a message sent with any codec """
+    if data[:1] != CODEC_MARKER:
+        return json.loads(data)
+    name, decoder = _decoders[data[1:2]]
+    obj = decoder(data[2:])
+    if isinstance(obj, dict):
+        obj = Message(obj)
+        obj.codec = name
+    return obj
+
+
+def job_priority(message):
+    """ Gearman priority to submit a worker or pool manager message at """
+    action = message.get('hpcs_action', message.get('action', '')).upper()
+    if action in _high_priority_actions:
+        return PRIORITY_HIGH
+    if action in _low_priority_actions:
+        return PRIORITY_LOW
+    return PRIORITY_NONE
+
+
+def job_unique(task, message):
+    """ Gearman unique key for a message, None for a random one.
+
+        Messages carrying a configuration version get a key made from the
+        worker, action and version, so if the same message is submitted
+        again while the first is still queued or running (a retry after a
+        time out, say) gearmand hands back the first job's result rather
+        than running it twice.  Hashed to fit gearmand's 64 byte limit.
+
+        Only such resends are deduplicated.  Every UPDATE or PATCH sent
+        moves the device on to a new version, so two different messages
+        never share a key: keyed on the device alone, a newer configuration
+        would get the result of the older one still queued and never reach
+        the worker.  Distinct UPDATEs and PATCHes are merged before they
+        are sent instead (see libra.common.api.dispatcher). """
+    version = message.get('configVersion')
+    if version is None:
+        return None
+    key = '{0}:{1}:{2}'.format(task, message.get('hpcs_action'), version)
+    return hashlib.sha1(key).hexdigest()
 
 
 class JSONDataEncoder(DataEncoder):
@@ -22,12 +150,14 @@ class JSONDataEncoder(DataEncoder):
     @classmethod
     def encode(cls, encodable_object):
         """ Encode JSON object as string """
-        return json.dumps(encodable_object)
+        if isinstance(encodable_object, EncodedData):
+            return str(encodable_object)
+        return _dump_json(encodable_object)
 
     @classmethod
     def decode(cls, decodable_string):
         """ Decode string to JSON object """
-        return json.loads(decodable_string)
+        return decode(decodable_string)
 
 
 class JSONGearmanWorker(GearmanWorker):
@@ -28,13 +28,54 @@ common_cli_opts = [
                help='User to use for daemon mode'),
     cfg.BoolOpt('billing_enable',
                 default=False,
-                help='Enable or disable MnB notifictions')
+                help='Enable or disable MnB notifictions'),
+    cfg.FloatOpt('slow_query_time',
+                 default=1.0,
+                 metavar='SECONDS',
+                 help='Log SQL queries taking longer than this, 0 to '
+                      'disable')
 ]
 
 gearman_opts = [
+    cfg.IntOpt('breaker_cooldown',
+               default=60,
+               metavar='SECONDS',
+               help='Seconds the API servers stop sending jobs to a device '
+                    'which keeps timing out'),
+    cfg.IntOpt('breaker_threshold',
+               default=3,
+               metavar='COUNT',
+               help='Time outs in a row before the API servers stop '
+                    'sending jobs to a device, 0 to disable'),
     cfg.BoolOpt('keepalive',
                 default=False,
                 help='Enable TCP KEEPALIVE pings'),
+    cfg.StrOpt('codec',
+               default='json',
+               help='Message codec the API servers use with workers that '
+                    'support it: json, zjson or msgpack'),
+    cfg.IntOpt('dispatch_queue',
+               default=1000,
+               metavar='COUNT',
+               help='Gearman jobs the API servers queue before new '
+                    'requests wait'),
+    cfg.IntOpt('dispatch_workers',
+               default=10,
+               metavar='COUNT',
+               help='Gearman jobs the API servers run at once'),
+    cfg.IntOpt('job_retries',
+               default=1,
+               metavar='COUNT',
+               help='Times the API servers resend a timed out UPDATE or '
+                    'DELETE'),
+    cfg.FloatOpt('job_timeout',
+                 default=120.0,
+                 metavar='SECONDS',
+                 help='Longest the API servers wait for a worker to answer'),
+    cfg.FloatOpt('job_timeout_min',
+                 default=10.0,
+                 metavar='SECONDS',
+                 help='Shortest the API servers wait for a worker to answer'),
     cfg.IntOpt('keepcnt',
                metavar='COUNT',
                help='Max KEEPALIVE probes to send before killing connection'),
@@ -44,6 +85,30 @@ gearman_opts = [
     cfg.IntOpt('keepintvl',
                metavar='SECONDS',
                help='Seconds between TCP KEEPALIVE probes'),
+    cfg.IntOpt('outbox_batch',
+               default=50,
+               metavar='COUNT',
+               help='Jobs an API server takes from the job outbox at once'),
+    cfg.FloatOpt('outbox_poll',
+                 default=1.0,
+                 metavar='SECONDS',
+                 help='Seconds between checks of the job outbox'),
+    cfg.IntOpt('outbox_timeout',
+               default=600,
+               metavar='SECONDS',
+               help='Seconds after a job from the job outbox is taken or '
+                    'starts to be sent before it is assumed lost and sent '
+                    'again'),
+    cfg.IntOpt('pool_idle',
+               default=300,
+               metavar='SECONDS',
+               help='Seconds a pooled Gearman client may sit idle before '
+                    'it is reconnected'),
+    cfg.IntOpt('pool_size',
+               default=10,
+               metavar='COUNT',
+               help='Maximum number of pooled Gearman clients used to '
+                    'submit jobs from the API servers'),
     cfg.IntOpt('poll',
                default=1,
                metavar='SECONDS',
@@ -65,6 +130,17 @@ gearman_opts = [
     cfg.StrOpt('ssl_key',
                metavar='FILE',
                help='Gearman SSL key'),
+    cfg.StrOpt('trace_sink',
+               help='Where job trace spans are sent: log, file, udp or '
+                    'the class path of a custom sink. Unset to disable'),
+    cfg.StrOpt('trace_target',
+               help='File (file sink) or HOST:PORT (udp sink) for job '
+                    'trace spans'),
+    cfg.FloatOpt('update_window',
+                 default=1.0,
+                 metavar='SECONDS',
+                 help='Seconds the API servers wait for further changes to '
+                      'a device before sending it an UPDATE, 0 to disable'),
 ]
 
 
@@ -0,0 +1,194 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+""" Trace Gearman jobs from the API server through to the worker.
+
+    A trace ID is made when a job is submitted and sent to the worker in the
+    hpcs_trace field of the message.  Each stage the job goes through, on
+    either side, records a span: its name, start time and duration, tagged
+    with the trace ID.  Spans are handed to the sink named by the
+    [gearman] trace_sink option, which can be one of known_sinks or the
+    class path of any class with an emit(span) method.  With no sink
+    configured spans are not recorded at all. """
+
+import contextlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from oslo.config import cfg
+
+from libra.openstack.common import importutils
+from libra.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+TRACE_FIELD = 'hpcs_trace'
+
+# Mapping of trace_sink options to a class
+known_sinks = {
+    'log': 'libra.common.tracing.LogSink',
+    'file': 'libra.common.tracing.FileSink',
+    'udp': 'libra.common.tracing.UDPSink'
+}
+
+_sink = None
+_sink_loaded = False
+_local = threading.local()
+
+
+def get_sink():
+    """ Return the configured span sink, None if tracing is off """
+    global _sink, _sink_loaded
+    if not _sink_loaded:
+        _sink_loaded = True
+        if 'gearman' not in cfg.CONF:
+            return None
+        name = cfg.CONF['gearman']['trace_sink']
+        if name:
+            try:
+                sink_class = importutils.import_class(
+                    known_sinks.get(name, name)
+                )
+                _sink = sink_class(cfg.CONF['gearman']['trace_target'])
+            except Exception:
+                LOG.exception('Cannot load trace sink {0}'.format(name))
+    return _sink
+
+
+def current():
+    """ The trace active in this greenthread, or None """
+    return getattr(_local, 'trace', None)
+
+
+def span(name, **tags):
+    """ Record a span for the active trace, if there is one """
+    trace = current()
+    if trace is None:
+        return _no_span()
+    return trace.span(name, **tags)
+
+
+@contextlib.contextmanager
+def _no_span():
+    yield
+
+
+class Trace(object):
+    """ The spans recorded for one job in this process.
+
+        A trace is made active for the greenthread running the job with
+        activate(), so code further down can record spans with the
+        module-level span() without the trace being passed to it. """
+
+    host = socket.gethostname()
+
+    def __init__(self, trace_id=None, **tags):
+        self.id = trace_id or uuid.uuid4().hex
+        self.tags = tags
+        self.opened = {}
+
+    @contextlib.contextmanager
+    def activate(self):
+        previous = current()
+        _local.trace = self
+        try:
+            yield self
+        finally:
+            _local.trace = previous
+
+    @contextlib.contextmanager
+    def span(self, name, **tags):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, start, **tags)
+
+    def open(self, name):
+        """ Start a span which is finished by close(), for stages such as
+            queueing which do not sit inside one block of code """
+        self.opened[name] = time.time()
+
+    def close(self, name, **tags):
+        start = self.opened.pop(name, None)
+        if start is not None:
+            self.record(name, start, **tags)
+
+    def record(self, name, start, end=None, **tags):
+        sink = get_sink()
+        if sink is None:
+            return
+        if end is None:
+            end = time.time()
+        data = dict(self.tags)
+        data.update(tags)
+        data.update({
+            'trace': self.id,
+            'span': name,
+            'start': round(start, 6),
+            'duration': round(end - start, 6),
+            'host': self.host,
+            'pid': os.getpid()
+        })
+        try:
+            sink.emit(data)
+        except Exception:
+            LOG.exception('Failed to record trace span {0}'.format(name))
+
+
+class LogSink(object):
+    """ Write spans to the log """
+
+    def __init__(self, target=None):
+        pass
+
+    def emit(self, span):
+        LOG.info('TRACE {0}'.format(json.dumps(span, sort_keys=True)))
+
+
+class FileSink(object):
+    """ Append spans to the file named by trace_target, a JSON object a
+        line """
+
+    def __init__(self, target):
+        if not target:
+            raise Exception('trace_target must name a file for file traces')
+        self.fh = open(target, 'a', 1)
+
+    def emit(self, span):
+        self.fh.write(json.dumps(span, sort_keys=True) + '\n')
+
+
+class UDPSink(object):
+    """ Send spans as JSON datagrams to a local collector at the
+        HOST:PORT given by trace_target """
+
+    def __init__(self, target):
+        if not target or ':' not in target:
+            raise Exception('trace_target must be HOST:PORT for udp traces')
+        host, port = target.rsplit(':', 1)
+        self.address = (host, int(port))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def emit(self, span):
+        try:
+            self.sock.sendto(json.dumps(span), self.address)
+        except socket.error:
+            # Nobody listening, not worth logging every span
+            pass
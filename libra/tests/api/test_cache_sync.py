@@ -0,0 +1,101 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from datetime import datetime, timedelta
+
+import fixtures
+import pecan
+import webtest
+
+from libra.admin_api.controllers.caches import CachesController
+from libra.api.library import cache_sync, limits, response_cache
+from libra.common.api.lbaas import ApiCaches, CacheVersion, Limits
+from libra.tests.base import LbaasDatabase, TestCase
+
+
+class AdminRoot(object):
+    caches = CachesController()
+
+
+class TestCacheSync(TestCase):
+
+    def setUp(self):
+        super(TestCacheSync, self).setUp()
+        self.db = self.useFixture(LbaasDatabase())
+        self.db.insert(CacheVersion, dict(id=1, version=0))
+        self.db.insert(Limits, dict(id=1, name='maxLoadBalancers', value=20))
+        pecan.set_config({'app': {}, 'limits_ttl': 300, 'response_ttl': 300,
+                          'cache_check': 10}, overwrite=True)
+        self.addCleanup(pecan.set_config, {}, overwrite=True)
+        self.addCleanup(setattr, limits, '_limits', None)
+        self.addCleanup(setattr, response_cache, '_cache', None)
+        self.useFixture(fixtures.MonkeyPatch(
+            'libra.api.library.cache_sync.eventlet.spawn_n', lambda f: None
+        ))
+        self.admin = webtest.TestApp(pecan.make_app(AdminRoot()))
+        self.sync = cache_sync.CacheSync()
+        self.sync.name = 'api1:100'
+
+    def testDeleteDropsCaches(self):
+        cache = limits.get_limits()
+        self.sync.check()
+        self.assertEquals(cache.get('maxLoadBalancers'), 20)
+        self.assertEquals(cache.get('maxLoadBalancers'), 20)
+        self.assertEquals(cache.misses, 1)
+
+        self.assertEquals(self.admin.delete('/caches').json, {'version': 1})
+        self.assertEquals(cache.get('maxLoadBalancers'), 20)
+        self.assertEquals(cache.misses, 1)
+        self.sync.check()
+        self.assertEquals(cache.get('maxLoadBalancers'), 20)
+        self.assertEquals(cache.misses, 2)
+
+    def testReport(self):
+        limits.get_limits().get('maxLoadBalancers')
+        self.sync.check()
+        self.admin.delete('/caches')
+        report = self.admin.get('/caches').json
+        self.assertEquals(report['version'], 1)
+        self.assertEquals(len(report['servers']), 1)
+        server = report['servers'][0]
+        self.assertEquals(server['name'], 'api1:100')
+        self.assertFalse(server['current'])
+        self.assertEquals(server['caches']['limits']['misses'], 1)
+
+        self.sync.check()
+        server = self.admin.get('/caches').json['servers'][0]
+        self.assertTrue(server['current'])
+
+    def testResponsesDroppedWithLimits(self):
+        responses = response_cache.get_response_cache()
+        responses.put('protocols', '{}')
+        self.sync.check()
+        self.admin.delete('/caches')
+        self.assertEquals(responses.get('protocols'), '{}')
+        self.sync.check()
+        self.assertEquals(responses.get('protocols'), None)
+        # Counted as of the last check, before the miss
+        caches = self.admin.get('/caches').json['servers'][0]['caches']
+        self.assertEquals(caches['responses'],
+                          {'hits': 1, 'misses': 0, 'size': 0})
+
+    def testStaleServersRemoved(self):
+        self.db.insert(ApiCaches, dict(
+            name='gone:1', version=0, stats='{}',
+            updated=datetime.now() - timedelta(days=2)
+        ))
+        self.sync.check()
+        names = [server['name']
+                 for server in self.admin.get('/caches').json['servers']]
+        self.assertEquals(names, ['api1:100'])
@@ -0,0 +1,84 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from datetime import datetime
+
+from libra.api.controllers.health_monitor import HealthMonitorController
+from libra.api.controllers.nodes import NodesController
+from libra.api.library.etags import lb_etag
+from libra.api.model.validators import LBNodePut
+from libra.common.api.lbaas import Device, HealthMonitor, LoadBalancer, Node
+from libra.common.api.lbaas import db_session, loadbalancers_devices
+from libra.common.api.payload import next_version
+from libra.tests.base import LbaasDatabase, TestCase
+
+
+class TestLoadBalancerETag(TestCase):
+
+    def setUp(self):
+        super(TestLoadBalancerETag, self).setUp()
+        self.db = self.useFixture(LbaasDatabase())
+        now = datetime(2014, 1, 1)
+        self.db.insert(LoadBalancer, dict(
+            id=1, name='lb', tenantid='t1', protocol='HTTP', port=80,
+            status='ACTIVE', algorithm='ROUND_ROBIN', created=now,
+            updated=now
+        ))
+        self.db.insert(Device, dict(
+            id=1, name='device1', az=1, floatingIpAddr='10.0.0.1',
+            publicIpAddr='10.0.0.1', status='ONLINE', type='haproxy',
+            pingCount=0, created=now, updated=now
+        ))
+        self.db.insert(loadbalancers_devices, dict(loadbalancer=1, device=1))
+        self.db.insert(Node, *[dict(
+            id=node_id, lbid=1, address='10.1.0.{0}'.format(node_id),
+            port=80, weight=1, enabled=1, status='ONLINE', backup=0
+        ) for node_id in (1, 2)])
+        self.db.insert(HealthMonitor, dict(
+            lbid=1, type='CONNECT', delay=30, timeout=30,
+            attemptsBeforeDeactivation=2
+        ))
+
+    def _etag(self, tenant_id='t1'):
+        with db_session(readonly=True) as session:
+            return lb_etag(session, tenant_id, 1)
+
+    def _activate(self):
+        with db_session() as session:
+            session.query(LoadBalancer).get(1).status = 'ACTIVE'
+            session.commit()
+
+    def testUnchanged(self):
+        self.assertEquals(self._etag(), self._etag())
+        self.assertEquals(self._etag('t2'), None)
+
+    def testNodeChanged(self):
+        before = self._etag()
+        NodesController(1, 2)._update('t1', LBNodePut(weight=5))
+        self.assertNotEquals(self._etag(), before)
+        # Back to ACTIVE with the node still changed
+        self._activate()
+        self.assertNotEquals(self._etag(), before)
+
+    def testMonitorDeleted(self):
+        before = self._etag()
+        HealthMonitorController(1)._delete('t1')
+        self.assertNotEquals(self._etag(), before)
+
+    def testConfigSent(self):
+        before = self._etag()
+        with db_session() as session:
+            next_version(session, 1)
+            session.commit()
+        self.assertNotEquals(self._etag(), before)
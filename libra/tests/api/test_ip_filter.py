@@ -0,0 +1,90 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import ipaddress
+
+from libra.api.library.exp import IPOutOfRange
+from libra.api.library.ip_filter import IPFilter, get_ip_filter, ipfilter
+from libra.tests.base import TestCase
+
+
+def _int(address):
+    return int(ipaddress.ip_address(unicode(address)))
+
+
+class TestIPFilter(TestCase):
+
+    def testEmpty(self):
+        ip_filter = IPFilter([])
+        self.assertEquals(ip_filter.check('192.168.0.1'), '192.168.0.1')
+        self.assertEquals(ip_filter.check('2001:db8::1'), '2001:db8::1')
+        self.assertEquals(ip_filter.check_all([]), [])
+        self.assertRaises(ValueError, ip_filter.check, 'nonsense')
+
+    def testMergeOverlapping(self):
+        ip_filter = IPFilter(['10.0.0.0/8', '10.1.0.0/16', '10.0.0.0/24'])
+        self.assertEquals(
+            ip_filter.tables[4],
+            ([_int('10.0.0.0')], [_int('10.255.255.255')])
+        )
+        self.assertTrue(ip_filter.allows(ipaddress.ip_address(u'10.1.2.3')))
+
+    def testMergeAdjacent(self):
+        ip_filter = IPFilter(['10.0.1.0/24', '10.0.0.0/24', '10.0.3.0/24'])
+        self.assertEquals(
+            ip_filter.tables[4],
+            ([_int('10.0.0.0'), _int('10.0.3.0')],
+             [_int('10.0.1.255'), _int('10.0.3.255')])
+        )
+        self.assertEquals(ip_filter.check('10.0.1.255'), '10.0.1.255')
+        self.assertEquals(ip_filter.check('10.0.3.0'), '10.0.3.0')
+        self.assertRaises(IPOutOfRange, ip_filter.check, '10.0.2.0')
+        self.assertRaises(IPOutOfRange, ip_filter.check, '9.255.255.255')
+        self.assertRaises(IPOutOfRange, ip_filter.check, '10.0.4.0')
+
+    def testMixedVersions(self):
+        ip_filter = IPFilter(['10.0.0.0/8', '2001:db8::/32'])
+        self.assertEquals(ip_filter.check('10.1.1.1'), '10.1.1.1')
+        self.assertEquals(
+            ip_filter.check('2001:0db8:0000::0001'), '2001:db8::1'
+        )
+        # The same integer in the other version is not allowed
+        self.assertRaises(IPOutOfRange, ip_filter.check, '::a01:101')
+        self.assertRaises(IPOutOfRange, ip_filter.check, '2001:db9::1')
+
+    def testOneVersionOnly(self):
+        ip_filter = IPFilter(['10.0.0.0/8'])
+        self.assertRaises(IPOutOfRange, ip_filter.check, '2001:db8::1')
+
+    def testCheckAll(self):
+        ip_filter = IPFilter(['10.0.0.0/8'])
+        self.assertEquals(
+            ip_filter.check_all(['10.0.0.1', u'10.0.0.2']),
+            ['10.0.0.1', '10.0.0.2']
+        )
+        e = self.assertRaises(
+            IPOutOfRange, ip_filter.check_all, ['10.0.0.1', '11.0.0.1']
+        )
+        self.assertEquals(e.args, ('11.0.0.1',))
+        e = self.assertRaises(
+            ValueError, ip_filter.check_all, ['bad', '11.0.0.1']
+        )
+        self.assertEquals(e.args, ('bad',))
+
+    def testRecompiledOnChange(self):
+        first = get_ip_filter(['10.0.0.0/8'])
+        self.assertTrue(get_ip_filter(['10.0.0.0/8']) is first)
+        self.assertFalse(get_ip_filter(['11.0.0.0/8']) is first)
+        self.assertEquals(ipfilter('11.0.0.1', ['11.0.0.0/8']), '11.0.0.1')
+        self.assertRaises(IPOutOfRange, ipfilter, '10.0.0.1', ['11.0.0.0/8'])
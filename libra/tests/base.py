@@ -36,9 +36,13 @@ import sys
 
 import fixtures
 import testtools
+from sqlalchemy import BIGINT, create_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import StaticPool
 
 #from libra.db import migration
 from libra.common import options
+from libra.common.api import lbaas
 from libra.openstack.common import log
 from libra.openstack.common import test
 from libra.openstack.common.fixture import config
@@ -117,6 +121,46 @@ class Database(fixtures.Fixture):
                 os.path.join(CONF.state_path, self.sqlite_db))
 
 
+@compiles(BIGINT, 'sqlite')
+def _sqlite_bigint(type_, compiler, **kw):
+    # SQLite only generates IDs for INTEGER primary keys
+    return 'INTEGER'
+
+
+class LbaasDatabase(fixtures.Fixture):
+    """
+    Fixture for an empty in memory SQLite copy of the LBaaS database, used
+    by every db_session() until cleanup.
+    """
+    def setUp(self):
+        super(LbaasDatabase, self).setUp()
+        self.engine = create_engine('sqlite://', poolclass=StaticPool)
+        lbaas.metadata.create_all(self.engine)
+
+        saved = dict(
+            (name, getattr(lbaas.RoutingSession, name))
+            for name in ('engines', 'engines_count', 'use_engine',
+                         'last_engine_time', 'health', 'read_turn')
+        )
+        for name, value in saved.items():
+            if isinstance(value, dict):
+                setattr(lbaas.RoutingSession, name, {})
+        lbaas.RoutingSession.engines_count = 0
+        lbaas.RoutingSession.use_engine = 0
+        lbaas.RoutingSession.add_engine(self.engine)
+
+        def restore():
+            for name, value in saved.items():
+                setattr(lbaas.RoutingSession, name, value)
+            self.engine.dispose()
+        self.addCleanup(restore)
+
+    def insert(self, model, *rows):
+        """ Add rows, each a dict of column values, to model's table """
+        table = getattr(model, '__table__', model)
+        self.engine.execute(table.insert(), list(rows))
+
+
 class TestCase(test.BaseTestCase):
     """
     Base test case that holds any "extras" that we use like assertX functions.
@@ -0,0 +1,147 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from datetime import datetime
+
+import fixtures
+
+from libra.common.api import allocator
+from libra.common.api.lbaas import Device, db_session
+from libra.tests.base import LbaasDatabase, TestCase
+
+
+class TestClaimDevice(TestCase):
+
+    def setUp(self):
+        super(TestClaimDevice, self).setUp()
+        self.db = self.useFixture(LbaasDatabase())
+        # Try candidates in ID order
+        self.useFixture(fixtures.MonkeyPatch(
+            'libra.common.api.allocator.random.shuffle', list.sort
+        ))
+
+    def _device(self, device_id, az=1, status='OFFLINE'):
+        now = datetime.now()
+        self.db.insert(Device, dict(
+            id=device_id, name='device{0}'.format(device_id), az=az,
+            floatingIpAddr='10.0.0.{0}'.format(device_id),
+            publicIpAddr='10.0.0.{0}'.format(device_id), status=status,
+            type='basename: haproxy', pingCount=0, created=now, updated=now
+        ))
+
+    def _claim(self, az=None):
+        with db_session() as session:
+            device = allocator.claim_device(session, 'BUILD', az)
+            session.commit()
+            return device and device.id
+
+    def _status(self, device_id):
+        with db_session() as session:
+            return session.query(Device).get(device_id).status
+
+    def testClaim(self):
+        self._device(1)
+        self.assertEquals(self._claim(), 1)
+        self.assertEquals(self._status(1), 'BUILD')
+        self.assertEquals(self._claim(), None)
+
+    def testNoneFree(self):
+        self._device(1, status='ONLINE')
+        self.assertEquals(self._claim(), None)
+
+    def testLostRaceReadsAgain(self):
+        self._device(1)
+        self._device(2)
+        self._device(3)
+        free_devices = allocator.free_devices
+        reads = []
+
+        def stale_read(session, az=None):
+            # The only candidate read, device 1, is claimed by someone else
+            # before this claim gets to it
+            reads.append(az)
+            query = free_devices(session, az)
+            if len(reads) == 1:
+                session.query(Device).filter(Device.id == 1).\
+                    update({Device.status: 'BUILD'})
+                query = session.query(Device.id).filter(Device.id == 1)
+            return query
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'libra.common.api.allocator.free_devices', stale_read
+        ))
+        self.assertEquals(self._claim(), 2)
+        self.assertEquals(len(reads), 2)
+
+    def testLostRaceNextCandidate(self):
+        self._device(1)
+        self._device(2)
+        self._device(3, status='BUILD')
+        free_devices = allocator.free_devices
+
+        def stale_read(session, az=None):
+            # Device 3 was free when read and has been claimed since
+            return free_devices(session, az).union(
+                session.query(Device.id).filter(Device.id == 3)
+            )
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'libra.common.api.allocator.free_devices', stale_read
+        ))
+        self.useFixture(fixtures.MonkeyPatch(
+            'libra.common.api.allocator.random.shuffle',
+            lambda ids: ids.sort(reverse=True)
+        ))
+        self.assertEquals(self._claim(), 2)
+        self.assertEquals(self._status(3), 'BUILD')
+        self.assertEquals(self._status(1), 'OFFLINE')
+
+    def testPreferZone(self):
+        self._device(1, az=1)
+        self._device(2, az=2)
+        self.assertEquals(self._claim(az=2), 2)
+        self.assertEquals(self._status(1), 'OFFLINE')
+
+    def testFallBackToAnyZone(self):
+        self._device(1, az=1)
+        self._device(2, az=2, status='ONLINE')
+        self.assertEquals(self._claim(az=2), 1)
+        self.assertEquals(self._claim(az=2), None)
+
+
+class FakeDialect(object):
+
+    def __init__(self, name, version):
+        self.name = name
+        self.server_version_info = version
+
+
+class TestHasSkipLocked(TestCase):
+
+    def _check(self, version, name='mysql'):
+        return allocator.has_skip_locked(FakeDialect(name, version))
+
+    def testMySQL(self):
+        self.assertFalse(self._check((5, 7, 44)))
+        self.assertFalse(self._check((8, 0, 0)))
+        self.assertTrue(self._check((8, 0, 36)))
+
+    def testMariaDB(self):
+        self.assertFalse(self._check((10, 5, 22, 'MariaDB')))
+        self.assertTrue(self._check((10, 6, 16, 'MariaDB', 'log')))
+        self.assertTrue(self._check((5, 5, 5, 10, 11, 6, 'MariaDB')))
+        self.assertFalse(self._check((5, 5, 5, 10, 3, 39, 'MariaDB')))
+
+    def testOtherDatabases(self):
+        self.assertFalse(self._check(None, 'sqlite'))
@@ -0,0 +1,149 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import eventlet
+
+from libra.common.api.dispatcher import JobDispatcher
+from libra.common.api.dispatcher import PatchCoalescer, UpdateCoalescer
+from libra.tests.base import TestCase
+
+
+class TestJobDispatcher(TestCase):
+
+    def setUp(self):
+        super(TestJobDispatcher, self).setUp()
+        self.events = []
+
+    def _job(self, name, delay=0.01):
+        self.events.append(('start', name))
+        eventlet.sleep(delay)
+        self.events.append(('end', name))
+
+    def _wait(self, dispatcher):
+        while dispatcher.queued or dispatcher.pool.running():
+            eventlet.sleep(0.01)
+
+    def testSameKeySerial(self):
+        dispatcher = JobDispatcher(4, 10)
+        for name in ('a1', 'a2', 'a3'):
+            dispatcher.submit(JobDispatcher.HIGH, 'a', self._job, name)
+        self._wait(dispatcher)
+        self.assertEquals(self.events, [
+            ('start', 'a1'), ('end', 'a1'),
+            ('start', 'a2'), ('end', 'a2'),
+            ('start', 'a3'), ('end', 'a3')
+        ])
+
+    def testOtherKeysParallel(self):
+        dispatcher = JobDispatcher(4, 10)
+        dispatcher.submit(JobDispatcher.HIGH, 'a', self._job, 'a')
+        dispatcher.submit(JobDispatcher.HIGH, 'b', self._job, 'b')
+        self._wait(dispatcher)
+        self.assertEquals(self.events[:2], [('start', 'a'), ('start', 'b')])
+
+    def testHeldRequeued(self):
+        dispatcher = JobDispatcher(1, 10)
+        dispatcher.submit(JobDispatcher.LOW, 'a', self._job, 'a1')
+        dispatcher.submit(JobDispatcher.HIGH, 'a', self._job, 'a2')
+        dispatcher.submit(JobDispatcher.LOW, 'b', self._job, 'b')
+        stats = dispatcher.stats()
+        self.assertEquals(stats['held'], 1)
+        self.assertEquals(stats['queued'], 3)
+        self._wait(dispatcher)
+        # a2 was held while a1 ran and then queued in its own lane, ahead
+        # of the LOW job submitted before it
+        self.assertEquals(
+            [name for event, name in self.events if event == 'start'],
+            ['a1', 'a2', 'b']
+        )
+        stats = dispatcher.stats()
+        self.assertEquals(stats['held'], 0)
+        self.assertEquals(stats['completed'], 3)
+        self.assertEquals(dispatcher.busy, set())
+
+    def testHighFirst(self):
+        dispatcher = JobDispatcher(1, 10)
+        dispatcher.submit(JobDispatcher.LOW, 'a', self._job, 'a')
+        dispatcher.submit(JobDispatcher.LOW, 'b', self._job, 'b')
+        dispatcher.submit(JobDispatcher.HIGH, 'c', self._job, 'c')
+        # Nothing starts until this greenthread yields
+        self._wait(dispatcher)
+        self.assertEquals(
+            [name for event, name in self.events if event == 'start'],
+            ['c', 'a', 'b']
+        )
+
+    def testFailedJobReleasesKey(self):
+        dispatcher = JobDispatcher(1, 10)
+
+        def fail():
+            raise Exception('failed')
+
+        dispatcher.submit(JobDispatcher.HIGH, 'a', fail)
+        dispatcher.submit(JobDispatcher.HIGH, 'a', self._job, 'a')
+        self._wait(dispatcher)
+        self.assertEquals(self.events, [('start', 'a'), ('end', 'a')])
+        self.assertEquals(dispatcher.stats()['failed'], 1)
+
+    def testNonBlockingWhenFull(self):
+        dispatcher = JobDispatcher(1, 1)
+        dispatcher.submit(JobDispatcher.HIGH, 'a', self._job, 'a')
+        # Queue full, but this must not wait
+        dispatcher.submit(JobDispatcher.HIGH, 'b', self._job, 'b',
+                          block=False)
+        stats = dispatcher.stats()
+        self.assertEquals(stats['queued'], 2)
+        self.assertEquals(stats['busy_keys'], 2)
+        self.assertEquals(stats['full'], 1)
+        self._wait(dispatcher)
+        self.assertEquals(dispatcher.stats()['completed'], 2)
+        self.assertEquals(dispatcher.slots.balance, 1)
+
+
+class TestCoalescers(TestCase):
+
+    def setUp(self):
+        super(TestCoalescers, self).setUp()
+        self.sent = []
+
+    def _dispatch(self, *args):
+        self.sent.append(args)
+
+    def testUpdate(self):
+        coalescer = UpdateCoalescer(0.02, self._dispatch)
+        coalescer.add('host1', 1, 10, [1])
+        coalescer.add('host1', 1, 11, [2])
+        coalescer.add('host2', 2, 12, [3])
+        eventlet.sleep(0.1)
+        self.assertEquals(sorted(self.sent), [
+            ('host1', 1, [10, 11], [1, 2], []),
+            ('host2', 2, [12], [3], [])
+        ])
+
+    def testPatch(self):
+        coalescer = PatchCoalescer(0.02, self._dispatch)
+        coalescer.add('host1', {'deviceid': 1, 'nodes': [1, 2]}, 10, [1])
+        coalescer.add('host1', {'deviceid': 1, 'nodes': [2, 3]}, 10, [2])
+        coalescer.add('host1', {'deviceid': 1, 'nodes': [4]}, 11, [3])
+        eventlet.sleep(0.1)
+        self.assertEquals(sorted(self.sent), [
+            ('host1', {'deviceid': 1, 'nodes': [1, 2, 3]}, [10], [1, 2], []),
+            ('host1', {'deviceid': 1, 'nodes': [4]}, [11], [3], [])
+        ])
+
+    def testNoWindow(self):
+        coalescer = UpdateCoalescer(0, self._dispatch)
+        coalescer.add('host1', 1, 10)
+        coalescer.add('host1', 1, 11)
+        self.assertEquals(len(self.sent), 2)
@@ -0,0 +1,45 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+
+from libra.common.api.gearman_pool import GearmanClientPool
+from libra.tests.base import TestCase
+
+
+class TestGearmanClientPool(TestCase):
+
+    def setUp(self):
+        super(TestGearmanClientPool, self).setUp()
+        self.pool = GearmanClientPool([], 2, 60)
+
+    def testReuse(self):
+        client = self.pool.get()
+        self.pool.put(client)
+        self.assertTrue(self.pool.get() is client)
+        self.assertEquals(self.pool.stats()['discarded'], 0)
+
+    def testDiscardUnfinishedJob(self):
+        client = self.pool.get()
+        # What a timed out or disconnected job request leaves behind
+        client.request_to_rotating_connection_queue[object()] = \
+            collections.deque()
+        self.pool.put(client)
+        stats = self.pool.stats()
+        self.assertEquals(stats['discarded'], 1)
+        self.assertEquals(stats['size'], 1)
+        self.assertEquals(stats['free'], 1)
+        replacement = self.pool.get()
+        self.assertFalse(replacement is client)
+        self.assertFalse(replacement.request_to_rotating_connection_queue)
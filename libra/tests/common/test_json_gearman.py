@@ -0,0 +1,42 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from libra.common.json_gearman import job_unique
+from libra.tests.base import TestCase
+
+
+class TestJobUnique(TestCase):
+
+    def _update(self, version):
+        return {'hpcs_action': 'UPDATE', 'configVersion': version,
+                'loadBalancers': []}
+
+    def testResendSameKey(self):
+        key = job_unique('device1', self._update(7))
+        self.assertEquals(key, job_unique('device1', self._update(7)))
+        self.assertTrue(len(key) <= 64)
+
+    def testNewVersionNewKey(self):
+        self.assertNotEquals(job_unique('device1', self._update(7)),
+                             job_unique('device1', self._update(8)))
+
+    def testOtherDeviceOrAction(self):
+        key = job_unique('device1', self._update(7))
+        self.assertNotEquals(key, job_unique('device2', self._update(7)))
+        patch = {'hpcs_action': 'PATCH', 'configVersion': 7}
+        self.assertNotEquals(key, job_unique('device1', patch))
+
+    def testNoVersion(self):
+        self.assertEquals(job_unique('device1', {'hpcs_action': 'STATS'}),
+                          None)
@@ -0,0 +1,43 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from libra.common.api import migrate
+from libra.common.api.lbaas import Versions
+from libra.tests.base import LbaasDatabase, TestCase
+
+
+class TestCheckAtStartup(TestCase):
+
+    def setUp(self):
+        super(TestCheckAtStartup, self).setUp()
+        self.db = self.useFixture(LbaasDatabase())
+        self.db.insert(Versions, dict(
+            major=migrate.SCHEMA_MAJOR, minor=migrate.LATEST
+        ))
+
+    def testUpToDate(self):
+        migrate.check_at_startup()
+        self.assertEquals(migrate.check_schema(self.db.engine), [])
+
+    def testMissingTable(self):
+        self.db.engine.execute('DROP TABLE job_outbox')
+        self.assertRaises(migrate.SchemaError, migrate.check_at_startup)
+        self.assertEquals(migrate.check_schema(self.db.engine),
+                          ['table job_outbox is missing'])
+
+    def testMissingIndexOnly(self):
+        self.db.engine.execute('DROP INDEX nodes_lbid')
+        migrate.check_at_startup()
+        self.assertEquals(migrate.check_schema(self.db.engine),
+                          ['index on nodes(lbid) is missing'])
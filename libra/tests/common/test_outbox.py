@@ -0,0 +1,87 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from datetime import datetime, timedelta
+
+import pecan
+
+from libra.common.api import outbox
+from libra.common.api.lbaas import JobOutbox, db_session
+from libra.tests.base import LbaasDatabase, TestCase
+
+
+class TestOutboxDrainer(TestCase):
+
+    def setUp(self):
+        super(TestOutboxDrainer, self).setUp()
+        self.db = self.useFixture(LbaasDatabase())
+        pecan.set_config({'gearman': {
+            'outbox_poll': 3600, 'outbox_batch': 10, 'outbox_timeout': 600
+        }}, overwrite=True)
+        self.addCleanup(pecan.set_config, {}, overwrite=True)
+        self.other = self._drainer('other:1')
+        self.drainer = self._drainer('this:1')
+
+    def _drainer(self, name):
+        drainer = outbox.OutboxDrainer()
+        drainer.name = name
+        self.addCleanup(drainer.shutdown)
+        self.addCleanup(setattr, outbox, '_drainer', None)
+        return drainer
+
+    def _queue(self, outbox_id, claimed=None, claimed_by=None):
+        self.db.insert(JobOutbox, dict(
+            id=outbox_id, job_type='UPDATE', host='device1', data='1',
+            lbid=1, created=datetime.now(), claimed=claimed,
+            claimed_by=claimed_by
+        ))
+
+    def _claimed_by(self, outbox_id):
+        with db_session() as session:
+            return session.query(JobOutbox).get(outbox_id).claimed_by
+
+    def testClaim(self):
+        self._queue(1)
+        self.assertEquals(self.drainer._claim(),
+                          [(1, 'UPDATE', 'device1', '1', 1)])
+        self.assertEquals(self._claimed_by(1), 'this:1')
+        # Claimed jobs are left alone until the claim expires
+        self.assertEquals(self.other._claim(), [])
+
+    def testReclaimExpired(self):
+        self._queue(1, datetime.now() - timedelta(seconds=601), 'other:1')
+        self.assertEquals(len(self.drainer._claim()), 1)
+        self.assertEquals(self._claimed_by(1), 'this:1')
+
+    def testJobStartedRenewsClaim(self):
+        # Claimed ten minutes ago and only now leaving the dispatcher queue
+        self._queue(1, datetime.now() - timedelta(seconds=601), 'this:1')
+        self.assertTrue(outbox.job_started([1]))
+        self.assertEquals(self.other._claim(), [])
+        self.assertEquals(self._claimed_by(1), 'this:1')
+
+    def testJobStartedAfterReclaim(self):
+        self._queue(1, datetime.now() - timedelta(seconds=601), 'this:1')
+        self.assertEquals(len(self.other._claim()), 1)
+        outbox._drainer = self.drainer
+        self.assertFalse(outbox.job_started([1]))
+
+    def testJobDone(self):
+        self._queue(1)
+        self._queue(2)
+        outbox.job_done([1])
+        with db_session() as session:
+            self.assertEquals(
+                [row.id for row in session.query(JobOutbox)], [2]
+            )
@@ -0,0 +1,102 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import fixtures
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+
+from libra.common.api import retry
+from libra.tests.base import TestCase
+
+
+class ConnectorError(Exception):
+    """ An error as mysql-connector raises it, the server error number in
+        errno and the message as the first argument """
+    def __init__(self, errno, msg):
+        super(ConnectorError, self).__init__(msg)
+        self.errno = errno
+
+
+def _mysqldb(errno):
+    return OperationalError('UPDATE', {}, Exception(errno, 'conflict'))
+
+
+def _connector(errno):
+    return OperationalError(
+        'UPDATE', {}, ConnectorError(errno, '{0}: conflict'.format(errno))
+    )
+
+
+class TestIsRetryable(TestCase):
+
+    def testMySQLdb(self):
+        self.assertTrue(retry.is_retryable(_mysqldb(1213)))
+        self.assertTrue(retry.is_retryable(_mysqldb(1205)))
+        self.assertFalse(retry.is_retryable(_mysqldb(1062)))
+
+    def testConnector(self):
+        self.assertTrue(retry.is_retryable(_connector(1213)))
+        self.assertTrue(retry.is_retryable(_connector(1205)))
+        self.assertFalse(retry.is_retryable(_connector(1062)))
+
+    def testOther(self):
+        self.assertTrue(retry.is_retryable(StaleDataError()))
+        self.assertFalse(retry.is_retryable(ValueError(1213)))
+        self.assertFalse(retry.is_retryable(
+            DBAPIError('UPDATE', {}, Exception())
+        ))
+
+
+class TestRun(TestCase):
+
+    def setUp(self):
+        super(TestRun, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+            'libra.common.api.retry.eventlet.sleep', lambda delay: None
+        ))
+        self.useFixture(fixtures.MonkeyPatch(
+            'libra.common.api.retry._stats', None
+        ))
+        self.calls = 0
+
+    def _conflict(self, times, errno=1213):
+        def unit():
+            self.calls += 1
+            if self.calls <= times:
+                raise _connector(errno)
+            return 'done'
+        return unit
+
+    def testRecovers(self):
+        self.assertEquals(retry.run('unit', self._conflict(2)), 'done')
+        self.assertEquals(self.calls, 3)
+        self.assertEquals(
+            retry.get_retry_stats().summary(),
+            {'unit': {'retried': 2, 'recovered': 1, 'failed': 0}}
+        )
+
+    def testGivesUp(self):
+        self.assertRaises(
+            OperationalError, retry.run, 'unit', self._conflict(10, 1205)
+        )
+        self.assertEquals(self.calls, retry.ATTEMPTS)
+        self.assertEquals(
+            retry.get_retry_stats().summary()['unit']['failed'], 1
+        )
+
+    def testOtherErrorsNotRetried(self):
+        self.assertRaises(
+            OperationalError, retry.run, 'unit', self._conflict(1, 1062)
+        )
+        self.assertEquals(self.calls, 1)
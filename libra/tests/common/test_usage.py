@@ -0,0 +1,93 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from datetime import date, datetime
+
+from libra.common.api import usage
+from libra.common.api.lbaas import Stats, db_session
+from libra.tests.base import LbaasDatabase, TestCase
+
+
+class FakeDialect(object):
+    name = 'mysql'
+
+
+class FakeConnection(object):
+    dialect = FakeDialect()
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def execute(self, statement):
+        self.engine.statements.append(statement)
+        if statement.startswith('SELECT'):
+            return [(name,) for name in self.engine.partitions]
+        return None
+
+    def close(self):
+        self.engine.closed += 1
+
+
+class FakeEngine(object):
+    """ Just enough of a MySQL engine to record partition DDL """
+    dialect = FakeDialect()
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.statements = []
+        self.closed = 0
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+class TestUsagePurge(TestCase):
+
+    def testPurgeRows(self):
+        db = self.useFixture(LbaasDatabase())
+        db.insert(Stats, *[{
+            'id': n, 'lbid': 1, 'period_start': datetime(2014, 1, n),
+            'period_end': datetime(2014, 1, n), 'bytes_out': 10,
+            'status': 'ACTIVE'
+        } for n in (1, 2, 3)])
+        with db_session() as session:
+            usage.purge_stats(session, datetime(2014, 1, 3))
+            session.commit()
+        with db_session() as session:
+            self.assertEquals(
+                [row.id for row in session.query(Stats).all()], [3]
+            )
+            session.commit()
+
+    def testPartitionsOnOwnConnection(self):
+        engine = FakeEngine(['p20140101', 'p20140102', 'p20140103', 'pmax'])
+        usage.update_stats_partitions(
+            engine, date(2014, 1, 3), datetime(2014, 1, 3)
+        )
+        self.assertEquals(len(engine.statements), 3)
+        self.assertEquals(
+            engine.statements[1],
+            'ALTER TABLE stats DROP PARTITION p20140101, p20140102'
+        )
+        self.assertTrue(engine.statements[2].startswith(
+            'ALTER TABLE stats REORGANIZE PARTITION pmax INTO '
+            '(PARTITION p20140104 '
+        ))
+        self.assertEquals(engine.closed, 1)
+
+    def testNotPartitioned(self):
+        engine = FakeEngine([])
+        usage.update_stats_partitions(engine, date(2014, 1, 3))
+        self.assertEquals(len(engine.statements), 1)
+        self.assertEquals(engine.closed, 1)
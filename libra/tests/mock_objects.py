@@ -36,6 +36,9 @@ class FakeOSServices(ServicesBase):
     def service_reload(self):
         pass
 
+    def send_commands(self, commands):
+        pass
+
     def write_config(self, config_str):
         pass
 
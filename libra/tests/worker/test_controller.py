@@ -70,6 +70,73 @@ class TestWorkerController(TestCase):
         self.assertIn(c.RESPONSE_FIELD, response)
         self.assertEquals(response[c.RESPONSE_FIELD], c.RESPONSE_SUCCESS)
 
+    def testPatch(self):
+        msg = {
+            c.ACTION_FIELD: 'UPDATE',
+            c.VERSION_FIELD: 7,
+            c.LBLIST_FIELD: [
+                {
+                    'protocol': 'http',
+                    'nodes': [
+                        {
+                            'id': 1234,
+                            'address': '10.0.0.1',
+                            'port': 80
+                        }
+                    ]
+                }
+            ]
+        }
+        c(self.driver, msg).run()
+        msg = {
+            c.ACTION_FIELD: 'PATCH',
+            c.BASE_VERSION_FIELD: 7,
+            c.VERSION_FIELD: 8,
+            c.LBLIST_FIELD: [
+                {
+                    'protocol': 'http',
+                    'nodes': [
+                        {
+                            'id': 1235,
+                            'address': '10.0.0.2',
+                            'port': 80,
+                            'condition': 'DISABLED'
+                        }
+                    ],
+                    'removed': [1234]
+                }
+            ]
+        }
+        controller = c(self.driver, msg)
+        response = controller.run()
+        self.assertEquals(response[c.RESPONSE_FIELD], c.RESPONSE_SUCCESS)
+        self.assertEquals(self.driver.config_version, 8)
+        servers = self.driver._config['http']['servers']
+        self.assertEquals(servers, [(1235, '10.0.0.2', 80, 1, False)])
+
+    def testPatchVersionMismatch(self):
+        msg = {
+            c.ACTION_FIELD: 'PATCH',
+            c.BASE_VERSION_FIELD: 7,
+            c.VERSION_FIELD: 8,
+            c.LBLIST_FIELD: [{'protocol': 'http', 'removed': [1234]}]
+        }
+        controller = c(self.driver, msg)
+        response = controller.run()
+        self.assertEquals(response[c.RESPONSE_FIELD], c.RESPONSE_FAILURE)
+        self.assertIn(c.ERROR_FIELD, response)
+        self.assertIsNone(self.driver.config_version)
+
+    def testTraceEchoed(self):
+        msg = {
+            c.ACTION_FIELD: 'UPDATE',
+            c.TRACE_FIELD: 'abc123'
+        }
+        controller = c(self.driver, msg)
+        response = controller.run()
+        self.assertIn('badRequest', response)
+        self.assertEquals(response[c.TRACE_FIELD], 'abc123')
+
     def testSuspend(self):
         msg = {
             c.ACTION_FIELD: 'SUSPEND'
@@ -382,6 +449,7 @@ class TestWorkerController(TestCase):
         self.assertEquals(response[c.RESPONSE_FIELD], c.RESPONSE_SUCCESS)
         self.assertEquals(response['version'], libra_version)
         self.assertEquals(response['release'], libra_release)
+        self.assertIn('json', response['codecs'])
 
     def testArchiveMissingMethod(self):
         msg = {
@@ -130,6 +130,77 @@ class TestHAProxyDriver(TestCase):
                               proto, 100, '1.2.3.4', 7777, "abc")
         self.assertEqual("Non-integer 'weight' value: 'abc'", e.message)
 
+    def testSetServerRuntime(self):
+        """ Test weight and condition changes avoid a reload """
+        proto = 'http'
+        self.driver.add_protocol(proto, None)
+        self.driver.set_algorithm(proto, self.driver.ROUNDROBIN)
+        self.driver.set_timeouts(proto, 30000, 30000, 30000, 3)
+        self.driver.add_server(proto, 100, '1.2.3.4', 7777)
+        self.driver.set_server(proto, 100, '1.2.3.4', 7777, 5, False, False)
+        servers = self.driver._config[proto]['servers']
+        self.assertEqual(servers[0], (100, '1.2.3.4', 7777, 5, False))
+        self.assertEqual(self.driver._commands, [
+            'set weight http-servers/id-100 5',
+            'disable server http-servers/id-100'
+        ])
+        self.assertFalse(self.driver._reload)
+        self.assertIn('disabled', self.driver._config_to_string())
+        self.driver.apply()
+        self.assertEqual(self.driver._commands, [])
+
+    def testSetServerReload(self):
+        """ Test adding, moving and removing servers needs a reload """
+        proto = 'tcp'
+        self.driver.add_protocol(proto, 443)
+        self.driver.set_algorithm(proto, self.driver.ROUNDROBIN)
+        self.driver.set_timeouts(proto, 30000, 30000, 30000, 3)
+        self.driver.add_server(proto, 100, '1.2.3.4', 7777)
+        self.driver.set_server(proto, 100, '1.2.3.4', 8888, 1, False, True)
+        self.driver.set_server(proto, 101, '5.6.7.8', 8888, 1, True, True)
+        servers = self.driver._config[proto]['servers']
+        self.assertEqual(servers, [(100, '1.2.3.4', 8888, 1, False),
+                                   (101, '5.6.7.8', 8888, 1, True)])
+        self.assertTrue(self.driver._reload)
+        self.driver.apply()
+        self.assertFalse(self.driver._reload)
+        self.driver.remove_server(proto, 100)
+        self.driver.remove_server(proto, 999)
+        self.assertEqual(servers, [(101, '5.6.7.8', 8888, 1, True)])
+        self.assertTrue(self.driver._reload)
+
+    def testStatsSocketAdminOwnerOnly(self):
+        """ Test the admin level stats socket is only open to the worker """
+        driver = HAProxyDriver('libra.tests.mock_objects.FakeOSServices',
+                               'libra', None)
+        self.assertIn('    stats socket /var/run/haproxy-stats.socket '
+                      'user libra mode 600 level admin',
+                      driver._config_to_string().split('\n'))
+        driver = HAProxyDriver('libra.tests.mock_objects.FakeOSServices',
+                               'libra', 'libra')
+        self.assertIn('    stats socket /var/run/haproxy-stats.socket '
+                      'user libra group libra mode 660 level admin',
+                      driver._config_to_string().split('\n'))
+
+    def testSetServerRuntimeFailsReload(self):
+        """ Test a failed stats socket command falls back to a reload """
+        reloads = []
+
+        def refuse(commands):
+            raise Exception('socket is open to every user')
+
+        self.driver.ossvc.send_commands = refuse
+        self.driver.ossvc.service_reload = lambda: reloads.append(True)
+        proto = 'http'
+        self.driver.add_protocol(proto, None)
+        self.driver.set_algorithm(proto, self.driver.ROUNDROBIN)
+        self.driver.set_timeouts(proto, 30000, 30000, 30000, 3)
+        self.driver.add_server(proto, 100, '1.2.3.4', 7777)
+        self.driver.set_server(proto, 100, '1.2.3.4', 7777, 5, False, True)
+        self.assertFalse(self.driver._reload)
+        self.driver.apply()
+        self.assertEqual(reloads, [True])
+
     def testArchive(self):
         """ Test the HAProxy archive() method """
 
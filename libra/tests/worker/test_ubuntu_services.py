@@ -0,0 +1,57 @@
+# Copyright 2014 Hewlett-Packard Development Company, L.P.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import socket
+
+import fixtures
+
+from libra.tests.base import TestCase
+from libra.worker.drivers.haproxy.ubuntu_services import UbuntuServices
+
+
+class TestStatsSocketCheck(TestCase):
+    def setUp(self):
+        super(TestStatsSocketCheck, self).setUp()
+        self.dir = self.useFixture(fixtures.TempDir()).path
+        self.path = os.path.join(self.dir, 'haproxy-stats.socket')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        self.addCleanup(sock.close)
+        self.services = UbuntuServices()
+
+    def testOwnerOnly(self):
+        os.chmod(self.path, 0o600)
+        self.services._check_socket(self.path)
+        os.chmod(self.path, 0o660)
+        self.services._check_socket(self.path)
+
+    def testOpenToEveryone(self):
+        os.chmod(self.path, 0o666)
+        e = self.assertRaises(Exception, self.services._check_socket,
+                              self.path)
+        self.assertIn('open to every user, mode 666', e.message)
+
+    def testOtherOwner(self):
+        os.chmod(self.path, 0o600)
+        self.useFixture(fixtures.MonkeyPatch(
+            'os.geteuid', lambda: os.stat(self.path).st_uid + 1
+        ))
+        self.assertRaises(Exception, self.services._check_socket, self.path)
+
+    def testNotASocket(self):
+        path = os.path.join(self.dir, 'file')
+        open(path, 'w').close()
+        e = self.assertRaises(Exception, self.services._check_socket, path)
+        self.assertIn('is not a socket', e.message)
@@ -20,6 +20,8 @@ from libra import __version__ as libra_version
 from libra import __release__ as libra_release
 from libra.common.exc import DeletedStateError
 from libra.common.faults import BadRequest
+from libra.common import tracing
+from libra.common.json_gearman import codec_names
 from libra.openstack.common import log
 from libra.worker.drivers import base
 
@@ -36,6 +38,9 @@ class LBaaSController(object):
     RESPONSE_FIELD = 'hpcs_response'
     ERROR_FIELD = 'hpcs_error'
     LBLIST_FIELD = 'loadBalancers'
+    VERSION_FIELD = 'configVersion'
+    BASE_VERSION_FIELD = 'baseVersion'
+    TRACE_FIELD = tracing.TRACE_FIELD
     OBJ_STORE_TYPE_FIELD = 'hpcs_object_store_type'
     OBJ_STORE_BASEPATH_FIELD = 'hpcs_object_store_basepath'
     OBJ_STORE_ENDPOINT_FIELD = 'hpcs_object_store_endpoint'
@@ -48,8 +53,20 @@ class LBaaSController(object):
     def run(self):
         """
         Process the JSON message and return a JSON response.
-        """
 
+        The time taken is recorded against the trace ID in the message, if
+        it has one, which is always returned in the response.
+        """
+        trace_id = self.msg.get(self.TRACE_FIELD)
+        trace = tracing.Trace(trace_id, action=self.msg.get(self.ACTION_FIELD))
+        with trace.activate():
+            with trace.span('worker'):
+                response = self._run()
+        if trace_id is not None:
+            response[self.TRACE_FIELD] = trace_id
+        return response
+
+    def _run(self):
         if self.ACTION_FIELD not in self.msg:
             LOG.error("Missing `%s` value" % self.ACTION_FIELD)
             self.msg[self.RESPONSE_FIELD] = self.RESPONSE_FAILURE
@@ -60,6 +77,8 @@ class LBaaSController(object):
         try:
             if action == 'UPDATE':
                 return self._action_update()
+            elif action == 'PATCH':
+                return self._action_patch()
             elif action == 'SUSPEND':
                 return self._action_suspend()
             elif action == 'ENABLE':
@@ -177,10 +196,12 @@ class LBaaSController(object):
         Return service discovery information.
 
         This message type is currently used to report the Libra version,
-        which can be used to determine which messages are supported.
+        which can be used to determine which messages are supported, and
+        the message codecs this worker understands.
         """
         self.msg['version'] = libra_version
         self.msg['release'] = libra_release
+        self.msg['codecs'] = codec_names()
         self.msg[self.RESPONSE_FIELD] = self.RESPONSE_SUCCESS
         return self.msg
 
@@ -194,6 +215,9 @@ class LBaaSController(object):
         be modified, unless the change involves fields that are ignored.
         """
 
+        # The old configuration is gone whether or not this one works
+        self.driver.config_version = None
+
         try:
             self.driver.init()
         except NotImplementedError:
@@ -306,32 +330,11 @@ class LBaaSController(object):
                 return self.msg
 
             for lb_node in current_lb['nodes']:
-                port = None
-                address = None
-                node_id = None
-                weight = None
-                backup = False
-
-                if 'port' in lb_node:
-                    port = lb_node['port']
-                else:
-                    return BadRequest("Missing node 'port'").to_json()
-
-                if 'address' in lb_node:
-                    address = lb_node['address']
-                else:
-                    return BadRequest("Missing node 'address'").to_json()
-
-                if 'id' in lb_node and lb_node['id'] != '':
-                    node_id = lb_node['id']
-                else:
-                    return BadRequest("Missing node 'id'").to_json()
-
-                if 'weight' in lb_node:
-                    weight = lb_node['weight']
-
-                if 'backup' in lb_node and lb_node['backup'].lower() == 'true':
-                    backup = True
+                try:
+                    node_id, address, port, weight, backup = \
+                        self._node_values(lb_node)
+                except ValueError as e:
+                    return BadRequest(str(e)).to_json()
 
                 try:
                     self.driver.add_server(current_lb['protocol'],
@@ -375,6 +378,97 @@ class LBaaSController(object):
             self.msg[self.RESPONSE_FIELD] = self.RESPONSE_FAILURE
         else:
             LOG.info("Activated load balancer changes")
+            self.driver.config_version = self.msg.get(self.VERSION_FIELD)
+            self.msg[self.RESPONSE_FIELD] = self.RESPONSE_SUCCESS
+
+        return self.msg
+
+    def _node_values(self, lb_node):
+        """
+        Check a node from an UPDATE or PATCH message.
+
+        Returns the node ID, address, port, weight and backup flag, or raises
+        ValueError if a required value is missing.
+        """
+        if 'port' not in lb_node:
+            raise ValueError("Missing node 'port'")
+        if 'address' not in lb_node:
+            raise ValueError("Missing node 'address'")
+        if 'id' not in lb_node or lb_node['id'] == '':
+            raise ValueError("Missing node 'id'")
+
+        backup = False
+        if 'backup' in lb_node and lb_node['backup'].lower() == 'true':
+            backup = True
+
+        return (lb_node['id'], lb_node['address'], lb_node['port'],
+                lb_node.get('weight'), backup)
+
+    def _action_patch(self):
+        """
+        Apply node changes to the current configuration.
+
+        Only the nodes which have changed are sent, under 'nodes' if they
+        have been added or changed and as IDs under 'removed' if they have
+        been deleted. The message gives the configuration version it applies
+        to. If we are not running that version the PATCH fails and the API
+        server is expected to send a full UPDATE instead.
+        """
+        base_version = self.msg.get(self.BASE_VERSION_FIELD)
+        if base_version is None or \
+                base_version != self.driver.config_version:
+            error = "Configuration version is %s, not %s" % (
+                self.driver.config_version, base_version
+            )
+            LOG.info("PATCH rejected: %s" % error)
+            self.msg[self.ERROR_FIELD] = error
+            self.msg[self.RESPONSE_FIELD] = self.RESPONSE_FAILURE
+            return self.msg
+
+        if self.LBLIST_FIELD not in self.msg:
+            return BadRequest(
+                "Missing '%s' element" % self.LBLIST_FIELD
+            ).to_json()
+
+        # Until the changes are applied we can't say what version is running
+        self.driver.config_version = None
+
+        try:
+            for current_lb in self.msg[self.LBLIST_FIELD]:
+                if 'protocol' not in current_lb:
+                    return BadRequest(
+                        "Missing required 'protocol' value."
+                    ).to_json()
+                protocol = current_lb['protocol']
+
+                for node_id in current_lb.get('removed', []):
+                    self.driver.remove_server(protocol, node_id)
+
+                for lb_node in current_lb.get('nodes', []):
+                    try:
+                        node_id, address, port, weight, backup = \
+                            self._node_values(lb_node)
+                    except ValueError as e:
+                        return BadRequest(str(e)).to_json()
+                    enabled = lb_node.get('condition', self.NODE_OK).upper() \
+                        != self.NODE_ERR
+                    self.driver.set_server(protocol, node_id, address, port,
+                                           weight, backup, enabled)
+
+            self.driver.apply()
+        except NotImplementedError:
+            error = "Selected driver does not support PATCH action."
+            LOG.error(error)
+            self.msg[self.ERROR_FIELD] = error
+            self.msg[self.RESPONSE_FIELD] = self.RESPONSE_FAILURE
+        except Exception as e:
+            error = "PATCH failed: %s" % e
+            LOG.error("PATCH failed: %s, %s" % (e.__class__, e))
+            self.msg[self.ERROR_FIELD] = error
+            self.msg[self.RESPONSE_FIELD] = self.RESPONSE_FAILURE
+        else:
+            LOG.info("Applied load balancer node changes")
+            self.driver.config_version = self.msg.get(self.VERSION_FIELD)
             self.msg[self.RESPONSE_FIELD] = self.RESPONSE_SUCCESS
 
         return self.msg
@@ -40,6 +40,10 @@ class LoadBalancerDriver(object):
     ROUNDROBIN = 1
     LEASTCONN = 2
 
+    # Version of the running configuration, as given by the last UPDATE or
+    # PATCH message. None until the first UPDATE.
+    config_version = None
+
     def init(self):
         """ Allows the driver to do any initialization for a new config. """
         raise NotImplementedError()
@@ -52,6 +56,19 @@ class LoadBalancerDriver(object):
         """ Add a server for the protocol for which we will proxy. """
         raise NotImplementedError()
 
+    def set_server(self, protocol, node_id, host, port, weight, backup,
+                   enabled):
+        """
+        Add a server to the current configuration for the protocol, or
+        change it if it is already there. A disabled server is kept in the
+        configuration but is not sent any traffic.
+        """
+        raise NotImplementedError()
+
+    def remove_server(self, protocol, node_id):
+        """ Remove a server from the current configuration if present. """
+        raise NotImplementedError()
+
     def set_algorithm(self, protocol, algo):
         """ Set the algorithm used by the load balancer for this protocol. """
         raise NotImplementedError()
@@ -84,6 +101,13 @@ class LoadBalancerDriver(object):
         """ Create the load balancer. """
         raise NotImplementedError()
 
+    def apply(self):
+        """
+        Activate changes made by set_server() and remove_server() since the
+        last create() or apply(), without interrupting traffic if possible.
+        """
+        raise NotImplementedError()
+
     def suspend(self):
         """ Suspend the load balancer. """
         raise NotImplementedError()
@@ -19,10 +19,14 @@ import re
 from datetime import datetime
 from swiftclient import client as sc
 
+from libra.common import tracing
 from libra.openstack.common import importutils
+from libra.openstack.common import log
 from libra.worker.drivers.base import LoadBalancerDriver
 from libra.worker.drivers.haproxy.services_base import ServicesBase
 
+LOG = log.getLogger(__name__)
+
 
 class HAProxyDriver(LoadBalancerDriver):
 
@@ -39,6 +43,9 @@ class HAProxyDriver(LoadBalancerDriver):
 
     def _init_config(self):
         self._config = dict()
+        # Stats socket commands to apply changes, unless we have to reload
+        self._commands = []
+        self._reload = False
 
     def _bind(self, protocol, address, port):
         self._config[protocol]['bind_address'] = address
@@ -58,15 +65,19 @@ class HAProxyDriver(LoadBalancerDriver):
         output.append('    user haproxy')
         output.append('    group haproxy')
 
-        # group can be None, but user cannot
+        # group can be None, but user cannot.  The socket is at admin level
+        # so weights and servers can be changed without a reload, which lets
+        # anyone able to connect to it change or stop any backend, so only
+        # the worker's user (and group) may.
         if self.group is None:
             output.append(
-                '    stats socket %s user %s mode operator' %
+                '    stats socket %s user %s mode 600 level admin' %
                 (stats_socket, self.user)
             )
         else:
             output.append(
-                '    stats socket %s user %s group %s mode operator' %
+                '    stats socket %s user %s group %s mode 660'
+                ' level admin' %
                 (stats_socket, self.user, self.group)
             )
 
@@ -134,17 +145,18 @@ class HAProxyDriver(LoadBalancerDriver):
                               mon['delay'], mon['attempts'], mon['attempts'])
 
                 for (node_id, addr, port, wt, bkup) in protocfg['servers']:
+                    options = self._server_options(proto, node_id, monitor)
                     if bkup:
                         output.append(
                             '    server id-%s %s:%s backup cookie id-%s'
                             ' weight %d %s' %
-                            (node_id, addr, port, node_id, wt, monitor)
+                            (node_id, addr, port, node_id, wt, options)
                         )
                     else:
                         output.append(
                             '    server id-%s %s:%s cookie id-%s'
                             ' weight %d %s' %
-                            (node_id, addr, port, node_id, wt, monitor)
+                            (node_id, addr, port, node_id, wt, options)
                         )
 
             # TCP or Galera specific options for the backend
@@ -180,19 +192,45 @@ class HAProxyDriver(LoadBalancerDriver):
                               mon['delay'], mon['attempts'], mon['attempts'])
 
                 for (node_id, addr, port, wt, bkup) in protocfg['servers']:
+                    options = self._server_options(proto, node_id, monitor)
                     if bkup:
                         output.append(
                             '    server id-%s %s:%s backup weight %d %s' %
-                            (node_id, addr, port, wt, monitor)
+                            (node_id, addr, port, wt, options)
                         )
                     else:
                         output.append(
                             '    server id-%s %s:%s weight %d %s' %
-                            (node_id, addr, port, wt, monitor)
+                            (node_id, addr, port, wt, options)
                         )
 
         return '\n'.join(output) + '\n'
 
+    def _server_options(self, proto, node_id, monitor):
+        if node_id in self._config[proto].get('disabled', ()):
+            return monitor + ' disabled'
+        return monitor
+
+    def _server_name(self, proto, node_id):
+        """ Backend/server name of a server, for stats socket commands. """
+        if proto == 'galera':
+            proto = 'tcp'
+        return '%s-servers/id-%s' % (proto, node_id)
+
+    def _check_weight(self, weight):
+        if weight is None:
+            weight = 1
+
+        try:
+            weight = int(weight)
+        except ValueError:
+            raise Exception("Non-integer 'weight' value: '%s'" % weight)
+
+        if weight > 256:
+            raise Exception("Server 'weight' %d exceeds max of 256" % weight)
+
+        return weight
+
     def _archive_swift(self, endpoint, token, basepath, lbid, proto):
         """
         Archive HAProxy log files into swift.
@@ -304,16 +342,7 @@ class HAProxyDriver(LoadBalancerDriver):
     def add_server(self, protocol, node_id, host, port,
                    weight=1, backup=False):
         proto = protocol.lower()
-        if weight is None:
-            weight = 1
-
-        try:
-            weight = int(weight)
-        except ValueError:
-            raise Exception("Non-integer 'weight' value: '%s'" % weight)
-
-        if weight > 256:
-            raise Exception("Server 'weight' %d exceeds max of 256" % weight)
+        weight = self._check_weight(weight)
 
         if 'servers' not in self._config[proto]:
             self._config[proto]['servers'] = []
@@ -327,6 +356,56 @@ class HAProxyDriver(LoadBalancerDriver):
         self._config[proto]['servers'].append((node_id, host, port,
                                                weight, backup))
 
+    def set_server(self, protocol, node_id, host, port, weight=1,
+                   backup=False, enabled=True):
+        """
+        Weight changes and enabling or disabling an existing server are
+        done through the stats socket. Anything else needs a reload.
+        """
+        proto = protocol.lower()
+        if proto not in self._config:
+            raise Exception("Protocol '%s' is not defined." % protocol)
+        weight = self._check_weight(weight)
+        servers = self._config[proto].setdefault('servers', [])
+        disabled = self._config[proto].setdefault('disabled', set())
+        name = self._server_name(proto, node_id)
+
+        for index, (n, h, p, w, b) in enumerate(servers):
+            if n != node_id:
+                continue
+            if (h, p, b) != (host, port, backup):
+                # Moved, replace it
+                del servers[index]
+                disabled.discard(node_id)
+                break
+            servers[index] = (n, h, p, weight, b)
+            if w != weight:
+                self._commands.append('set weight %s %d' % (name, weight))
+            if enabled and node_id in disabled:
+                disabled.discard(node_id)
+                self._commands.append('enable server %s' % name)
+            elif not enabled and node_id not in disabled:
+                disabled.add(node_id)
+                self._commands.append('disable server %s' % name)
+            return
+
+        self.add_server(protocol, node_id, host, port, weight, backup)
+        if not enabled:
+            disabled.add(node_id)
+        self._reload = True
+
+    def remove_server(self, protocol, node_id):
+        proto = protocol.lower()
+        if proto not in self._config:
+            raise Exception("Protocol '%s' is not defined." % protocol)
+        servers = self._config[proto].get('servers', [])
+        for index, server in enumerate(servers):
+            if server[0] == node_id:
+                del servers[index]
+                self._config[proto].get('disabled', set()).discard(node_id)
+                self._reload = True
+                return
+
     def set_algorithm(self, protocol, algo):
         proto = protocol.lower()
         if algo == self.ROUNDROBIN:
@@ -379,8 +458,32 @@ class HAProxyDriver(LoadBalancerDriver):
                                           'path': path}
 
     def create(self):
-        self.ossvc.write_config(self._config_to_string())
-        self.ossvc.service_reload()
+        with tracing.span('config_write'):
+            self.ossvc.write_config(self._config_to_string())
+        with tracing.span('reload'):
+            self.ossvc.service_reload()
+        self._commands = []
+        self._reload = False
+
+    def apply(self):
+        # The config file is always written so a later restart or reload
+        # picks up the changes.
+        with tracing.span('config_write'):
+            self.ossvc.write_config(self._config_to_string())
+        if not self._reload and self._commands:
+            try:
+                with tracing.span('runtime'):
+                    self.ossvc.send_commands(self._commands)
+            except Exception as e:
+                # The config file is right, fall back to reloading it
+                LOG.warning('Reloading HAProxy, stats socket commands '
+                            'failed: %s' % e)
+                self._reload = True
+        if self._reload:
+            with tracing.span('reload'):
+                self.ossvc.service_reload()
+        self._commands = []
+        self._reload = False
 
     def suspend(self):
         self.ossvc.service_stop()
@@ -48,6 +48,18 @@ class HAProxyQuery(object):
 
         return output.rstrip()
 
+    def command(self, command):
+        """
+        Run a command that changes HAProxy's state, such as 'set weight'.
+
+        These print nothing when they work, so any output is raised as an
+        Exception.
+        """
+        output = self._query(command)
+        if output:
+            raise Exception("HAProxy '%s' command failed: %s" %
+                            (command, output))
+
     def show_info(self):
         """ Get and parse output from 'show info' command. """
         results = self._query('show info')
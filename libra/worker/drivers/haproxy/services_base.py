@@ -42,6 +42,10 @@ class ServicesBase:
         """ Reload the HAProxy config file. """
         raise NotImplementedError()
 
+    def send_commands(self, commands):
+        """ Send a list of commands to HAProxy over the stats socket. """
+        raise NotImplementedError()
+
     def write_config(self, config_str):
         """ Write the HAProxy configuration file. """
         raise NotImplementedError()
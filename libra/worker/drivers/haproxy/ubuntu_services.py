@@ -14,11 +14,13 @@
 
 import datetime
 import os
+import stat
 import subprocess
 
 from oslo.config import cfg
 
 from libra.common import exc
+from libra.common import tracing
 from libra.openstack.common import log
 from libra.worker.drivers.haproxy import query
 from libra.worker.drivers.haproxy import services_base
@@ -179,8 +181,9 @@ class UbuntuServices(services_base.ServicesBase):
         # Validate the config
         check_cmd = "/usr/sbin/haproxy -f %s -c" % tmpfile
         try:
-            subprocess.check_output(check_cmd.split(),
-                                    stderr=subprocess.STDOUT)
+            with tracing.span('validate'):
+                subprocess.check_output(check_cmd.split(),
+                                        stderr=subprocess.STDOUT)
         except subprocess.CalledProcessError as e:
             raise Exception("Configuration file is invalid: %s\n%s" %
                             (e, e.output.rstrip('\n')))
@@ -227,6 +230,33 @@ class UbuntuServices(services_base.ServicesBase):
         q = query.HAProxyQuery('/var/run/haproxy-stats.socket')
         return q.get_server_status(protocol)
 
+    def _check_socket(self, socket_file):
+        """
+        The stats socket is at admin level, so refuse to use it for
+        commands unless it belongs to this user and other users cannot
+        connect to it.  The driver reloads HAProxy instead.
+        """
+        info = os.stat(socket_file)
+        if not stat.S_ISSOCK(info.st_mode):
+            raise Exception("%s is not a socket." % socket_file)
+        if info.st_uid != os.geteuid():
+            raise Exception("%s is owned by uid %d, not the worker." %
+                            (socket_file, info.st_uid))
+        if info.st_mode & stat.S_IRWXO:
+            raise Exception("%s is open to every user, mode %o." %
+                            (socket_file, stat.S_IMODE(info.st_mode)))
+
+    def send_commands(self, commands):
+        """ Change the running HAProxy without reloading its config. """
+        if not os.path.exists(self._haproxy_pid):
+            raise Exception("HAProxy is not running.")
+
+        socket_file = '/var/run/haproxy-stats.socket'
+        self._check_socket(socket_file)
+        q = query.HAProxyQuery(socket_file)
+        for command in commands:
+            q.command(command)
+
     def get_statistics(self):
         if not os.path.exists(self._config_file):
             raise exc.DeletedStateError("Load balancer is deleted.")
@@ -19,7 +19,7 @@ import time
 
 from oslo.config import cfg
 
-from libra.common.json_gearman import JSONGearmanWorker
+from libra.common.json_gearman import JSONGearmanWorker, encode
 from libra.worker.controller import LBaaSController
 from libra.openstack.common import log
 
@@ -58,6 +58,10 @@ def handler(worker, job):
         copy[LBaaSController.OBJ_STORE_TOKEN_FIELD] = "*****"
 
     LOG.debug("Return JSON message: %s" % json.dumps(copy))
+    # Reply with the codec the request used, the client understands that
+    codec = getattr(job.data, 'codec', 'json')
+    if codec != 'json':
+        return encode(copy, codec)
     return copy
 
 